@@ -4,12 +4,77 @@
 邮箱账号管理标签页
 """
 
+import threading
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                             QLabel, QLineEdit, QTableWidget, QTableWidgetItem,
                             QMessageBox, QGroupBox, QFormLayout, QSpinBox,
-                            QHeaderView)
-from PyQt5.QtCore import Qt
+                            QHeaderView, QFileDialog, QProgressDialog, QDialog,
+                            QDialogButtonBox, QCheckBox)
+from PyQt5.QtCore import Qt, QTimer
 from email_sender import EmailSender
+from send_ledger import get_default_ledger, format_usage, SendLedger
+from account_verifier import AccountVerifier, read_accounts_file, write_accounts_file
+from workers import run_in_background
+
+
+class SendLimitDialog(QDialog):
+    """设置账号发送上限对话框"""
+
+    def __init__(self, email: str, account: dict, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"发送上限 - {email}")
+        self.setModal(True)
+        self.init_ui(email, account)
+
+    def init_ui(self, email: str, account: dict):
+        """初始化UI"""
+        layout = QVBoxLayout(self)
+        form_layout = QFormLayout()
+
+        defaults = SendLedger.provider_limits(email)
+        default_text = "、".join(
+            f"{name} {value if value else '不限'}"
+            for name, value in (("每小时", defaults["hourly"]), ("每天", defaults["daily"]))
+        )
+        self.default_checkbox = QCheckBox(f"使用服务商默认值({default_text})")
+        self.default_checkbox.setChecked("hourly_limit" not in account and "daily_limit" not in account)
+        self.default_checkbox.toggled.connect(self.on_default_toggled)
+        form_layout.addRow(self.default_checkbox)
+
+        self.hourly_input = self._limit_spin(account.get("hourly_limit", defaults["hourly"]))
+        form_layout.addRow("每小时上限:", self.hourly_input)
+        self.daily_input = self._limit_spin(account.get("daily_limit", defaults["daily"]))
+        form_layout.addRow("每天上限:", self.daily_input)
+        layout.addLayout(form_layout)
+
+        tip = QLabel("设置为0表示不限制(只统计发送数)")
+        tip.setStyleSheet("color: #7f8c8d;")
+        layout.addWidget(tip)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+        self.on_default_toggled(self.default_checkbox.isChecked())
+
+    @staticmethod
+    def _limit_spin(value) -> QSpinBox:
+        spin = QSpinBox()
+        spin.setRange(0, 1000000)
+        spin.setSpecialValueText("不限")
+        spin.setValue(value or 0)
+        return spin
+
+    def on_default_toggled(self, checked: bool):
+        """使用默认值时不能编辑上限"""
+        self.hourly_input.setEnabled(not checked)
+        self.daily_input.setEnabled(not checked)
+
+    def get_limits(self) -> tuple:
+        """(每小时上限, 每天上限), 使用默认值时为 (None, None), 0表示不限制"""
+        if self.default_checkbox.isChecked():
+            return None, None
+        return self.hourly_input.value(), self.daily_input.value()
 
 
 class AccountTab(QWidget):
@@ -19,9 +84,16 @@ class AccountTab(QWidget):
         super().__init__()
         self.config_manager = config_manager
         self.main_window = main_window
+        self.verify_worker = None
+        self.test_worker = None
         self.init_ui()
         self.load_accounts()
 
+        # 定期刷新剩余额度(其他标签页或后台服务发送后会变化)
+        self.quota_timer = QTimer(self)
+        self.quota_timer.timeout.connect(self.refresh_quota)
+        self.quota_timer.start(30000)
+
     def init_ui(self):
         """初始化UI"""
         layout = QVBoxLayout(self)
@@ -129,10 +201,24 @@ class AccountTab(QWidget):
         """)
         list_layout = QVBoxLayout()
 
+        # 批量导入导出
+        bulk_layout = QHBoxLayout()
+        self.import_btn = QPushButton("批量导入")
+        self.import_btn.setToolTip("从CSV/JSON文件导入账号,导入前并发验证SMTP和IMAP登录\n"
+                                   "CSV表头: email,password,imap_password,smtp_server,smtp_port,imap_server,imap_port")
+        self.import_btn.clicked.connect(self.import_accounts)
+        bulk_layout.addWidget(self.import_btn)
+
+        self.export_btn = QPushButton("导出账号")
+        self.export_btn.clicked.connect(self.export_accounts)
+        bulk_layout.addWidget(self.export_btn)
+        bulk_layout.addStretch()
+        list_layout.addLayout(bulk_layout)
+
         # 账号表格
         self.account_table = QTableWidget()
-        self.account_table.setColumnCount(4)
-        self.account_table.setHorizontalHeaderLabels(["邮箱地址", "SMTP服务器", "端口", "操作"])
+        self.account_table.setColumnCount(6)
+        self.account_table.setHorizontalHeaderLabels(["邮箱地址", "SMTP服务器", "端口", "发送上限", "剩余额度", "操作"])
         self.account_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.account_table.setStyleSheet("""
             QTableWidget {
@@ -171,7 +257,13 @@ class AccountTab(QWidget):
         layout.addWidget(help_label)
 
     def test_connection(self):
-        """测试邮箱连接"""
+        """测试邮箱连接(后台执行,测试中再次点击取消)"""
+        if self.test_worker is not None:
+            self.test_worker.cancel()
+            self.on_test_done()
+            self.main_window.update_status("已取消连接测试")
+            return
+
         email = self.email_input.text().strip()
         password = self.password_input.text().strip()
         smtp_server = self.smtp_server_input.text().strip()
@@ -182,24 +274,35 @@ class AccountTab(QWidget):
             return
 
         self.main_window.update_status("正在测试连接...")
-        self.test_btn.setEnabled(False)
+        self.test_btn.setText("取消测试")
+
+        sender = EmailSender(email, password, smtp_server, smtp_port)
+        self.test_worker = run_in_background(
+            sender.test_connection,
+            on_result=self.on_test_result,
+            on_error=self.on_test_error,
+            on_finished=self.on_test_done
+        )
 
-        try:
-            sender = EmailSender(email, password, smtp_server, smtp_port)
-            success, message = sender.test_connection()
+    def on_test_result(self, result):
+        """连接测试结果"""
+        success, message = result
+        if success:
+            QMessageBox.information(self, "成功", "连接测试成功！\n" + message)
+            self.main_window.update_status("连接测试成功")
+        else:
+            QMessageBox.critical(self, "失败", "连接测试失败！\n" + message)
+            self.main_window.update_status("连接测试失败")
 
-            if success:
-                QMessageBox.information(self, "成功", "连接测试成功！\n" + message)
-                self.main_window.update_status("连接测试成功")
-            else:
-                QMessageBox.critical(self, "失败", "连接测试失败！\n" + message)
-                self.main_window.update_status("连接测试失败")
+    def on_test_error(self, error):
+        """连接测试出错"""
+        QMessageBox.critical(self, "错误", f"测试连接时出错:\n{error}")
+        self.main_window.update_status("测试连接出错")
 
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"测试连接时出错:\n{str(e)}")
-            self.main_window.update_status("测试连接出错")
-        finally:
-            self.test_btn.setEnabled(True)
+    def on_test_done(self):
+        """连接测试结束(或取消)"""
+        self.test_worker = None
+        self.test_btn.setText("测试连接")
 
     def add_account(self):
         """添加邮箱账号"""
@@ -231,6 +334,131 @@ class AccountTab(QWidget):
             QMessageBox.warning(self, "失败", f"账号 {email} 已存在或添加失败")
             self.main_window.update_status("添加账号失败")
 
+    def import_accounts(self):
+        """批量导入账号(先并发验证连接)"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择账号文件", "", "账号文件 (*.csv *.json);;所有文件 (*)"
+        )
+        if not file_path:
+            return
+
+        try:
+            accounts = read_accounts_file(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"读取账号文件失败:\n{str(e)}")
+            return
+
+        existing = {acc["email"] for acc in self.config_manager.get_email_accounts()}
+        accounts = [acc for acc in accounts if acc["email"] not in existing]
+        if not accounts:
+            QMessageBox.information(self, "提示", "文件中没有新的账号(缺少邮箱/授权码或均已存在)")
+            return
+
+        self.import_btn.setEnabled(False)
+        self.progress_dialog = QProgressDialog(f"正在验证 {len(accounts)} 个账号...", "取消",
+                                               0, len(accounts), self)
+        self.progress_dialog.setWindowTitle("批量导入")
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setMinimumDuration(0)
+
+        # 取消后不再开始新的验证,已验证的账号仍然可以导入
+        stop_event = threading.Event()
+        self.progress_dialog.canceled.connect(stop_event.set)
+        self.verify_worker = run_in_background(
+            AccountVerifier().verify_all, accounts,
+            cancel_event=stop_event,
+            on_result=lambda results: self.on_verify_finished(accounts, results),
+            on_error=self.on_verify_error,
+            on_progress=self.on_verify_progress,
+            with_progress=True
+        )
+        self.main_window.update_status(f"正在验证 {len(accounts)} 个账号...")
+
+    def on_verify_progress(self, progress):
+        """验证进度"""
+        done, total, result = progress
+        status = "通过" if result["ok"] else "失败"
+        self.progress_dialog.setLabelText(f"已验证 {done}/{total}: {result['email']} {status}")
+        self.progress_dialog.setValue(done)
+
+    def on_verify_error(self, error):
+        """验证出错"""
+        self.verify_worker = None
+        self.progress_dialog.close()
+        self.import_btn.setEnabled(True)
+        QMessageBox.critical(self, "错误", f"验证账号时出错:\n{error}")
+
+    def on_verify_finished(self, accounts, results):
+        """验证完成,批量写入配置"""
+        self.verify_worker = None
+        self.progress_dialog.close()
+        self.import_btn.setEnabled(True)
+
+        passed = [acc for acc, res in zip(accounts, results) if res and res["ok"]]
+        failed = [(acc, res) for acc, res in zip(accounts, results) if res and not res["ok"]]
+        skipped = sum(1 for res in results if res is None)
+
+        to_import = list(passed)
+        if failed:
+            details = "\n".join(
+                f"{acc['email']}: " + ("SMTP " + res["smtp_message"] if not res["smtp_ok"]
+                                      else "IMAP " + res["imap_message"].splitlines()[0])
+                for acc, res in failed[:10]
+            )
+            if len(failed) > 10:
+                details += f"\n... 共 {len(failed)} 个"
+            reply = QMessageBox.question(
+                self, "部分账号验证失败",
+                f"验证通过 {len(passed)} 个,失败 {len(failed)} 个:\n{details}\n\n是否同时导入验证失败的账号？",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply == QMessageBox.Yes:
+                to_import += [acc for acc, _ in failed]
+
+        added, existed = self.config_manager.add_email_accounts(to_import)
+        self.load_accounts()
+        if added:
+            self.main_window.refresh_send_email_accounts()
+            self.main_window.refresh_schedule_accounts()
+            self.main_window.refresh_auto_reply_accounts()
+
+        message = f"已导入 {len(added)} 个账号"
+        if existed:
+            message += f",{len(existed)} 个已存在"
+        if skipped:
+            message += f",{skipped} 个因取消未验证"
+        QMessageBox.information(self, "批量导入", message)
+        self.main_window.update_status(message)
+
+    def export_accounts(self):
+        """导出账号"""
+        accounts = self.config_manager.get_email_accounts()
+        if not accounts:
+            QMessageBox.information(self, "提示", "没有可导出的账号")
+            return
+
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出账号", "accounts.csv", "CSV文件 (*.csv);;JSON文件 (*.json)"
+        )
+        if not file_path:
+            return
+
+        reply = QMessageBox.question(
+            self, "导出授权码",
+            "是否导出授权码？\n授权码将以明文保存在导出文件中,请妥善保管。",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        include_passwords = reply == QMessageBox.Yes
+
+        try:
+            if include_passwords:
+                accounts = [self.config_manager.get_account_credentials(acc["email"]) for acc in accounts]
+            write_accounts_file(file_path, accounts, include_passwords)
+            QMessageBox.information(self, "成功", f"已导出 {len(accounts)} 个账号到:\n{file_path}")
+            self.main_window.update_status(f"已导出 {len(accounts)} 个账号")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"导出账号失败:\n{str(e)}")
+
     def load_accounts(self):
         """加载账号列表"""
         accounts = self.config_manager.get_email_accounts()
@@ -246,7 +474,15 @@ class AccountTab(QWidget):
             # 端口
             self.account_table.setItem(i, 2, QTableWidgetItem(str(account["smtp_port"])))
 
-            # 删除按钮
+            # 操作按钮
+            actions = QWidget()
+            actions_layout = QHBoxLayout(actions)
+            actions_layout.setContentsMargins(0, 0, 0, 0)
+
+            limit_btn = QPushButton("发送上限")
+            limit_btn.clicked.connect(lambda checked, email=account["email"]: self.edit_send_limits(email))
+            actions_layout.addWidget(limit_btn)
+
             delete_btn = QPushButton("删除")
             delete_btn.setStyleSheet("""
                 QPushButton {
@@ -260,7 +496,52 @@ class AccountTab(QWidget):
                 }
             """)
             delete_btn.clicked.connect(lambda checked, email=account["email"]: self.delete_account(email))
-            self.account_table.setCellWidget(i, 3, delete_btn)
+            actions_layout.addWidget(delete_btn)
+            self.account_table.setCellWidget(i, 5, actions)
+
+        self.refresh_quota()
+
+    def refresh_quota(self):
+        """刷新各账号的发送上限和剩余额度"""
+        try:
+            ledger = get_default_ledger()
+        except Exception as e:
+            print(f"读取发送额度失败: {e}")
+            return
+        for i in range(self.account_table.rowCount()):
+            email_item = self.account_table.item(i, 0)
+            if email_item is None:
+                continue
+            try:
+                usage = ledger.get_usage(email_item.text())
+            except Exception as e:
+                print(f"读取发送额度失败: {e}")
+                return
+
+            limits = [f"{value}/{name}" for name, value in
+                      (("时", usage["hourly_limit"]), ("天", usage["daily_limit"])) if value is not None]
+            self.account_table.setItem(i, 3, QTableWidgetItem(", ".join(limits) or "不限"))
+
+            remaining = usage["remaining"]
+            item = QTableWidgetItem("不限" if remaining is None else str(remaining))
+            item.setToolTip(f"本小时已发送 {format_usage(usage['hourly_sent'], usage['hourly_limit'])}\n"
+                            f"今日已发送 {format_usage(usage['daily_sent'], usage['daily_limit'])}")
+            if remaining == 0:
+                item.setForeground(Qt.red)
+            self.account_table.setItem(i, 4, item)
+
+    def edit_send_limits(self, email):
+        """设置账号的发送上限(保存到账号配置)"""
+        account = next((acc for acc in self.config_manager.get_email_accounts() if acc["email"] == email), None)
+        if account is None:
+            return
+        dialog = SendLimitDialog(email, account, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        hourly, daily = dialog.get_limits()
+        if self.config_manager.set_send_limits(email, hourly, daily):
+            self.refresh_quota()
+            self.main_window.update_status(f"账号 {email} 的发送上限已更新")
 
     def delete_account(self, email):
         """删除账号"""
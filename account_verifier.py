@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+账号批量导入导出和连接验证模块
+从CSV/JSON文件读取账号,并发验证SMTP和IMAP登录(按服务器限制并发数)
+"""
+
+import csv
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional
+
+from email_sender import EmailSender
+from auto_reply import AutoReply
+
+
+# 导入导出文件的字段(CSV表头)
+ACCOUNT_FIELDS = ["email", "password", "imap_password", "smtp_server", "smtp_port",
+                  "imap_server", "imap_port"]
+
+DEFAULT_ACCOUNT = {
+    "smtp_server": "smtp.163.com",
+    "smtp_port": 465,
+    "imap_server": "imap.163.com",
+    "imap_port": 993
+}
+
+
+def _normalize_account(row: Dict) -> Optional[Dict]:
+    """整理导入的账号字段,缺少邮箱或授权码时返回None"""
+    email = str(row.get("email") or "").strip()
+    password = str(row.get("password") or "").strip()
+    if not email or not password:
+        return None
+
+    account = {"email": email, "password": password}
+    imap_password = str(row.get("imap_password") or "").strip()
+    account["imap_password"] = imap_password or password
+    for key, default in DEFAULT_ACCOUNT.items():
+        value = row.get(key)
+        if value in (None, ""):
+            value = default
+        account[key] = int(value) if key.endswith("_port") else str(value).strip()
+    return account
+
+
+def read_accounts_file(file_path: str) -> List[Dict]:
+    """
+    读取账号文件
+
+    支持:
+    - CSV: 表头包含 email,password (其余字段可选)
+    - JSON: 账号列表,或包含 email_accounts 列表的对象
+
+    Returns:
+        账号列表(重复的邮箱只保留第一个)
+    """
+    if file_path.lower().endswith(".json"):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rows = data.get("email_accounts", []) if isinstance(data, dict) else data
+    else:
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    accounts = []
+    seen = set()
+    for row in rows:
+        account = _normalize_account(row)
+        if account is None or account["email"] in seen:
+            continue
+        seen.add(account["email"])
+        accounts.append(account)
+    return accounts
+
+
+def write_accounts_file(file_path: str, accounts: List[Dict], include_passwords: bool = False):
+    """
+    导出账号文件(CSV或JSON,按扩展名决定)
+
+    Args:
+        accounts: 账号列表(password/imap_password 为明文)
+        include_passwords: 是否导出授权码(明文),否则授权码字段留空
+    """
+    rows = []
+    for account in accounts:
+        row = {field: account.get(field, "") for field in ACCOUNT_FIELDS}
+        if not include_passwords:
+            row["password"] = ""
+            row["imap_password"] = ""
+        rows.append(row)
+
+    if file_path.lower().endswith(".json"):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({"email_accounts": rows}, f, ensure_ascii=False, indent=2)
+    else:
+        with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=ACCOUNT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class AccountVerifier:
+    """并发验证账号的SMTP和IMAP登录"""
+
+    def __init__(self, max_workers: int = 16, per_host_limit: int = 4):
+        """
+        初始化验证器
+
+        Args:
+            max_workers: 最大并发验证数
+            per_host_limit: 同一服务器的最大并发连接数(避免被服务器限流)
+        """
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _host_semaphore(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.Semaphore(self.per_host_limit)
+            return self._host_semaphores[host]
+
+    def verify_smtp(self, account: Dict) -> tuple:
+        """验证SMTP登录,返回 (是否成功, 消息)"""
+        with self._host_semaphore(account["smtp_server"]):
+            sender = EmailSender(account["email"], account["password"],
+                                 account["smtp_server"], account["smtp_port"])
+            return sender.test_connection()
+
+    def verify_imap(self, account: Dict) -> tuple:
+        """验证IMAP登录,返回 (是否成功, 消息)"""
+        with self._host_semaphore(account["imap_server"]):
+            auto_reply = AutoReply(account["email"], account["imap_password"],
+                                   account["imap_server"], account["imap_port"], None)
+            return auto_reply.test_connection()
+
+    def verify_account(self, account: Dict) -> Dict:
+        """验证单个账号"""
+        smtp_ok, smtp_message = self.verify_smtp(account)
+        imap_ok, imap_message = self.verify_imap(account)
+        return {
+            "email": account["email"],
+            "smtp_ok": smtp_ok,
+            "smtp_message": smtp_message,
+            "imap_ok": imap_ok,
+            "imap_message": imap_message,
+            "ok": smtp_ok and imap_ok
+        }
+
+    def verify_all(self, accounts: List[Dict],
+                   progress_callback: Callable[[int, int, Dict], None] = None,
+                   cancel_event: threading.Event = None) -> List[Dict]:
+        """
+        并发验证所有账号
+
+        Args:
+            accounts: 账号列表
+            progress_callback: 每验证完一个账号调用 (已完成数, 总数, 结果)
+            cancel_event: 设置后不再开始新的验证
+
+        Returns:
+            验证结果列表(与accounts顺序一致,取消后未验证的账号结果为None)
+        """
+        results = [None] * len(accounts)
+        if not accounts:
+            return results
+
+        def run(account):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            return self.verify_account(account)
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(accounts))) as executor:
+            futures = {executor.submit(run, account): i for i, account in enumerate(accounts)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"email": accounts[index]["email"], "smtp_ok": False,
+                              "smtp_message": f"验证出错: {e}", "imap_ok": False,
+                              "imap_message": "", "ok": False}
+                results[index] = result
+                done += 1
+                if result is not None and progress_callback:
+                    progress_callback(done, len(accounts), result)
+        return results
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("账号导入验证模块加载成功")
@@ -13,6 +13,8 @@ import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import threading
+from email_sender import EmailSender
+from send_ledger import QUOTA_ERROR
 
 
 class AutoReply:
@@ -200,6 +202,11 @@ class AutoReply:
                 is_html=False
             )
 
+            # 超出发送额度时不标记为已回复,下次检查时再回复
+            for item in result['failed']:
+                if str(item.get('error', '')).startswith(QUOTA_ERROR):
+                    self.log(f"{item['error']},稍后再回复 {to_email}")
+
             return len(result['success']) > 0
 
         except Exception as e:
@@ -340,6 +347,53 @@ class AutoReplyManager:
             return self.auto_replies[email_address].is_active()
         return False
 
+    def get_active_emails(self) -> List[str]:
+        """获取正在运行自动回复的邮箱列表"""
+        return [email for email, auto_reply in self.auto_replies.items() if auto_reply.is_active()]
+
+    def start_from_config(self, config_manager, log_callback=None) -> bool:
+        """
+        按配置恢复自动回复(配置中已启用并记录了邮箱时)
+
+        Args:
+            config_manager: 配置管理器
+            log_callback: 日志回调函数
+
+        Returns:
+            是否已启动
+        """
+        config = config_manager.get_auto_reply_config()
+        email_address = config.get("email")
+        if not config.get("enabled") or not email_address:
+            return False
+
+        credentials = config_manager.get_account_credentials(email_address)
+        if not credentials:
+            print(f"自动回复邮箱 {email_address} 未配置")
+            return False
+
+        sender = EmailSender(
+            email=credentials["email"],
+            password=credentials["password"],
+            smtp_server=credentials["smtp_server"],
+            smtp_port=credentials["smtp_port"]
+        )
+        auto_reply = AutoReply(
+            email_address=credentials["email"],
+            password=credentials.get("imap_password", credentials["password"]),
+            imap_server=credentials["imap_server"],
+            imap_port=credentials["imap_port"],
+            smtp_sender=sender,
+            log_callback=log_callback
+        )
+
+        self.add_auto_reply(email_address, auto_reply)
+        return self.start_auto_reply(
+            email_address,
+            config.get("reply_content", ""),
+            config.get("check_interval", 60)
+        )
+
 
 if __name__ == "__main__":
     # 测试代码
@@ -11,6 +11,8 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
 from PyQt5.QtCore import Qt
 from email_sender import EmailSender
 from auto_reply import AutoReply
+from headless import read_daemon_status
+from workers import run_in_background
 
 
 class AutoReplyTab(QWidget):
@@ -21,6 +23,8 @@ class AutoReplyTab(QWidget):
         self.config_manager = config_manager
         self.auto_reply_manager = auto_reply_manager
         self.main_window = main_window
+        self.test_worker = None
+        self.start_worker = None
         self.init_ui()
         self.load_auto_reply_status()
 
@@ -266,7 +270,13 @@ class AutoReplyTab(QWidget):
         self.reply_content_input.setPlainText(config.get("reply_content", ""))
 
     def test_imap_connection(self):
-        """测试IMAP连接"""
+        """测试IMAP连接(后台执行,测试中再次点击取消)"""
+        if self.test_worker is not None:
+            self.test_worker.cancel()
+            self.on_test_done()
+            self.main_window.update_status("已取消IMAP连接测试")
+            return
+
         email = self.account_combo.currentText()
         if not email:
             QMessageBox.warning(self, "警告", "请先选择邮箱账号")
@@ -279,33 +289,43 @@ class AutoReplyTab(QWidget):
             return
 
         self.main_window.update_status("正在测试IMAP连接...")
-        self.test_imap_btn.setEnabled(False)
+        self.test_imap_btn.setText("取消测试")
+
+        # 创建自动回复实例用于测试
+        auto_reply = AutoReply(
+            email_address=credentials["email"],
+            password=credentials.get("imap_password", credentials["password"]),
+            imap_server=credentials["imap_server"],
+            imap_port=credentials["imap_port"],
+            smtp_sender=None
+        )
 
-        try:
-            # 创建自动回复实例用于测试
-            auto_reply = AutoReply(
-                email_address=credentials["email"],
-                password=credentials.get("imap_password", credentials["password"]),
-                imap_server=credentials["imap_server"],
-                imap_port=credentials["imap_port"],
-                smtp_sender=None
-            )
+        self.test_worker = run_in_background(
+            auto_reply.test_connection,
+            on_result=self.on_test_result,
+            on_error=self.on_test_error,
+            on_finished=self.on_test_done
+        )
 
-            # 测试连接
-            success, message = auto_reply.test_connection()
+    def on_test_result(self, result):
+        """IMAP连接测试结果"""
+        success, message = result
+        if success:
+            QMessageBox.information(self, "成功", "IMAP连接测试成功！\n" + message)
+            self.main_window.update_status("IMAP连接测试成功")
+        else:
+            QMessageBox.critical(self, "失败", "IMAP连接测试失败！\n" + message)
+            self.main_window.update_status("IMAP连接测试失败")
 
-            if success:
-                QMessageBox.information(self, "成功", "IMAP连接测试成功！\n" + message)
-                self.main_window.update_status("IMAP连接测试成功")
-            else:
-                QMessageBox.critical(self, "失败", "IMAP连接测试失败！\n" + message)
-                self.main_window.update_status("IMAP连接测试失败")
+    def on_test_error(self, error):
+        """IMAP连接测试出错"""
+        QMessageBox.critical(self, "错误", f"测试IMAP连接时出错:\n{error}")
+        self.main_window.update_status("测试IMAP连接出错")
 
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"测试IMAP连接时出错:\n{str(e)}")
-            self.main_window.update_status("测试IMAP连接出错")
-        finally:
-            self.test_imap_btn.setEnabled(True)
+    def on_test_done(self):
+        """IMAP连接测试结束(或取消)"""
+        self.test_worker = None
+        self.test_imap_btn.setText("测试IMAP连接")
 
     def save_config(self):
         """保存配置"""
@@ -337,30 +357,52 @@ class AutoReplyTab(QWidget):
 
         check_interval = self.interval_spinbox.value()
 
+        # 后台服务已为该邮箱运行自动回复时,避免重复回复
+        daemon_status = read_daemon_status()
+        if daemon_status and email in daemon_status.get("auto_reply", []):
+            QMessageBox.warning(self, "警告", f"后台服务(PID {daemon_status['pid']})已在为 {email} 运行自动回复")
+            return
+
         # 获取账号凭证
         credentials = self.config_manager.get_account_credentials(email)
         if not credentials:
             QMessageBox.critical(self, "错误", "获取邮箱凭证失败")
             return
 
-        try:
-            # 第一步:测试IMAP连接
-            self.main_window.update_status("正在验证IMAP连接...")
+        # 第一步:在后台测试IMAP连接,通过后再启动
+        self.main_window.update_status("正在验证IMAP连接...")
+        self.start_btn.setEnabled(False)
 
-            test_auto_reply = AutoReply(
-                email_address=credentials["email"],
-                password=credentials.get("imap_password", credentials["password"]),
-                imap_server=credentials["imap_server"],
-                imap_port=credentials["imap_port"],
-                smtp_sender=None
-            )
+        test_auto_reply = AutoReply(
+            email_address=credentials["email"],
+            password=credentials.get("imap_password", credentials["password"]),
+            imap_server=credentials["imap_server"],
+            imap_port=credentials["imap_port"],
+            smtp_sender=None
+        )
 
-            success, test_message = test_auto_reply.test_connection()
+        def on_result(result):
+            self.start_worker = None
+            success, test_message = result
             if not success:
+                self.start_btn.setEnabled(True)
                 QMessageBox.critical(self, "错误", f"IMAP连接失败,无法启动自动回复:\n{test_message}")
                 self.main_window.update_status("IMAP连接失败")
                 return
+            self.finish_start_auto_reply(email, credentials, reply_content, check_interval)
 
+        def on_error(error):
+            self.start_worker = None
+            self.start_btn.setEnabled(True)
+            QMessageBox.critical(self, "错误", f"启动自动回复时出错:\n{error}")
+
+        self.start_worker = run_in_background(
+            test_auto_reply.test_connection, on_result=on_result, on_error=on_error
+        )
+
+    def finish_start_auto_reply(self, email, credentials, reply_content, check_interval):
+        """IMAP连接验证通过后启动自动回复"""
+        try:
             # 第二步:创建邮件发送器和自动回复实例
             sender = EmailSender(
                 email=credentials["email"],
@@ -397,17 +439,24 @@ class AutoReplyTab(QWidget):
                 self.stop_btn.setEnabled(True)
                 self.account_combo.setEnabled(False)
 
-                # 保存配置
-                self.config_manager.set_auto_reply(enabled=True, reply_content=reply_content)
+                # 保存配置(记录账号和间隔,后台服务可据此恢复自动回复)
+                self.config_manager.set_auto_reply(
+                    enabled=True,
+                    reply_content=reply_content,
+                    email=email,
+                    check_interval=check_interval
+                )
 
                 # 更新状态表
                 self.load_auto_reply_status()
 
                 self.main_window.update_status(f"{email} 自动回复已启动")
             else:
+                self.start_btn.setEnabled(True)
                 QMessageBox.warning(self, "失败", "启动自动回复失败")
 
         except Exception as e:
+            self.start_btn.setEnabled(True)
             QMessageBox.critical(self, "错误", f"启动自动回复时出错:\n{str(e)}")
 
     def stop_auto_reply(self):
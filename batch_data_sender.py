@@ -7,9 +7,12 @@
 
 import os
 import time
+from concurrent.futures import Future
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from template_engine import compile_template
+
 
 class BatchDataEmailSender:
     """批量数据邮件发送器"""
@@ -20,7 +23,7 @@ class BatchDataEmailSender:
 
         Args:
             email_sender: EmailSender实例
-            script_executor: ScriptExecutor实例
+            script_executor: ScriptExecutor实例(或ScriptProcessPool,在子进程中并行生成内容)
         """
         self.sender = email_sender
         self.executor = script_executor
@@ -55,7 +58,8 @@ class BatchDataEmailSender:
         return excel_files
 
     def preview_email(self, excel_path: str, subject_template: str,
-                     script_code: str, index: int, total: int) -> tuple:
+                     script_code: str, index: int, total: int,
+                     excel_files: Optional[List[str]] = None) -> tuple:
         """
         预览单个邮件内容
 
@@ -65,6 +69,8 @@ class BatchDataEmailSender:
             script_code: Python脚本代码
             index: 当前序号
             total: 总数
+            excel_files: 本次发送的所有Excel文件, generate_contents 脚本需要与发送时
+                         同样处理所有文件, None表示扫描 excel_path 所在的文件夹
 
         Returns:
             (是否成功, 主题, 内容或错误信息)
@@ -73,8 +79,18 @@ class BatchDataEmailSender:
             # 准备上下文
             context = self._prepare_context(excel_path, index, total)
 
-            # 执行脚本生成内容
-            success, content = self.executor.execute_script(script_code, context)
+            # 执行脚本生成内容(generate_contents 脚本与发送时一样传入所有文件,取该文件的内容)
+            if self._is_batch_script(script_code):
+                if excel_files is None:
+                    excel_files = self.scan_excel_files(os.path.dirname(excel_path))
+                if excel_path not in excel_files:
+                    excel_files = list(excel_files) + [excel_path]
+                contexts = self._prepare_contexts(excel_files)
+                position = excel_files.index(excel_path)
+                context = contexts[position]
+                success, content = self.executor.execute_batch(script_code, contexts)[position]
+            else:
+                success, content = self.executor.execute_script(script_code, context)
             if not success:
                 return (False, "", f"脚本执行失败:\n{content}")
 
@@ -124,6 +140,10 @@ class BatchDataEmailSender:
 
         results['total'] = len(excel_files)
 
+        # 进程池: 提前提交所有文件的脚本,生成内容与发送同时进行;
+        # generate_contents 脚本: 先一次生成所有文件的内容
+        futures = self._submit_scripts(script_code, excel_files)
+
         # 遍历每个Excel文件
         for index, excel_path in enumerate(excel_files, 1):
             filename = os.path.basename(excel_path)
@@ -137,7 +157,10 @@ class BatchDataEmailSender:
                 context = self._prepare_context(excel_path, index, len(excel_files))
 
                 # 执行脚本生成邮件内容
-                success, content = self.executor.execute_script(script_code, context)
+                if futures:
+                    success, content = futures[index - 1].result()
+                else:
+                    success, content = self.executor.execute_script(script_code, context)
                 if not success:
                     results['failed'].append({
                         'file': filename,
@@ -174,11 +197,12 @@ class BatchDataEmailSender:
                     })
                     results['failed_count'] += 1
 
-                # 发送间隔(最后一个文件不需要等待)
-                if index < len(excel_files) and interval > 0:
+                # 发送间隔(最后一个文件不需要等待),多账号发送池按可用账号数缩短
+                wait_seconds = interval / getattr(self.sender, "account_count", 1)
+                if index < len(excel_files) and wait_seconds > 0:
                     if progress_callback:
-                        progress_callback(f"等待 {interval} 秒...")
-                    time.sleep(interval)
+                        progress_callback(f"等待 {wait_seconds:g} 秒...")
+                    time.sleep(wait_seconds)
 
             except Exception as e:
                 results['failed'].append({
@@ -217,6 +241,11 @@ class BatchDataEmailSender:
 
         return context
 
+    def _prepare_contexts(self, excel_files: List[str]) -> List[Dict]:
+        """所有文件的脚本执行上下文(序号从1开始)"""
+        return [self._prepare_context(path, index, len(excel_files))
+                for index, path in enumerate(excel_files, 1)]
+
     def send_batch_multi(self, recipients: List[str], subject_template: str, script_code: str,
                          folder_path: str, is_html: bool = False,
                          interval: int = 2, progress_callback=None) -> Dict:
@@ -255,6 +284,9 @@ class BatchDataEmailSender:
         # 计算总邮件数
         results['total'] = len(recipients) * len(excel_files)
 
+        # 进程池或 generate_contents 脚本: 每个文件的内容只生成一次,所有收件人共用
+        futures = self._submit_scripts(script_code, excel_files)
+
         email_count = 0
         # 遍历每个收件人
         for recipient in recipients:
@@ -272,7 +304,10 @@ class BatchDataEmailSender:
                     context = self._prepare_context(excel_path, index, len(excel_files))
 
                     # 执行脚本生成邮件内容
-                    success, content = self.executor.execute_script(script_code, context)
+                    if futures:
+                        success, content = futures[index - 1].result()
+                    else:
+                        success, content = self.executor.execute_script(script_code, context)
                     if not success:
                         results['failed'].append({
                             'file': f"{recipient} - {filename}",
@@ -308,10 +343,12 @@ class BatchDataEmailSender:
                         results['failed_count'] += 1
 
                     # 发送间隔(最后一封邮件不需要等待)
-                    if email_count < results['total'] and interval > 0:
+                    # 使用多账号发送池时,间隔是每个账号的间隔,按可用账号数缩短
+                    wait_seconds = interval / getattr(self.sender, "account_count", 1)
+                    if email_count < results['total'] and wait_seconds > 0:
                         if progress_callback:
-                            progress_callback(f"等待 {interval} 秒...")
-                        time.sleep(interval)
+                            progress_callback(f"等待 {wait_seconds:g} 秒...")
+                        time.sleep(wait_seconds)
 
                 except Exception as e:
                     results['failed'].append({
@@ -322,9 +359,41 @@ class BatchDataEmailSender:
 
         return results
 
+    def _is_batch_script(self, script_code: str) -> bool:
+        """脚本是否定义了 generate_contents(contexts)(且执行器支持一次处理所有文件)"""
+        return hasattr(self.executor, "execute_batch") and self.executor.is_batch_script(script_code)
+
+    def _submit_scripts(self, script_code: str, excel_files: List[str]) -> Optional[List]:
+        """
+        提前为所有文件生成内容
+
+        脚本定义了 generate_contents(contexts) 时一次执行生成所有文件的内容;
+        执行器支持后台执行(ScriptProcessPool)且脚本不写入文件时为每个文件提交脚本。
+
+        Returns:
+            与excel_files对应的Future列表,都不支持时返回None(发送时逐个执行)
+        """
+        contexts = self._prepare_contexts(excel_files)
+
+        if self._is_batch_script(script_code):
+            futures = []
+            for result in self.executor.execute_batch(script_code, contexts):
+                future = Future()
+                future.set_result(result)
+                futures.append(future)
+            return futures
+
+        if not hasattr(self.executor, "submit"):
+            return None
+        # 预检发现脚本会写入文件时不并行执行,避免多个脚本同时写同一个文件
+        analyze = getattr(self.executor, "analyze_script", None)
+        if analyze is not None and not analyze(script_code)["parallel_safe"]:
+            return None
+        return [self.executor.submit(script_code, context) for context in contexts]
+
     def _render_template(self, template: str, context: Dict) -> str:
         """
-        渲染模板字符串
+        渲染模板字符串(模板只编译一次,支持过滤器和条件,见 template_engine)
 
         Args:
             template: 模板字符串
@@ -333,12 +402,7 @@ class BatchDataEmailSender:
         Returns:
             渲染后的字符串
         """
-        result = template
-        for key, value in context.items():
-            placeholder = f"{{{key}}}"
-            result = result.replace(placeholder, str(value))
-        return result
-
+        return compile_template(template).render(context)
 
 if __name__ == "__main__":
     # 测试代码
@@ -5,23 +5,92 @@
 负责读取、保存和加密邮箱配置信息
 """
 
-import json
 import os
-from cryptography.fernet import Fernet
+import time
+import atexit
+import threading
 from typing import List, Dict, Optional
+from config_store import open_config_store, migrate_config, LAZY_SECTIONS
+from send_ledger import configure_limits
+
+
+# 默认配置数据库,首次运行时自动从旧的 config.json 迁移
+DEFAULT_CONFIG_FILE = "config.db"
+LEGACY_CONFIG_FILE = "config.json"
 
 
 class ConfigManager:
     """配置管理器类"""
 
-    def __init__(self, config_file: str = "config.json"):
+    def __init__(self, config_file: str = None, write_delay: float = 0.5,
+                 credential_ttl: float = 300, lazy: bool = False):
+        """
+        初始化配置管理器
+
+        Args:
+            config_file: 配置文件路径,默认 config.db
+            write_delay: JSON配置的延迟写入时间(秒)
+            credential_ttl: 解密后凭证的缓存时间(秒), 0表示不缓存
+            lazy: 只读取界面启动需要的部分,定时任务和发送页面状态在首次使用时
+                  (或调用 start_background_load 后在后台线程)读取
+        """
+        if config_file is None:
+            config_file = self._default_config_file()
         self.config_file = config_file
         self.key_file = ".secret.key"
-        self.cipher = self._load_or_create_cipher()
-        self.config = self._load_config()
+        # 密钥在第一次加密/解密时才加载
+        self._cipher = None
+        self._cipher_lock = threading.Lock()
+        # config.db 按行更新; config.json 短时间内的多次修改合并为一次原子写入
+        self.store = open_config_store(config_file, write_delay=write_delay)
+        # 尚未读取的部分
+        self._pending_sections = set()
+        self._section_lock = threading.RLock()
+        self.config = self._load_config(lazy)
+        # 按邮箱和任务名称索引,与 config 中的列表保持一致
+        self._account_index = {}
+        self._task_index = {}
+        self._rebuild_index()
+        # 解密后的凭证只缓存在内存中,到期后清除
+        self.credential_ttl = credential_ttl
+        self._credential_cache = {}  # email -> (过期时间, 凭证)
+        self._credential_generation = 0  # 每次清除缓存后增加
+        self._credential_lock = threading.Lock()
+        self._credential_timer = None
+        # 配置被其他进程修改后通知的监听器
+        self.change_listeners = []
+        atexit.register(self.flush)
 
-    def _load_or_create_cipher(self) -> Fernet:
+    @staticmethod
+    def _default_config_file() -> str:
+        """默认使用 config.db,如只有旧的 config.json 则先迁移"""
+        if not os.path.exists(DEFAULT_CONFIG_FILE) and os.path.exists(LEGACY_CONFIG_FILE):
+            try:
+                if migrate_config(LEGACY_CONFIG_FILE, DEFAULT_CONFIG_FILE):
+                    # 迁移后不再读取 config.json,改名以免之后对它的修改被忽略
+                    os.replace(LEGACY_CONFIG_FILE, LEGACY_CONFIG_FILE + ".migrated")
+                    print(f"配置已从 {LEGACY_CONFIG_FILE} 迁移到 {DEFAULT_CONFIG_FILE}"
+                          f"(原文件已改名为 {LEGACY_CONFIG_FILE}.migrated)")
+            except Exception as e:
+                print(f"迁移配置失败,继续使用 {LEGACY_CONFIG_FILE}: {e}")
+                if os.path.exists(DEFAULT_CONFIG_FILE):
+                    os.remove(DEFAULT_CONFIG_FILE)
+                return LEGACY_CONFIG_FILE
+        return DEFAULT_CONFIG_FILE
+
+    @property
+    def cipher(self):
+        """加密器(第一次使用时加载密钥)"""
+        if self._cipher is None:
+            with self._cipher_lock:
+                if self._cipher is None:
+                    self._cipher = self._load_or_create_cipher()
+        return self._cipher
+
+    def _load_or_create_cipher(self):
         """加载或创建加密密钥"""
+        from cryptography.fernet import Fernet
+
         if os.path.exists(self.key_file):
             with open(self.key_file, 'rb') as f:
                 key = f.read()
@@ -31,11 +100,17 @@ class ConfigManager:
                 f.write(key)
         return Fernet(key)
 
-    def _load_config(self) -> Dict:
-        """加载配置文件"""
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+    def _load_config(self, lazy: bool = False) -> Dict:
+        """加载配置文件(lazy为True时跳过体积较大的部分)"""
+        with self._section_lock:
+            config = self.store.load(exclude=LAZY_SECTIONS if lazy else ())
+            self._pending_sections = {name for name in LAZY_SECTIONS if lazy and config is not None
+                                      and name not in config}
+        if config is not None:
+            config.setdefault("email_accounts", [])
+            if "scheduled_tasks" not in self._pending_sections:
+                config.setdefault("scheduled_tasks", [])
+            return config
         else:
             # 创建默认配置
             default_config = {
@@ -45,6 +120,9 @@ class ConfigManager:
                     "reply_content": "感谢您的来信,我会尽快回复。"
                 },
                 "scheduled_tasks": [],
+                "scheduler": {
+                    "spread_window": 0
+                },
                 "send_email_state": {
                     "recipients": "",
                     "subject": "",
@@ -57,15 +135,116 @@ class ConfigManager:
                     "html_enabled": False
                 }
             }
-            self._save_config(default_config)
+            self.store.write(default_config)
             return default_config
 
-    def _save_config(self, config: Dict = None):
-        """保存配置文件"""
-        if config is None:
-            config = self.config
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+    def _ensure_loaded(self, section: str):
+        """确保延迟加载的部分已经读取"""
+        if section not in self._pending_sections:
+            return
+        with self._section_lock:
+            if section not in self._pending_sections:
+                return
+            loaded = self.store.load(sections=[section]) or {}
+            if section == "scheduled_tasks":
+                self.config[section] = loaded.get(section, [])
+                self._task_index = {task["task_name"]: task for task in self.config[section]}
+            elif section in loaded:
+                self.config[section] = loaded[section]
+            self._pending_sections.discard(section)
+
+    def _ensure_all_loaded(self):
+        """读取所有尚未加载的部分"""
+        for section in list(self._pending_sections):
+            self._ensure_loaded(section)
+
+    def start_background_load(self):
+        """在后台线程中读取延迟加载的部分和密钥,界面使用时通常已经准备好"""
+        def load():
+            try:
+                self._ensure_all_loaded()
+                self.cipher
+            except Exception as e:
+                print(f"后台加载配置失败: {e}")
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def flush(self):
+        """立即写入尚未保存的配置修改(退出前调用)"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            print(f"保存配置文件失败: {e}")
+
+    def reload(self):
+        """重新读取配置(其他进程修改配置后调用)"""
+        self.flush()
+        self.config = self._load_config()
+        self._rebuild_index()
+        self.invalidate_credentials()
+
+    def add_change_listener(self, listener):
+        """添加配置变化监听器(以变化的部分名称列表调用)"""
+        self.change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        """移除配置变化监听器"""
+        if listener in self.change_listeners:
+            self.change_listeners.remove(listener)
+
+    def check_for_changes(self) -> List[str]:
+        """
+        检查配置是否被其他进程修改,只重新读取变化的部分并合并
+
+        本进程已修改但尚未写入的部分保留本进程的内容,尚未加载的部分不需要合并。
+
+        Returns:
+            变化的部分名称列表
+        """
+        with self._section_lock:
+            try:
+                sections = self.store.poll_changes()
+                if sections == []:
+                    return []
+                external = self.store.load(sections=sections) or {}
+            except Exception as e:
+                print(f"读取配置变化失败: {e}")
+                return []
+
+            keep = self.store.pending_sections() | self._pending_sections
+            changed = []
+            for section, value in external.items():
+                if section in keep or self.config.get(section) == value:
+                    continue
+                self.config[section] = value
+                changed.append(section)
+
+            if "email_accounts" in changed or "scheduled_tasks" in changed:
+                self._rebuild_index()
+            if "email_accounts" in changed:
+                self.invalidate_credentials()
+
+        if changed:
+            print(f"配置已被外部修改,重新加载: {', '.join(changed)}")
+            for listener in list(self.change_listeners):
+                try:
+                    listener(changed)
+                except Exception as e:
+                    print(f"配置变化监听器出错: {e}")
+        return changed
+
+    def _rebuild_index(self):
+        """根据配置列表重建账号和任务索引"""
+        self._account_index = {acc["email"]: acc for acc in self.config["email_accounts"]}
+        self._task_index = {task["task_name"]: task for task in self.config.get("scheduled_tasks", [])}
+        self._apply_send_limits()
+
+    def _apply_send_limits(self):
+        """把账号配置中的发送限制应用到发送额度账本"""
+        configure_limits({
+            acc["email"]: {"hourly": acc.get("hourly_limit"), "daily": acc.get("daily_limit")}
+            for acc in self.config["email_accounts"]
+        })
 
     def encrypt_password(self, password: str) -> str:
         """加密密码"""
@@ -76,47 +255,85 @@ class ConfigManager:
         return self.cipher.decrypt(encrypted_password.encode()).decode()
 
     def add_email_account(self, email: str, password: str, smtp_server: str = "smtp.163.com",
-                         smtp_port: int = 465, imap_password: str = None) -> bool:
+                         smtp_port: int = 465, imap_password: str = None,
+                         imap_server: str = "imap.163.com", imap_port: int = 993) -> bool:
         """添加邮箱账号"""
         try:
             # 检查是否已存在
-            for account in self.config["email_accounts"]:
-                if account["email"] == email:
-                    return False
-
-            # 加密密码
-            encrypted_pwd = self.encrypt_password(password)
-
-            # 如果没有提供IMAP授权码，则使用SMTP授权码
-            if imap_password is None:
-                imap_password = password
-            encrypted_imap_pwd = self.encrypt_password(imap_password)
-
-            # 添加账号
-            self.config["email_accounts"].append({
-                "email": email,
-                "password": encrypted_pwd,
-                "imap_password": encrypted_imap_pwd,
-                "smtp_server": smtp_server,
-                "smtp_port": smtp_port,
-                "imap_server": "imap.163.com",
-                "imap_port": 993
-            })
-
-            self._save_config()
+            if email in self._account_index:
+                return False
+
+            account = self._build_account(email, password, smtp_server, smtp_port,
+                                          imap_password, imap_server, imap_port)
+            self.config["email_accounts"].append(account)
+            self._account_index[email] = account
+            self.invalidate_credentials(email)
+
+            self.store.save_account(self.config, account)
             return True
         except Exception as e:
             print(f"添加邮箱账号失败: {e}")
             return False
 
+    def _build_account(self, email: str, password: str, smtp_server: str, smtp_port: int,
+                       imap_password: str = None, imap_server: str = "imap.163.com",
+                       imap_port: int = 993) -> Dict:
+        """创建账号配置(加密授权码)"""
+        # 如果没有提供IMAP授权码，则使用SMTP授权码
+        if imap_password is None:
+            imap_password = password
+
+        return {
+            "email": email,
+            "password": self.encrypt_password(password),
+            "imap_password": self.encrypt_password(imap_password),
+            "smtp_server": smtp_server,
+            "smtp_port": smtp_port,
+            "imap_server": imap_server,
+            "imap_port": imap_port
+        }
+
+    def add_email_accounts(self, accounts: List[Dict]) -> tuple:
+        """
+        批量添加邮箱账号(只写入一次配置)
+
+        Args:
+            accounts: 账号列表,每项包含 email、password(明文),可选 imap_password、
+                      smtp_server、smtp_port、imap_server、imap_port
+
+        Returns:
+            (添加的邮箱列表, 已存在而跳过的邮箱列表)
+        """
+        added_accounts = []
+        skipped = []
+        for item in accounts:
+            email = item["email"]
+            if email in self._account_index:
+                skipped.append(email)
+                continue
+            account = self._build_account(
+                email, item["password"],
+                item.get("smtp_server", "smtp.163.com"), item.get("smtp_port", 465),
+                item.get("imap_password"),
+                item.get("imap_server", "imap.163.com"), item.get("imap_port", 993)
+            )
+            self.config["email_accounts"].append(account)
+            self._account_index[email] = account
+            self.invalidate_credentials(email)
+            added_accounts.append(account)
+
+        if added_accounts:
+            self.store.save_accounts(self.config, added_accounts)
+        return [acc["email"] for acc in added_accounts], skipped
+
     def remove_email_account(self, email: str) -> bool:
         """删除邮箱账号"""
         try:
-            self.config["email_accounts"] = [
-                acc for acc in self.config["email_accounts"]
-                if acc["email"] != email
-            ]
-            self._save_config()
+            account = self._account_index.pop(email, None)
+            if account is not None:
+                self.config["email_accounts"].remove(account)
+            self.invalidate_credentials(email)
+            self.store.delete_account(self.config, email)
             return True
         except Exception as e:
             print(f"删除邮箱账号失败: {e}")
@@ -126,37 +343,110 @@ class ConfigManager:
         """获取所有邮箱账号"""
         return self.config["email_accounts"]
 
+    def set_send_limits(self, email: str, hourly: Optional[int], daily: Optional[int]) -> bool:
+        """
+        设置账号的发送限制
+
+        Args:
+            hourly: 每小时上限, None表示使用服务商默认值, 0表示不限制
+            daily: 每天上限, 同上
+        """
+        account = self._account_index.get(email)
+        if account is None:
+            return False
+        for key, value in (("hourly_limit", hourly), ("daily_limit", daily)):
+            if value is None:
+                account.pop(key, None)
+            else:
+                account[key] = value
+        self.store.save_account(self.config, account)
+        self._apply_send_limits()
+        return True
+
     def get_account_credentials(self, email: str) -> Optional[Dict]:
-        """获取账号凭证(包含解密后的密码和IMAP密码)"""
-        for account in self.config["email_accounts"]:
-            if account["email"] == email:
-                credentials = account.copy()
-                credentials["password"] = self.decrypt_password(account["password"])
-
-                # 获取IMAP密码，如果不存在则使用SMTP密码
-                if "imap_password" in account:
-                    credentials["imap_password"] = self.decrypt_password(account["imap_password"])
-                else:
-                    credentials["imap_password"] = credentials["password"]
-
-                return credentials
-        return None
-
-    def set_auto_reply(self, enabled: bool, reply_content: str = None):
+        """获取账号凭证(包含解密后的密码和IMAP密码, 短时间内重复获取使用缓存)"""
+        account = self._account_index.get(email)
+        if account is None:
+            return None
+
+        now = time.monotonic()
+        with self._credential_lock:
+            cached = self._credential_cache.get(email)
+            if cached is not None and cached[0] > now:
+                return cached[1].copy()
+            generation = self._credential_generation
+
+        credentials = account.copy()
+        credentials["password"] = self.decrypt_password(account["password"])
+
+        # 获取IMAP密码，如果不存在则使用SMTP密码
+        if "imap_password" in account:
+            credentials["imap_password"] = self.decrypt_password(account["imap_password"])
+        else:
+            credentials["imap_password"] = credentials["password"]
+
+        if self.credential_ttl > 0:
+            with self._credential_lock:
+                # 解密期间凭证被清除(账号修改或删除)时不放回缓存
+                if generation != self._credential_generation:
+                    return credentials
+                self._credential_cache[email] = (now + self.credential_ttl, credentials.copy())
+                self._schedule_credential_sweep()
+
+        return credentials
+
+    def invalidate_credentials(self, email: str = None):
+        """清除缓存的凭证(email为空时清除全部)"""
+        with self._credential_lock:
+            self._credential_generation += 1
+            if email is None:
+                self._credential_cache.clear()
+            else:
+                self._credential_cache.pop(email, None)
+
+    def _schedule_credential_sweep(self):
+        """启动清理定时器(调用方需持有 _credential_lock)"""
+        if self._credential_timer is None and self._credential_cache:
+            earliest = min(expires for expires, _ in self._credential_cache.values())
+            delay = max(0.1, earliest - time.monotonic())
+            self._credential_timer = threading.Timer(delay, self._sweep_credentials)
+            self._credential_timer.daemon = True
+            self._credential_timer.start()
+
+    def _sweep_credentials(self):
+        """清除过期的凭证,缓存未清空时继续定时清理"""
+        now = time.monotonic()
+        with self._credential_lock:
+            self._credential_timer = None
+            for email in [e for e, (expires, _) in self._credential_cache.items() if expires <= now]:
+                del self._credential_cache[email]
+            self._schedule_credential_sweep()
+
+    def set_auto_reply(self, enabled: bool, reply_content: str = None,
+                       email: str = None, check_interval: int = None):
         """设置自动回复"""
         self.config["auto_reply"]["enabled"] = enabled
         if reply_content:
             self.config["auto_reply"]["reply_content"] = reply_content
-        self._save_config()
+        if email:
+            self.config["auto_reply"]["email"] = email
+        if check_interval:
+            self.config["auto_reply"]["check_interval"] = check_interval
+        self.store.save_section(self.config, "auto_reply")
 
     def get_auto_reply_config(self) -> Dict:
         """获取自动回复配置"""
         return self.config["auto_reply"]
 
     def add_scheduled_task(self, task_name: str, recipients: List[str], subject: str,
-                          content: str, schedule_time: str, sender_email: str) -> bool:
-        """添加定时任务"""
+                          content: str, schedule_time: str, sender_email: str,
+                          deadline: str = None, depends_on: List[str] = None) -> bool:
+        """添加定时任务(任务名称已存在时返回False)"""
         try:
+            self._ensure_loaded("scheduled_tasks")
+            if task_name in self._task_index:
+                return False
+
             task = {
                 "task_name": task_name,
                 "recipients": recipients,
@@ -166,8 +456,13 @@ class ConfigManager:
                 "sender_email": sender_email,
                 "enabled": True
             }
+            if deadline:
+                task["deadline"] = deadline
+            if depends_on:
+                task["depends_on"] = list(depends_on)
             self.config["scheduled_tasks"].append(task)
-            self._save_config()
+            self._task_index[task_name] = task
+            self.store.save_task(self.config, task)
             return True
         except Exception as e:
             print(f"添加定时任务失败: {e}")
@@ -176,11 +471,11 @@ class ConfigManager:
     def remove_scheduled_task(self, task_name: str) -> bool:
         """删除定时任务"""
         try:
-            self.config["scheduled_tasks"] = [
-                task for task in self.config["scheduled_tasks"]
-                if task["task_name"] != task_name
-            ]
-            self._save_config()
+            self._ensure_loaded("scheduled_tasks")
+            task = self._task_index.pop(task_name, None)
+            if task is not None:
+                self.config["scheduled_tasks"].remove(task)
+            self.store.delete_task(self.config, task_name)
             return True
         except Exception as e:
             print(f"删除定时任务失败: {e}")
@@ -188,25 +483,43 @@ class ConfigManager:
 
     def get_scheduled_tasks(self) -> List[Dict]:
         """获取所有定时任务"""
+        self._ensure_loaded("scheduled_tasks")
         return self.config["scheduled_tasks"]
 
+    def get_scheduled_task(self, task_name: str) -> Optional[Dict]:
+        """按名称获取定时任务"""
+        self._ensure_loaded("scheduled_tasks")
+        return self._task_index.get(task_name)
+
     def update_task_status(self, task_name: str, enabled: bool):
         """更新任务状态"""
-        for task in self.config["scheduled_tasks"]:
-            if task["task_name"] == task_name:
-                task["enabled"] = enabled
-        self._save_config()
+        task = self.get_scheduled_task(task_name)
+        if task is not None:
+            task["enabled"] = enabled
+            self.store.save_task(self.config, task, include_recipients=False)
+
+    def get_scheduler_settings(self) -> Dict:
+        """获取调度器设置"""
+        if "scheduler" not in self.config:
+            self.config["scheduler"] = {"spread_window": 0}
+        return self.config["scheduler"]
+
+    def set_spread_window(self, seconds: int):
+        """设置定时任务错峰窗口(秒)"""
+        self.get_scheduler_settings()["spread_window"] = seconds
+        self.store.save_section(self.config, "scheduler", ["spread_window"])
 
     def save_send_email_state(self, state: Dict) -> bool:
         """保存发送邮件页面的状态"""
         try:
+            self._ensure_loaded("send_email_state")
             # 确保send_email_state字段存在
             if "send_email_state" not in self.config:
                 self.config["send_email_state"] = {}
             
             # 更新状态
             self.config["send_email_state"].update(state)
-            self._save_config()
+            self.store.save_section(self.config, "send_email_state", list(state.keys()))
             return True
         except Exception as e:
             print(f"保存发送邮件状态失败: {e}")
@@ -214,6 +527,7 @@ class ConfigManager:
 
     def get_send_email_state(self) -> Dict:
         """获取发送邮件页面的保存状态"""
+        self._ensure_loaded("send_email_state")
         default_state = {
             "recipients": "",
             "subject": "",
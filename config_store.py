@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配置存储模块
+负责配置的持久化,支持两种存储:
+- JsonConfigStore: config.json, 合并短时间内的多次修改为一次写入,并以原子方式替换文件
+- SQLiteConfigStore: config.db, 账号、任务、收件人和界面状态分表存储,修改只更新相关的行
+"""
+
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+
+# 使用SQLite存储的配置文件扩展名
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# 配置中的列表部分,其余顶层字段均视为界面状态/设置部分
+LIST_SECTIONS = ("email_accounts", "scheduled_tasks")
+
+# 体积可能很大、界面启动时不需要的部分(可延迟加载)
+LAZY_SECTIONS = ("scheduled_tasks", "send_email_state")
+
+
+class ConfigStore:
+    """
+    配置存储基类
+
+    ConfigManager修改配置后调用对应的细粒度方法。默认实现都保存整个配置,
+    支持按行更新的存储可以重写这些方法。
+    """
+
+    def load(self, sections: List[str] = None, exclude: List[str] = ()) -> Optional[Dict]:
+        """
+        读取配置,不存在时返回None
+
+        Args:
+            sections: 只读取这些顶层部分(None表示全部)
+            exclude: 不读取的顶层部分
+            不支持部分读取的存储忽略这两个参数,返回全部配置
+        """
+        raise NotImplementedError
+
+    def save(self, config: Dict):
+        """保存整个配置"""
+        raise NotImplementedError
+
+    def write(self, config: Dict):
+        """立即写入整个配置"""
+        raise NotImplementedError
+
+    def flush(self):
+        """写入尚未保存的修改"""
+
+    def close(self):
+        """关闭存储"""
+        self.flush()
+
+    def poll_changes(self) -> Optional[List[str]]:
+        """
+        检查其他进程(或手工编辑)是否修改了配置
+
+        Returns:
+            [] 表示没有变化; 变化的部分名称列表; None表示有变化但无法确定是哪些部分
+        """
+        return []
+
+    def pending_sections(self) -> set:
+        """本进程已修改但尚未写入的部分"""
+        return set()
+
+    def save_account(self, config: Dict, account: Dict):
+        """新增或更新邮箱账号"""
+        self.save(config)
+
+    def save_accounts(self, config: Dict, accounts: List[Dict]):
+        """批量新增或更新邮箱账号(一次写入)"""
+        self.save(config)
+
+    def delete_account(self, config: Dict, email: str):
+        """删除邮箱账号"""
+        self.save(config)
+
+    def save_task(self, config: Dict, task: Dict, include_recipients: bool = True):
+        """新增或更新定时任务(include_recipients为False时不改动收件人)"""
+        self.save(config)
+
+    def delete_task(self, config: Dict, task_name: str):
+        """删除定时任务"""
+        self.save(config)
+
+    def save_section(self, config: Dict, section: str, keys: List[str] = None):
+        """保存设置部分(如 auto_reply、send_email_state),keys为空时保存整个部分"""
+        self.save(config)
+
+
+class JsonConfigStore(ConfigStore):
+    """JSON配置文件存储(延迟合并写入, 原子替换)"""
+
+    def __init__(self, config_file: str, write_delay: float = 0.5):
+        """
+        初始化存储
+
+        Args:
+            config_file: 配置文件路径
+            write_delay: 延迟写入时间(秒)。该时间内的多次修改合并为一次写入,
+                         0表示每次修改立即写入
+        """
+        self.config_file = config_file
+        self.write_delay = write_delay
+        self._pending = None  # 等待写入的配置
+        self._dirty = set()  # 等待写入的部分
+        self._timer = None
+        self._lock = threading.RLock()
+        self._file_token = None  # 最近一次读取/写入时文件的 (修改时间, 大小)
+        self._merged_external = False  # 写入时合并了外部修改,需要通知重新读取
+
+    def _stat_token(self):
+        """配置文件的 (修改时间, 大小),文件不存在时为None"""
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self, sections: List[str] = None, exclude: List[str] = ()) -> Optional[Dict]:
+        """读取配置文件,文件不存在时返回None(JSON只能整体读取,返回全部配置)"""
+        if not os.path.exists(self.config_file):
+            return None
+        token = self._stat_token()
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self._file_token = token
+        return config
+
+    def poll_changes(self) -> Optional[List[str]]:
+        """文件的修改时间或大小变化即视为被修改(无法确定具体部分)"""
+        token = self._stat_token()
+        if token == self._file_token and not self._merged_external:
+            return []
+        self._merged_external = False
+        return None
+
+    def pending_sections(self) -> set:
+        with self._lock:
+            return set(self._dirty)
+
+    def save_account(self, config: Dict, account: Dict):
+        self._mark_dirty(config, "email_accounts")
+
+    def save_accounts(self, config: Dict, accounts: List[Dict]):
+        self._mark_dirty(config, "email_accounts")
+
+    def delete_account(self, config: Dict, email: str):
+        self._mark_dirty(config, "email_accounts")
+
+    def save_task(self, config: Dict, task: Dict, include_recipients: bool = True):
+        self._mark_dirty(config, "scheduled_tasks")
+
+    def delete_task(self, config: Dict, task_name: str):
+        self._mark_dirty(config, "scheduled_tasks")
+
+    def save_section(self, config: Dict, section: str, keys: List[str] = None):
+        self._mark_dirty(config, section)
+
+    def _mark_dirty(self, config: Dict, section: str):
+        """记录修改的部分并延迟保存"""
+        with self._lock:
+            self._dirty.add(section)
+            self._schedule(config)
+
+    def save(self, config: Dict):
+        """保存整个配置(延迟写入)"""
+        with self._lock:
+            self._dirty.update(config.keys())
+            self._schedule(config)
+
+    def _schedule(self, config: Dict):
+        """
+        第一次修改后启动定时器,定时器到期前的后续修改只更新待写入的配置,
+        到期后统一写入一次。
+        """
+        with self._lock:
+            self._pending = config
+            if self.write_delay <= 0:
+                self.flush()
+                return
+            if self._timer is None:
+                self._timer = threading.Timer(self.write_delay, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _on_timer(self):
+        """定时器到期,写入配置"""
+        with self._lock:
+            self._timer = None
+            try:
+                self.flush()
+            except RuntimeError:
+                # 序列化时配置正在被其他线程修改,稍后重试
+                self._schedule(self._pending)
+            except Exception as e:
+                print(f"保存配置文件失败: {e}")
+
+    def flush(self):
+        """立即写入尚未保存的修改"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending is None:
+                return
+            config = self._pending
+            self.write(self._merge_external(config))
+            if self._pending is config:
+                self._pending = None
+                self._dirty.clear()
+
+    def _merge_external(self, config: Dict) -> Dict:
+        """
+        文件在上次读取/写入后被其他进程修改时,重新读取文件,
+        只用本进程修改过的部分覆盖,其余部分保留外部的修改
+        """
+        if not self._dirty or self._stat_token() == self._file_token:
+            return config
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                external = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取外部修改的配置文件失败,使用本进程的配置: {e}")
+            return config
+        merged = dict(external)
+        for section in self._dirty:
+            if section in config:
+                merged[section] = config[section]
+            else:
+                merged.pop(section, None)
+        self._merged_external = True
+        return merged
+
+    def has_pending(self) -> bool:
+        """是否有尚未写入的修改"""
+        return self._pending is not None
+
+    def write(self, config: Dict):
+        """
+        原子写入配置文件
+
+        先写入同目录下的临时文件并刷新到磁盘,再替换原文件,
+        写入过程中崩溃不会损坏原配置文件。
+        """
+        data = json.dumps(config, ensure_ascii=False, indent=2)
+
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".config.", suffix=".tmp", dir=directory
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_file)
+            self._file_token = self._stat_token()
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def close(self):
+        """写入剩余修改"""
+        self.flush()
+
+
+class SQLiteConfigStore(ConfigStore):
+    """
+    SQLite配置存储
+
+    表结构:
+    - accounts: 邮箱账号, 每个账号一行
+    - tasks: 定时任务(不含收件人), 每个任务一行
+    - recipients: 定时任务的收件人, 每个收件人一行
+    - ui_state: 设置和界面状态, 每个 (部分, 键) 一行
+
+    每次修改只在一个事务中更新相关的行,不会重写整个配置。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            email TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_accounts_position ON accounts (position);
+        CREATE INDEX IF NOT EXISTS idx_tasks_position ON tasks (position);
+        CREATE TABLE IF NOT EXISTS recipients (
+            task_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            PRIMARY KEY (task_name, position)
+        );
+        CREATE TABLE IF NOT EXISTS ui_state (
+            section TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (section, key)
+        );
+        CREATE TABLE IF NOT EXISTS section_versions (
+            section TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    # 每个表修改后增加对应部分的版本号,用于判断其他进程修改了哪些部分
+    TRIGGER_TEMPLATE = """
+        CREATE TRIGGER IF NOT EXISTS {table}_{event}_version AFTER {event} ON {table}
+        BEGIN
+            INSERT INTO section_versions (section, version) VALUES ({section}, 1)
+            ON CONFLICT(section) DO UPDATE SET version = version + 1;
+        END;
+    """
+
+    def __init__(self, db_file: str):
+        self.config_file = db_file
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._create_triggers()
+        self._data_version = self._read_data_version()
+        self._versions = self._read_versions()
+
+    def _create_triggers(self):
+        """创建记录部分版本号的触发器"""
+        tables = {
+            "accounts": ("'email_accounts'", "'email_accounts'"),
+            "tasks": ("'scheduled_tasks'", "'scheduled_tasks'"),
+            "recipients": ("'scheduled_tasks'", "'scheduled_tasks'"),
+            "ui_state": ("NEW.section", "OLD.section"),
+        }
+        script = []
+        for table, (new_section, old_section) in tables.items():
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                section = old_section if event == "DELETE" else new_section
+                script.append(self.TRIGGER_TEMPLATE.format(table=table, event=event, section=section))
+        self.conn.executescript("".join(script))
+
+    def _read_data_version(self) -> int:
+        """其他连接提交修改后 data_version 会变化"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_versions(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT section, version FROM section_versions"))
+
+    def poll_changes(self) -> Optional[List[str]]:
+        """比较各部分的版本号,返回其他进程修改过的部分"""
+        with self._lock:
+            data_version = self._read_data_version()
+            versions = self._read_versions()
+            if data_version == self._data_version:
+                # 只有本进程的修改
+                self._versions = versions
+                return []
+            changed = [section for section, version in versions.items()
+                       if self._versions.get(section) != version]
+            self._data_version = data_version
+            self._versions = versions
+            return changed
+
+    def load(self, sections: List[str] = None, exclude: List[str] = ()) -> Optional[Dict]:
+        """读取配置(只查询需要的表和行),数据库为空时返回None"""
+        def wanted(name):
+            return (sections is None or name in sections) and name not in exclude
+
+        with self._lock:
+            cur = self.conn.cursor()
+            if self._is_empty(cur):
+                return None
+
+            config = {}
+            if wanted("email_accounts"):
+                config["email_accounts"] = [json.loads(data) for (data,) in cur.execute(
+                    "SELECT data FROM accounts ORDER BY position")]
+
+            if wanted("scheduled_tasks"):
+                recipients = {}
+                for task_name, email in cur.execute(
+                        "SELECT task_name, email FROM recipients ORDER BY task_name, position"):
+                    recipients.setdefault(task_name, []).append(email)
+
+                tasks = []
+                for task_name, data in cur.execute(
+                        "SELECT task_name, data FROM tasks ORDER BY position"):
+                    task = json.loads(data)
+                    task["recipients"] = recipients.get(task_name, [])
+                    tasks.append(task)
+                config["scheduled_tasks"] = tasks
+
+            query = "SELECT section, key, value FROM ui_state WHERE section NOT IN (%s)" \
+                % ",".join("?" * (len(exclude) + len(LIST_SECTIONS)))
+            params = list(exclude) + list(LIST_SECTIONS)
+            if sections is not None:
+                query += " AND section IN (%s)" % ",".join("?" * len(sections))
+                params += list(sections)
+            for section, key, value in cur.execute(query, params):
+                config.setdefault(section, {})[key] = json.loads(value)
+
+        return config
+
+    @staticmethod
+    def _is_empty(cur) -> bool:
+        """数据库中是否还没有任何配置"""
+        for table in ("accounts", "tasks", "ui_state"):
+            if cur.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def save(self, config: Dict):
+        """保存整个配置(用于导入等整体替换的场景)"""
+        self.write(config)
+
+    def write(self, config: Dict):
+        """在一个事务中替换全部配置"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM accounts")
+            self.conn.execute("DELETE FROM tasks")
+            self.conn.execute("DELETE FROM recipients")
+            self.conn.execute("DELETE FROM ui_state")
+            for position, account in enumerate(config.get("email_accounts", [])):
+                self._upsert_account(account, position)
+            for position, task in enumerate(config.get("scheduled_tasks", [])):
+                self._upsert_task(task, include_recipients=True, position=position)
+            for section, value in config.items():
+                if section not in LIST_SECTIONS and isinstance(value, dict):
+                    self._upsert_section(config, section, None)
+
+    def _position(self, table: str, key_column: str, key: str) -> int:
+        """已有的行保持原位置,新的行排在最后(删除留下的空位不影响顺序)"""
+        row = self.conn.execute(
+            f"SELECT COALESCE((SELECT position FROM {table} WHERE {key_column} = ?), "
+            f"(SELECT COALESCE(MAX(position), -1) + 1 FROM {table}))", (key,)
+        ).fetchone()
+        return row[0]
+
+    def _upsert_account(self, account: Dict, position: int = None):
+        if position is None:
+            position = self._position("accounts", "email", account["email"])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO accounts (email, position, data) VALUES (?, ?, ?)",
+            (account["email"], position, json.dumps(account, ensure_ascii=False))
+        )
+
+    def _upsert_task(self, task: Dict, include_recipients: bool, position: int = None):
+        if position is None:
+            position = self._position("tasks", "task_name", task["task_name"])
+        data = {k: v for k, v in task.items() if k != "recipients"}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_name, position, data) VALUES (?, ?, ?)",
+            (task["task_name"], position, json.dumps(data, ensure_ascii=False))
+        )
+        if include_recipients:
+            self.conn.execute("DELETE FROM recipients WHERE task_name = ?", (task["task_name"],))
+            self.conn.executemany(
+                "INSERT INTO recipients (task_name, position, email) VALUES (?, ?, ?)",
+                ((task["task_name"], i, email) for i, email in enumerate(task["recipients"]))
+            )
+
+    def _upsert_section(self, config: Dict, section: str, keys: Optional[List[str]]):
+        values = config.get(section, {})
+        if keys is None:
+            keys = list(values.keys())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ui_state (section, key, value) VALUES (?, ?, ?)",
+            ((section, key, json.dumps(values[key], ensure_ascii=False)) for key in keys if key in values)
+        )
+
+    def save_account(self, config: Dict, account: Dict):
+        with self._lock, self.conn:
+            self._upsert_account(account)
+
+    def save_accounts(self, config: Dict, accounts: List[Dict]):
+        with self._lock, self.conn:
+            for account in accounts:
+                self._upsert_account(account)
+
+    def delete_account(self, config: Dict, email: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM accounts WHERE email = ?", (email,))
+
+    def save_task(self, config: Dict, task: Dict, include_recipients: bool = True):
+        with self._lock, self.conn:
+            self._upsert_task(task, include_recipients)
+
+    def delete_task(self, config: Dict, task_name: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM tasks WHERE task_name = ?", (task_name,))
+            self.conn.execute("DELETE FROM recipients WHERE task_name = ?", (task_name,))
+
+    def save_section(self, config: Dict, section: str, keys: List[str] = None):
+        with self._lock, self.conn:
+            self._upsert_section(config, section, keys)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self.conn.close()
+
+
+def open_config_store(config_file: str, write_delay: float = 0.5) -> ConfigStore:
+    """根据文件扩展名选择配置存储(.db/.sqlite使用SQLite,其余使用JSON)"""
+    if config_file.lower().endswith(SQLITE_EXTENSIONS):
+        return SQLiteConfigStore(config_file)
+    return JsonConfigStore(config_file, write_delay=write_delay)
+
+
+def migrate_config(source_file: str, target_file: str) -> bool:
+    """
+    在两种存储之间迁移配置(如 config.json -> config.db)
+
+    Returns:
+        是否迁移成功(源配置不存在时返回False)
+    """
+    source = open_config_store(source_file, write_delay=0)
+    config = source.load()
+    source.close()
+    if config is None:
+        return False
+
+    target = open_config_store(target_file, write_delay=0)
+    target.write(config)
+    target.close()
+    return True
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("配置存储模块加载成功")
@@ -11,14 +11,16 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import os
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
+from send_ledger import SendLedger, get_default_ledger
 
 
 class EmailSender:
     """邮件发送器类"""
 
-    def __init__(self, email: str, password: str, smtp_server: str, smtp_port: int):
+    def __init__(self, email: str, password: str, smtp_server: str, smtp_port: int,
+                 ledger: SendLedger = None):
         """
         初始化邮件发送器
 
@@ -27,11 +29,28 @@ class EmailSender:
             password: 邮箱密码(授权码)
             smtp_server: SMTP服务器地址
             smtp_port: SMTP服务器端口
+            ledger: 发送额度账本, None表示使用共用的默认账本
         """
         self.email = email
         self.password = password
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
+        self._ledger = ledger
+
+    @property
+    def ledger(self) -> SendLedger:
+        """发送额度账本"""
+        if self._ledger is None:
+            self._ledger = get_default_ledger()
+        return self._ledger
+
+    def remaining_quota(self) -> Optional[int]:
+        """现在还能发送的邮件数, None表示不限制(账本无法读取时也不限制)"""
+        try:
+            return self.ledger.remaining(self.email)
+        except Exception as e:
+            print(f"读取发送额度失败,本次不限制: {e}")
+            return None
 
     def send_email(self, recipients: List[str], subject: str, content: str,
                    attachments: Optional[List[str]] = None, is_html: bool = False) -> dict:
@@ -46,18 +65,50 @@ class EmailSender:
             is_html: 是否为HTML格式
 
         Returns:
-            发送结果字典,包含成功和失败的收件人
+            发送结果字典,包含成功和失败的收件人(超出发送额度的收件人不发送,计入失败)
+        """
+        return self.send_personalized([(recipient, subject, content) for recipient in recipients],
+                                      attachments, is_html)
+
+    def send_personalized(self, messages: List[Tuple[str, str, str]],
+                          attachments: Optional[List[str]] = None, is_html: bool = False,
+                          cancel_event=None) -> dict:
+        """
+        在一次SMTP连接中发送多封内容不同的邮件(邮件合并)
+
+        Args:
+            messages: [(收件人, 主题, 内容)]
+            attachments: 附件路径列表(所有邮件相同)
+            is_html: 是否为HTML格式
+            cancel_event: 设置后不再发送剩余的邮件(threading.Event),每封邮件发送前检查
+
+        Returns:
+            与 send_email 相同的结果字典,中途停止时包含 cancelled: True(未发送的邮件不计入成功或失败)
         """
         success_list = []
         failed_list = []
+        total = len(messages)
+        deferred = []
+        cancelled = False
 
         try:
+            # 超出额度的收件人不再尝试,避免触发服务商的限制
+            remaining = self.remaining_quota()
+            if remaining is not None:
+                deferred = [recipient for recipient, _, _ in messages[remaining:]]
+                messages = messages[:remaining]
+                if deferred and not messages:
+                    return self._quota_result(deferred, total)
+
             # 连接SMTP服务器
             server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
             server.login(self.email, self.password)
 
             # 为每个收件人发送邮件
-            for recipient in recipients:
+            for recipient, subject, content in messages:
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    break
                 try:
                     # 创建邮件对象
                     msg = MIMEMultipart()
@@ -84,22 +135,58 @@ class EmailSender:
                     print(f"成功发送邮件到: {recipient}")
 
                 except Exception as e:
-                    failed_list.append({"recipient": recipient, "error": str(e)})
+                    failed_list.append(self._failure(recipient, str(e), e))
                     print(f"发送邮件到 {recipient} 失败: {e}")
 
+            self._record_sent(len(success_list))
             server.quit()
 
         except Exception as e:
             print(f"SMTP连接错误: {e}")
-            failed_list = [{"recipient": r, "error": f"SMTP连接错误: {e}"} for r in recipients]
+            failed_list = [self._failure(r, f"SMTP连接错误: {e}", e) for r, _, _ in messages]
 
-        return {
+        if deferred and not cancelled:
+            failed_list.extend(self._quota_result(deferred, total)["failed"])
+        result = {
             "success": success_list,
             "failed": failed_list,
-            "total": len(recipients),
+            "total": total,
             "success_count": len(success_list),
             "failed_count": len(failed_list)
         }
+        if cancelled:
+            result["cancelled"] = True
+        return result
+
+    @staticmethod
+    def _failure(recipient: str, error: str, exc: Exception) -> dict:
+        """失败明细,SMTP服务器拒绝时记录回复码(smtp_code)"""
+        item = {"recipient": recipient, "error": error}
+        code = getattr(exc, "smtp_code", None)
+        if code is None and isinstance(exc, smtplib.SMTPRecipientsRefused) and exc.recipients:
+            code = next(iter(exc.recipients.values()))[0]
+        if code is not None:
+            item["smtp_code"] = code
+        return item
+
+    def _record_sent(self, count: int):
+        """把发送成功的邮件数记入账本(账本无法写入时不影响发送结果)"""
+        try:
+            self.ledger.record(self.email, count)
+        except Exception as e:
+            print(f"记录发送额度失败: {e}")
+
+    def _quota_result(self, deferred: List[str], total: int) -> dict:
+        """超出发送额度、未发送的收件人的结果"""
+        message = self.ledger.quota_message(self.email)
+        print(f"{self.email} {message}, {len(deferred)} 封邮件未发送")
+        return {
+            "success": [],
+            "failed": [{"recipient": r, "error": message} for r in deferred],
+            "total": total,
+            "success_count": 0,
+            "failed_count": len(deferred)
+        }
 
     def _add_attachment(self, msg: MIMEMultipart, file_path: str):
         """添加附件到邮件"""
@@ -158,12 +245,26 @@ class BulkEmailSender:
         Returns:
             发送结果统计
         """
+        # 多账号发送池自行分批并行发送
+        if hasattr(self.sender, "send_bulk_email"):
+            return self.sender.send_bulk_email(recipients, subject, content,
+                                               attachments, is_html, batch_size)
+
         total_success = []
         total_failed = []
 
         # 分批发送
         for i in range(0, len(recipients), batch_size):
             batch = recipients[i:i + batch_size]
+
+            # 额度已用完: 剩余批次不再连接服务器
+            remaining_quota = getattr(self.sender, "remaining_quota", None)
+            if remaining_quota is not None and remaining_quota() == 0:
+                message = self.sender.ledger.quota_message(self.sender.email)
+                print(f"{message},剩余 {len(recipients) - i} 封邮件未发送")
+                total_failed.extend({"recipient": r, "error": message} for r in recipients[i:])
+                break
+
             print(f"正在发送第 {i//batch_size + 1} 批,共 {len(batch)} 封邮件...")
 
             result = self.sender.send_email(
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+寻拟邮件工具 - 无界面后台服务
+不依赖PyQt5,读取配置(config.db)运行定时任务和自动回复,适合部署在服务器上
+
+用法:
+    python headless.py                      # 运行定时任务和自动回复
+    python headless.py --no-auto-reply      # 只运行定时任务
+    python headless.py --config other.db    # 使用其他配置文件(.db 或 .json)
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from config_manager import ConfigManager
+from task_scheduler import ScheduleManager
+from auto_reply import AutoReplyManager
+
+
+# 后台服务状态文件,图形界面通过它判断是否已有后台服务在运行
+DAEMON_STATUS_FILE = "headless_status.json"
+
+# 心跳间隔(秒),超过3个间隔未更新即视为后台服务已退出
+HEARTBEAT_INTERVAL = 10
+
+# 检查配置变化的间隔(秒)
+CONFIG_POLL_INTERVAL = 2
+
+
+def read_daemon_status(status_file: str = DAEMON_STATUS_FILE) -> Optional[Dict]:
+    """
+    读取后台服务状态
+
+    Returns:
+        后台服务正在运行时返回状态字典,否则返回None
+    """
+    if not os.path.exists(status_file):
+        return None
+
+    try:
+        with open(status_file, 'r', encoding='utf-8') as f:
+            status = json.load(f)
+    except Exception:
+        return None
+
+    if time.time() - status.get("heartbeat", 0) > HEARTBEAT_INTERVAL * 3:
+        return None
+    return status
+
+
+class HeadlessService:
+    """无界面后台服务"""
+
+    def __init__(self, config_file: str = None, run_scheduler: bool = True,
+                 run_auto_reply: bool = True, status_file: str = DAEMON_STATUS_FILE):
+        self.config_manager = ConfigManager(config_file)
+        self.schedule_manager = ScheduleManager(
+            spread_window=self.config_manager.get_scheduler_settings().get("spread_window", 0)
+        )
+        self.auto_reply_manager = AutoReplyManager()
+        self.run_scheduler = run_scheduler
+        self.run_auto_reply = run_auto_reply
+        self.status_file = status_file
+        self.started_at = None
+        self._stop_event = threading.Event()
+        # 图形界面或手工修改配置后自动同步
+        self.config_manager.add_change_listener(self.on_config_changed)
+
+    def start(self):
+        """启动定时任务和自动回复"""
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        if self.run_scheduler:
+            loaded = self.schedule_manager.load_tasks_from_config(self.config_manager)
+            print(f"已加载 {loaded} 个定时任务")
+            self.schedule_manager.start_scheduler()
+
+        if self.run_auto_reply:
+            if self.auto_reply_manager.start_from_config(self.config_manager):
+                print(f"自动回复已启动: {self.config_manager.get_auto_reply_config()['email']}")
+            else:
+                print("自动回复未启用")
+
+        self._write_status()
+
+    def reload(self):
+        """重新读取配置并同步定时任务"""
+        self.config_manager.reload()
+        if self.run_scheduler:
+            self.schedule_manager.sync_tasks_from_config(self.config_manager)
+        print("配置已重新加载")
+
+    def on_config_changed(self, sections):
+        """配置被外部修改: 只同步受影响的服务"""
+        if not self.run_scheduler:
+            return
+        if "scheduler" in sections:
+            self.schedule_manager.set_spread_window(
+                self.config_manager.get_scheduler_settings().get("spread_window", 0)
+            )
+        if "scheduled_tasks" in sections or "email_accounts" in sections:
+            self.schedule_manager.sync_tasks_from_config(self.config_manager)
+
+    def stop(self):
+        """停止所有服务"""
+        self._stop_event.set()
+
+    def run_forever(self):
+        """运行直到收到停止信号"""
+        self.start()
+        last_heartbeat = time.time()
+        try:
+            while not self._stop_event.wait(CONFIG_POLL_INTERVAL):
+                self.config_manager.check_for_changes()
+                if time.time() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    self._write_status()
+                    last_heartbeat = time.time()
+        finally:
+            self.auto_reply_manager.stop_all()
+            if self.schedule_manager.is_running():
+                self.schedule_manager.stop_scheduler()
+            self.config_manager.flush()
+            self._remove_status()
+            print("后台服务已退出")
+
+    def _write_status(self):
+        """写入状态文件(心跳)"""
+        status = {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "heartbeat": time.time(),
+            "config_file": os.path.abspath(self.config_manager.config_file),
+            "scheduler": self.schedule_manager.is_running(),
+            "tasks": self.schedule_manager.scheduler.get_task_names(),
+            "auto_reply": self.auto_reply_manager.get_active_emails()
+        }
+        tmp_file = self.status_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(status, f, ensure_ascii=False)
+            os.replace(tmp_file, self.status_file)
+        except Exception as e:
+            print(f"写入状态文件失败: {e}")
+
+    def _remove_status(self):
+        """删除状态文件"""
+        try:
+            if os.path.exists(self.status_file):
+                os.remove(self.status_file)
+        except Exception as e:
+            print(f"删除状态文件失败: {e}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="寻拟邮件工具 - 无界面后台服务")
+    parser.add_argument("--config", default=None, help="配置文件路径(默认 config.db)")
+    parser.add_argument("--no-scheduler", action="store_true", help="不运行定时任务")
+    parser.add_argument("--no-auto-reply", action="store_true", help="不运行自动回复")
+    args = parser.parse_args()
+
+    existing = read_daemon_status()
+    if existing:
+        print(f"后台服务已在运行 (PID {existing['pid']}),退出")
+        sys.exit(1)
+
+    service = HeadlessService(
+        config_file=args.config,
+        run_scheduler=not args.no_scheduler,
+        run_auto_reply=not args.no_auto_reply
+    )
+
+    def handle_stop(signum, frame):
+        print(f"收到信号 {signum},正在停止...")
+        service.stop()
+
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGTERM, handle_stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: service.reload())
+
+    print("寻拟邮件工具后台服务已启动,按 Ctrl+C 退出")
+    service.run_forever()
+
+
+if __name__ == "__main__":
+    main()
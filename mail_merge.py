@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+邮件合并模块
+从CSV/Excel收件人表逐行读取数据,为每个收件人渲染个性化的主题和正文({列名}替换为该行的值)。
+数据行逐行读取、按批发送,百万行的收件人表也不会整个读入内存
+"""
+
+import os
+import re
+import csv
+import time
+from typing import Dict, Any, List, Iterator, Iterable, Optional, Tuple
+
+from template_engine import compile_template
+
+
+# 支持的收件人表格式
+MERGE_EXTENSIONS = ('.csv', '.xlsx', '.xlsm', '.xls')
+
+# 自动识别的收件人邮箱列名(不区分大小写)
+EMAIL_COLUMNS = ("email", "e-mail", "mail", "邮箱", "电子邮箱", "邮件地址", "收件人")
+
+# 结果中最多保留的成功/失败明细数(数量统计不受限制)
+MAX_DETAILS = 1000
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _detect_encoding(path: str) -> str:
+    """CSV文件编码: UTF-8(可带BOM),否则按GBK(Excel另存的中文CSV)"""
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+    try:
+        head.decode('utf-8-sig')
+        return 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # 截断在多字节字符中间时仍按UTF-8
+        return 'utf-8-sig' if e.start >= len(head) - 3 else 'gbk'
+
+
+def _clean(value: Any) -> Any:
+    """单元格值: 空为"",整数形式的小数(Excel中的编号、手机号)去掉 .0"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取收件人表(第一行为列名)
+
+    Args:
+        path: CSV/Excel文件路径。.csv 和 .xlsx/.xlsm 逐行读取;
+              .xls 需要整个读入(建议另存为 .xlsx 或 .csv)
+
+    Yields:
+        {列名: 值},跳过空行
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        with open(path, 'r', encoding=_detect_encoding(path), newline='') as f:
+            for row in csv.DictReader(f):
+                if any(value for value in row.values() if isinstance(value, str) and value.strip()):
+                    yield {str(key).strip(): value for key, value in row.items() if key is not None}
+
+    elif ext in ('.xlsx', '.xlsm'):
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(name).strip() if name is not None else "" for name in header]
+            for values in rows:
+                if all(value is None for value in values):
+                    continue
+                yield {name: _clean(value) for name, value in zip(columns, values) if name}
+        finally:
+            workbook.close()
+
+    elif ext == '.xls':
+        import pandas as pd
+        df = pd.read_excel(path, dtype=object)
+        df.columns = [str(name).strip() for name in df.columns]
+        for record in df.to_dict('records'):
+            yield {name: _clean(None if pd.isna(value) else value) for name, value in record.items()}
+
+    else:
+        raise ValueError(f"不支持的文件格式: {ext}(支持 {', '.join(MERGE_EXTENSIONS)})")
+
+
+def read_columns(path: str) -> List[str]:
+    """收件人表的列名(只读取第一行数据)"""
+    first = next(iter_rows(path), None)
+    return list(first) if first else []
+
+
+def find_email_column(columns: Iterable[str]) -> Optional[str]:
+    """按常用列名找到收件人邮箱列"""
+    for column in columns:
+        if column.strip().lower() in EMAIL_COLUMNS:
+            return column
+    return None
+
+
+class MailMerge:
+    """邮件合并发送器"""
+
+    def __init__(self, sender, subject_template: str, body_template: str,
+                 email_column: str = None, is_html: bool = False,
+                 attachments: Optional[List[str]] = None):
+        """
+        初始化邮件合并
+
+        Args:
+            sender: EmailSender 或 SenderPool
+            subject_template: 主题模板, {列名} 替换为该行的值(语法见 template_engine)
+            body_template: 正文模板, HTML格式时列的值会进行HTML转义
+            email_column: 收件人邮箱所在的列, None表示按列名自动识别
+            is_html: 是否为HTML格式
+            attachments: 附件列表(所有收件人相同)
+
+        Raises:
+            TemplateError: 模板语法错误
+        """
+        self.sender = sender
+        self.subject_template = compile_template(subject_template)
+        self.body_template = compile_template(body_template, autoescape=is_html)
+        self.email_column = email_column
+        self.is_html = is_html
+        self.attachments = attachments
+
+    def _email_column(self, row: Dict[str, Any]) -> str:
+        column = self.email_column or find_email_column(row)
+        if not column or column not in row:
+            raise ValueError(f"收件人表中没有邮箱列(可用的列: {', '.join(row)})")
+        return column
+
+    def iter_messages(self, rows: Iterable[Dict[str, Any]]) -> Iterator[Tuple[int, str, str, str]]:
+        """
+        逐行渲染邮件
+
+        Yields:
+            (行号, 收件人, 主题, 正文),行号从2开始(第1行为列名)
+        """
+        column = None
+        for line, row in enumerate(rows, 2):
+            if column is None:
+                column = self._email_column(row)
+            recipient = str(row.get(column, "")).strip()
+            yield (line, recipient, self.subject_template.render(row), self.body_template.render(row))
+
+    def preview(self, source: str, count: int = 3) -> List[Tuple[str, str, str]]:
+        """渲染前count行的 (收件人, 主题, 正文)"""
+        previews = []
+        for _, recipient, subject, body in self.iter_messages(iter_rows(source)):
+            previews.append((recipient, subject, body))
+            if len(previews) >= count:
+                break
+        return previews
+
+    def send(self, source, batch_size: int = 20, interval: float = 0,
+             progress_callback=None, cancel_event=None) -> Dict:
+        """
+        逐行渲染并分批发送
+
+        Args:
+            source: 收件人表路径,或逐行产生 {列名: 值} 的可迭代对象
+            batch_size: 每批发送的邮件数(一批共用一次SMTP连接)
+            interval: 批次之间的间隔(秒),使用多账号发送池时按可用账号数缩短
+            progress_callback: 进度回调函数
+            cancel_event: 设置后停止发送(threading.Event),每封邮件发送前检查
+
+        Returns:
+            发送结果统计(success/failed 最多保留 MAX_DETAILS 条明细),
+            中途停止时包含 cancelled: True, total 为已处理的行数
+        """
+        results = {
+            'success': [],
+            'failed': [],
+            'total': 0,
+            'success_count': 0,
+            'failed_count': 0
+        }
+        rows = iter_rows(source) if isinstance(source, str) else source
+
+        batch = []
+        for line, recipient, subject, body in self.iter_messages(rows):
+            results['total'] += 1
+            if not EMAIL_PATTERN.match(recipient):
+                self._add_failed(results, recipient or f"第{line}行", "收件人邮箱无效")
+                continue
+
+            batch.append((recipient, subject, body))
+            if len(batch) < batch_size:
+                continue
+
+            self._send_batch(batch, results, cancel_event)
+            batch = []
+            if progress_callback:
+                progress_callback(f"已发送 {results['success_count']} 封,失败 {results['failed_count']} 封...")
+            if cancel_event is not None and cancel_event.is_set():
+                results['cancelled'] = True
+                return results
+            wait_seconds = interval / getattr(self.sender, "account_count", 1)
+            if wait_seconds > 0:
+                if cancel_event is not None:
+                    cancel_event.wait(wait_seconds)
+                else:
+                    time.sleep(wait_seconds)
+
+        if batch:
+            self._send_batch(batch, results, cancel_event)
+            if cancel_event is not None and cancel_event.is_set():
+                results['cancelled'] = True
+        return results
+
+    def _send_batch(self, batch: List[Tuple[str, str, str]], results: Dict, cancel_event=None):
+        """发送一批邮件(共用一次SMTP连接)并累计结果,停止发送后未发送的邮件不计入已处理的行数"""
+        result = self.sender.send_personalized(batch, self.attachments, self.is_html, cancel_event=cancel_event)
+        success, failed = result["success"], result["failed"]
+        if result.get("cancelled"):
+            results['total'] -= len(batch) - len(success) - len(failed)
+
+        results['success_count'] += len(success)
+        results['success'].extend(success[:MAX_DETAILS - len(results['success'])])
+        for item in failed:
+            self._add_failed(results, item["recipient"], item["error"])
+
+    @staticmethod
+    def _add_failed(results: Dict, recipient: str, error: str):
+        results['failed_count'] += 1
+        if len(results['failed']) < MAX_DETAILS:
+            results['failed'].append({'recipient': recipient, 'error': error})
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("邮件合并模块加载成功")
@@ -6,6 +6,7 @@
 
 import sys
 import os
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import Qt
@@ -49,4 +50,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包后的程序需要支持脚本进程池启动子进程
+    multiprocessing.freeze_support()
     main()
@@ -8,7 +8,7 @@
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                             QTabWidget, QPushButton, QLabel, QMessageBox,
                             QSystemTrayIcon, QMenu, QAction, QApplication)
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon
 import sys
 import os
@@ -39,13 +39,26 @@ class MainWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
-        self.config_manager = ConfigManager()
+        # 只读取绘制界面需要的配置,定时任务和保存的脚本在后台读取
+        self.config_manager = ConfigManager(lazy=True)
+        self.config_manager.start_background_load()
         self.auto_reply_manager = AutoReplyManager()
-        self.schedule_manager = ScheduleManager()
+        self.schedule_manager = ScheduleManager(
+            spread_window=self.config_manager.get_scheduler_settings().get("spread_window", 0)
+        )
 
         self.init_ui()
         self.setup_tray()
 
+        # 定期检查配置是否被后台服务或手工编辑修改,只刷新受影响的标签页
+        self.config_manager.add_change_listener(self.on_config_changed)
+        self.config_watch_timer = QTimer(self)
+        self.config_watch_timer.timeout.connect(self.config_manager.check_for_changes)
+        self.config_watch_timer.start(2000)
+
+        # 窗口显示后再预先导入脚本常用的numpy/pandas
+        QTimer.singleShot(1000, self.send_email_tab.script_executor.warm_up)
+
     def init_ui(self):
         """初始化UI"""
         self.setWindowTitle("寻拟邮件工具")
@@ -117,6 +130,18 @@ class MainWindow(QMainWindow):
         # 底部状态栏
         self.statusBar().showMessage("就绪")
 
+    def on_config_changed(self, sections):
+        """配置被外部修改后刷新相关的标签页"""
+        if "email_accounts" in sections:
+            self.account_tab.load_accounts()
+            self.send_email_tab.refresh_accounts()
+        if "email_accounts" in sections or "auto_reply" in sections:
+            self.auto_reply_tab.refresh_accounts()
+            self.auto_reply_tab.load_auto_reply_status()
+        if {"scheduled_tasks", "scheduler", "email_accounts"} & set(sections):
+            self.schedule_tab.reload_from_config(sections)
+        self.update_status(f"配置已被外部修改,已重新加载: {', '.join(sections)}")
+
     def setup_tray(self):
         """设置系统托盘"""
         self.tray_icon = QSystemTrayIcon(self)
@@ -165,6 +190,8 @@ class MainWindow(QMainWindow):
         else:
             # 保存发送邮件页面的状态
             self.send_email_tab.save_state()
+            self.send_email_tab.shutdown()
+            self.config_manager.flush()
             event.accept()
 
     def quit_application(self):
@@ -184,6 +211,10 @@ class MainWindow(QMainWindow):
             # 停止所有服务
             self.auto_reply_manager.stop_all()
             self.schedule_manager.stop_scheduler()
+            self.send_email_tab.shutdown()
+
+            # 写入尚未保存的配置
+            self.config_manager.flush()
 
             # 退出程序
             QApplication.quit()
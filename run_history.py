@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+定时任务执行历史模块
+记录每次执行的计划时间、实际开始时间、延迟、耗时和发送结果
+"""
+
+import os
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Optional, Iterable
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数(线性插值)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class RunHistory:
+    """定时任务执行历史(内存有界, 文件滚动)"""
+
+    def __init__(self, history_file: str = "run_history.jsonl", max_records: int = 1000,
+                 max_file_size: int = 1024 * 1024, backup_count: int = 3):
+        """
+        初始化执行历史
+
+        Args:
+            history_file: 历史记录文件路径(每行一条JSON记录), None表示只保存在内存
+            max_records: 内存中保留的最近记录数
+            max_file_size: 单个历史文件的最大字节数,超过后滚动
+            backup_count: 保留的滚动文件个数(history_file.1 ~ history_file.N)
+        """
+        self.history_file = history_file
+        self.max_file_size = max_file_size
+        self.backup_count = backup_count
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """从历史文件(含滚动文件,由旧到新)加载最近的记录"""
+        if not self.history_file:
+            return
+
+        files = [f"{self.history_file}.{i}" for i in range(self.backup_count, 0, -1)]
+        files.append(self.history_file)
+
+        for path in files:
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            self.records.append(json.loads(line))
+            except Exception as e:
+                print(f"加载执行历史失败 {path}: {e}")
+
+    def _rotate(self):
+        """滚动历史文件"""
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.history_file}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.history_file}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.history_file, f"{self.history_file}.1")
+        else:
+            os.remove(self.history_file)
+
+    def _append_to_file(self, record: Dict):
+        """追加一条记录到历史文件"""
+        if not self.history_file:
+            return
+
+        try:
+            if os.path.exists(self.history_file) and \
+                    os.path.getsize(self.history_file) >= self.max_file_size:
+                self._rotate()
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"写入执行历史失败: {e}")
+
+    def record(self, task_name: str, scheduled_time: Optional[datetime],
+               start_time: datetime, end_time: datetime, result: Dict) -> Dict:
+        """
+        记录一次任务执行
+
+        Args:
+            task_name: 任务名称
+            scheduled_time: 计划执行时间(未知时为None)
+            start_time: 实际开始时间
+            end_time: 结束时间
+            result: 发送结果字典(EmailSender.send_email的返回值或包含error的字典)
+
+        Returns:
+            写入的记录
+        """
+        if scheduled_time is None:
+            scheduled_time = start_time
+
+        record = {
+            "task_name": task_name,
+            "scheduled_time": scheduled_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "lateness": round(max(0.0, (start_time - scheduled_time).total_seconds()), 3),
+            "duration": round((end_time - start_time).total_seconds(), 3),
+            "success_count": result.get("success_count", 0),
+            "failed_count": result.get("failed_count", 0),
+            "error": result.get("error")
+        }
+
+        with self._lock:
+            self.records.append(record)
+            self._append_to_file(record)
+
+        return record
+
+    def get_records(self, task_name: str = None, limit: int = None) -> List[Dict]:
+        """获取执行记录(按时间从新到旧)"""
+        with self._lock:
+            records = list(self.records)
+
+        if task_name:
+            records = [r for r in records if r["task_name"] == task_name]
+
+        records.reverse()
+        return records[:limit] if limit else records
+
+    def lateness_percentiles(self, percentiles: Iterable[float] = (50, 90, 99),
+                             task_name: str = None) -> Dict[float, float]:
+        """获取延迟(秒)的百分位数"""
+        lateness = [r["lateness"] for r in self.get_records(task_name)]
+        return {p: percentile(lateness, p) for p in percentiles}
+
+    def get_summary(self, task_name: str = None) -> Dict:
+        """获取执行统计摘要"""
+        records = self.get_records(task_name)
+        return {
+            "runs": len(records),
+            "failed_runs": sum(1 for r in records if r.get("error") or r.get("failed_count", 0) > 0),
+            "lateness": self.lateness_percentiles(task_name=task_name),
+            "max_lateness": max((r["lateness"] for r in records), default=0.0),
+            "avg_duration": (sum(r["duration"] for r in records) / len(records)) if records else 0.0
+        }
+
+    def reload(self):
+        """重新从历史文件加载(用于查看其他进程写入的记录)"""
+        with self._lock:
+            self.records.clear()
+            self._load()
+
+    def clear(self):
+        """清空内存中的执行记录"""
+        with self._lock:
+            self.records.clear()
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("执行历史模块加载成功")
@@ -8,9 +8,14 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                             QLabel, QLineEdit, QTextEdit, QComboBox,
                             QMessageBox, QGroupBox, QFormLayout,
                             QTableWidget, QTableWidgetItem, QHeaderView,
-                            QTimeEdit, QDialog, QDialogButtonBox)
-from PyQt5.QtCore import Qt, QTime
+                            QTimeEdit, QDialog, QDialogButtonBox, QCheckBox,
+                            QSpinBox, QTableView, QStyledItemDelegate,
+                            QListWidget, QListWidgetItem)
+from PyQt5.QtCore import (Qt, QTime, QTimer, QAbstractTableModel, QModelIndex,
+                          QEvent, pyqtSignal)
+from PyQt5.QtGui import QColor
 from email_sender import EmailSender
+from headless import read_daemon_status
 
 
 class AddTaskDialog(QDialog):
@@ -65,6 +70,32 @@ class AddTaskDialog(QDialog):
         self.time_edit.setTime(QTime(9, 0))
         form_layout.addRow("执行时间:", self.time_edit)
 
+        # 最晚执行时间(错峰模式下不会超过该时间)
+        deadline_layout = QHBoxLayout()
+        self.deadline_checkbox = QCheckBox("限制最晚执行时间")
+        self.deadline_edit = QTimeEdit()
+        self.deadline_edit.setDisplayFormat("HH:mm")
+        self.deadline_edit.setEnabled(False)
+        self.deadline_checkbox.toggled.connect(self.deadline_edit.setEnabled)
+        # 勾选前最晚时间跟随执行时间变化,默认为执行时间加上错峰窗口
+        self.time_edit.timeChanged.connect(self.update_default_deadline)
+        self.update_default_deadline()
+        deadline_layout.addWidget(self.deadline_checkbox)
+        deadline_layout.addWidget(self.deadline_edit)
+        deadline_layout.addStretch()
+        form_layout.addRow("最晚时间:", deadline_layout)
+
+        # 前置任务: 勾选后不再按时间执行,而是在前置任务全部成功后立即执行
+        self.depends_list = QListWidget()
+        self.depends_list.setMaximumHeight(80)
+        for task in self.config_manager.get_scheduled_tasks():
+            item = QListWidgetItem(task["task_name"])
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            self.depends_list.addItem(item)
+        self.depends_list.itemChanged.connect(self.on_depends_changed)
+        form_layout.addRow("前置任务:", self.depends_list)
+
         layout.addLayout(form_layout)
 
         # 按钮
@@ -75,6 +106,28 @@ class AddTaskDialog(QDialog):
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
 
+    def update_default_deadline(self):
+        """未勾选最晚时间时,把它设为执行时间加上错峰窗口(按分钟向上取整)"""
+        if self.deadline_checkbox.isChecked():
+            return
+        spread = self.config_manager.get_scheduler_settings().get("spread_window", 0)
+        self.deadline_edit.setTime(self.time_edit.time().addSecs((spread + 59) // 60 * 60))
+
+    def get_depends_on(self):
+        """获取勾选的前置任务"""
+        return [
+            self.depends_list.item(i).text()
+            for i in range(self.depends_list.count())
+            if self.depends_list.item(i).checkState() == Qt.Checked
+        ]
+
+    def on_depends_changed(self):
+        """有前置任务时执行时间不生效"""
+        time_based = not self.get_depends_on()
+        self.time_edit.setEnabled(time_based)
+        self.deadline_checkbox.setEnabled(time_based)
+        self.deadline_edit.setEnabled(time_based and self.deadline_checkbox.isChecked())
+
     def get_task_data(self):
         """获��任务数据"""
         recipients = []
@@ -89,23 +142,212 @@ class AddTaskDialog(QDialog):
             "recipients": recipients,
             "subject": self.subject_input.text().strip(),
             "content": self.content_input.toPlainText().strip(),
-            "schedule_time": self.time_edit.time().toString("HH:mm")
+            "schedule_time": self.time_edit.time().toString("HH:mm"),
+            "deadline": (self.deadline_edit.time().toString("HH:mm")
+                         if self.deadline_checkbox.isChecked() else None),
+            "depends_on": self.get_depends_on()
         }
 
 
+class RunHistoryDialog(QDialog):
+    """任务执行历史对话框"""
+
+    def __init__(self, schedule_manager, parent=None):
+        super().__init__(parent)
+        self.schedule_manager = schedule_manager
+        self.setWindowTitle("执行历史")
+        self.resize(800, 450)
+        self.init_ui()
+
+    def init_ui(self):
+        """初始化UI"""
+        layout = QVBoxLayout(self)
+
+        records = self.schedule_manager.get_run_history(limit=200)
+
+        table = QTableWidget()
+        table.setColumnCount(7)
+        table.setHorizontalHeaderLabels([
+            "任务名称", "计划时间", "开始时间", "延迟(秒)", "耗时(秒)", "成功", "失败"
+        ])
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.setRowCount(len(records))
+
+        for i, record in enumerate(records):
+            table.setItem(i, 0, QTableWidgetItem(record["task_name"]))
+            table.setItem(i, 1, QTableWidgetItem(record["scheduled_time"]))
+            table.setItem(i, 2, QTableWidgetItem(record["start_time"]))
+            table.setItem(i, 3, QTableWidgetItem(f"{record['lateness']:.1f}"))
+            table.setItem(i, 4, QTableWidgetItem(f"{record['duration']:.1f}"))
+            table.setItem(i, 5, QTableWidgetItem(str(record["success_count"])))
+            failed_text = record["error"] if record.get("error") else str(record["failed_count"])
+            table.setItem(i, 6, QTableWidgetItem(failed_text))
+
+        layout.addWidget(table)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Close)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+
+class TaskTableModel(QAbstractTableModel):
+    """定时任务表格模型(按行增量更新)"""
+
+    HEADERS = ["任务名称", "发件人", "收件人数", "执行时间", "下次执行", "操作"]
+    DELETE_COLUMN = 5
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []  # 每行: [任务名称, 发件人, 收件人数, 执行时间, 下次执行]
+        self.row_index = {}  # task_name -> 行号
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            if index.column() == self.DELETE_COLUMN:
+                return "删除"
+            return self.rows[index.row()][index.column()]
+        return None
+
+    @staticmethod
+    def _make_row(task, task_info):
+        """根据任务配置和调度状态生成一行数据"""
+        # 执行时间(错峰后显示实际执行时间, 依赖任务显示前置任务)
+        if task.get("depends_on"):
+            schedule_text = f"在 {', '.join(task['depends_on'])} 之后"
+        else:
+            schedule_text = task["schedule_time"]
+            run_time = task_info.get("run_time") if task_info else None
+            if run_time and run_time != schedule_text + ":00":
+                schedule_text += f" → {run_time}"
+
+        return [
+            task["task_name"],
+            task["sender_email"],
+            str(len(task["recipients"])),
+            schedule_text,
+            task_info["next_run"] if task_info else "未知"
+        ]
+
+    def set_tasks(self, tasks, status_lookup):
+        """重置全部任务(仅在首次加载或手动刷新时使用)"""
+        self.beginResetModel()
+        self.rows = [self._make_row(task, status_lookup(task["task_name"])) for task in tasks]
+        self.row_index = {row[0]: i for i, row in enumerate(self.rows)}
+        self.endResetModel()
+
+    def add_task(self, task, task_info):
+        """在末尾插入一行"""
+        if task["task_name"] in self.row_index:
+            self.update_task(task, task_info)
+            return
+
+        row = len(self.rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.append(self._make_row(task, task_info))
+        self.row_index[task["task_name"]] = row
+        self.endInsertRows()
+
+    def update_task(self, task, task_info):
+        """只更新变化任务所在的行"""
+        row = self.row_index.get(task["task_name"])
+        if row is None:
+            return
+
+        self.rows[row] = self._make_row(task, task_info)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.DELETE_COLUMN - 1))
+
+    def remove_task(self, task_name):
+        """删除一行"""
+        row = self.row_index.get(task_name)
+        if row is None:
+            return
+
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        del self.row_index[task_name]
+        for name, i in self.row_index.items():
+            if i > row:
+                self.row_index[name] = i - 1
+        self.endRemoveRows()
+
+    def task_name_at(self, row):
+        """获取指定行的任务名称"""
+        return self.rows[row][0]
+
+
+class DeleteButtonDelegate(QStyledItemDelegate):
+    """操作列的删除按钮(整列共用一个委托,不为每行创建控件)"""
+
+    clicked = pyqtSignal(int)
+
+    def _button_rect(self, option):
+        return option.rect.adjusted(4, 3, -4, -3)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(painter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor("#e74c3c"))
+        rect = self._button_rect(option)
+        painter.drawRoundedRect(rect, 3, 3)
+        painter.setPen(QColor("white"))
+        painter.drawText(rect, Qt.AlignCenter, index.data())
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and \
+                self._button_rect(option).contains(event.pos()):
+            self.clicked.emit(index.row())
+            return True
+        return False
+
+
 class ScheduleTab(QWidget):
     """定时任务管理标签页"""
 
+    # 调度线程中的任务状态变化通过信号转到界面线程处理
+    task_status_changed = pyqtSignal(str)
+
     def __init__(self, config_manager, schedule_manager, main_window):
         super().__init__()
         self.config_manager = config_manager
         self.schedule_manager = schedule_manager
         self.main_window = main_window
+        # 已有后台服务(headless.py)运行时,界面只展示状态,不重复执行任务
+        self.daemon_status = read_daemon_status()
+
         self.init_ui()
-        self.load_tasks()
+
+        # 调度器推送的任务状态变化只刷新对应的行
+        self.task_status_changed.connect(self.refresh_task_row)
+        self.schedule_manager.add_listener(self.task_status_changed.emit)
+
+        # 窗口显示后再从配置恢复定时任务(任务列表可能很大)
+        QTimer.singleShot(0, self.load_initial_tasks)
+
+        # 定期刷新执行统计
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_run_stats)
+        self.stats_timer.start(30000)
 
         # 启动调度器
-        self.schedule_manager.start_scheduler()
+        if self.daemon_status:
+            self.attach_to_daemon()
+        else:
+            self.schedule_manager.start_scheduler()
 
     def init_ui(self):
         """初始化UI"""
@@ -142,6 +384,18 @@ class ScheduleTab(QWidget):
 
         status_layout.addStretch()
 
+        # 错峰窗口: 同一时刻的任务分散到该窗口内执行,避免集中登录SMTP被限流
+        status_layout.addWidget(QLabel("错峰窗口:"))
+        self.spread_spinbox = QSpinBox()
+        self.spread_spinbox.setRange(0, 3600)
+        self.spread_spinbox.setSuffix(" 秒")
+        self.spread_spinbox.setToolTip("同一时间的任务会按任务名确定性地分散到该窗口内执行,0表示不错峰")
+        self.spread_spinbox.setValue(
+            self.config_manager.get_scheduler_settings().get("spread_window", 0)
+        )
+        self.spread_spinbox.editingFinished.connect(self.change_spread_window)
+        status_layout.addWidget(self.spread_spinbox)
+
         self.toggle_scheduler_btn = QPushButton("停止调度器")
         self.toggle_scheduler_btn.setStyleSheet("""
             QPushButton {
@@ -172,14 +426,21 @@ class ScheduleTab(QWidget):
         """)
         task_layout = QVBoxLayout()
 
-        self.task_table = QTableWidget()
-        self.task_table.setColumnCount(6)
-        self.task_table.setHorizontalHeaderLabels([
-            "任务名称", "发件人", "收件人数", "执行时间", "下次执行", "操作"
-        ])
+        self.task_model = TaskTableModel(self)
+        self.task_table = QTableView()
+        self.task_table.setModel(self.task_model)
+        self.task_table.setSelectionBehavior(QTableView.SelectRows)
+        self.task_table.setEditTriggers(QTableView.NoEditTriggers)
+        self.task_table.verticalHeader().setDefaultSectionSize(32)
         self.task_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+
+        self.delete_delegate = DeleteButtonDelegate(self.task_table)
+        self.delete_delegate.clicked.connect(
+            lambda row: self.delete_task(self.task_model.task_name_at(row))
+        )
+        self.task_table.setItemDelegateForColumn(TaskTableModel.DELETE_COLUMN, self.delete_delegate)
         self.task_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 border: 1px solid #ddd;
                 gridline-color: #ddd;
             }
@@ -192,6 +453,18 @@ class ScheduleTab(QWidget):
         """)
         task_layout.addWidget(self.task_table)
 
+        # 执行统计(延迟百分位数)
+        stats_layout = QHBoxLayout()
+        self.stats_label = QLabel("执行统计: 暂无记录")
+        self.stats_label.setStyleSheet("QLabel { color: #7f8c8d; padding: 5px; }")
+        stats_layout.addWidget(self.stats_label)
+        stats_layout.addStretch()
+
+        history_btn = QPushButton("执行历史")
+        history_btn.clicked.connect(self.show_run_history)
+        stats_layout.addWidget(history_btn)
+        task_layout.addLayout(stats_layout)
+
         task_group.setLayout(task_layout)
         layout.addWidget(task_group)
 
@@ -240,6 +513,12 @@ class ScheduleTab(QWidget):
         """刷新账号列表(由主窗口调用)"""
         pass
 
+    def attach_to_daemon(self):
+        """连接到后台服务: 任务由后台服务执行,界面只显示状态和执行历史"""
+        self.status_label.setText(f"调度器状态: 由后台服务运行 (PID {self.daemon_status['pid']})")
+        self.toggle_scheduler_btn.setEnabled(False)
+        self.main_window.update_status("检测到后台服务,定时任务由后台服务执行")
+
     def toggle_scheduler(self):
         """切换调度器状态"""
         if self.schedule_manager.is_running():
@@ -255,6 +534,16 @@ class ScheduleTab(QWidget):
             self.toggle_scheduler_btn.setText("停止调度器")
             self.main_window.update_status("定时任务调度器已启动")
 
+    def change_spread_window(self):
+        """修改错峰窗口"""
+        seconds = self.spread_spinbox.value()
+        if seconds == self.config_manager.get_scheduler_settings().get("spread_window", 0):
+            return
+
+        self.config_manager.set_spread_window(seconds)
+        self.schedule_manager.set_spread_window(seconds)
+        self.main_window.update_status(f"错峰窗口已设置为 {seconds} 秒")
+
     def add_task(self):
         """添加定时任务"""
         accounts = self.config_manager.get_email_accounts()
@@ -286,7 +575,9 @@ class ScheduleTab(QWidget):
                 subject=task_data["subject"],
                 content=task_data["content"],
                 schedule_time=task_data["schedule_time"],
-                sender_email=task_data["sender_email"]
+                sender_email=task_data["sender_email"],
+                deadline=task_data["deadline"],
+                depends_on=task_data["depends_on"]
             ):
                 # 添加到调度器
                 credentials = self.config_manager.get_account_credentials(task_data["sender_email"])
@@ -299,68 +590,95 @@ class ScheduleTab(QWidget):
 
                 # 添加发送器和任务
                 self.schedule_manager.add_email_sender(task_data["sender_email"], sender)
-                self.schedule_manager.add_scheduled_task(
+                if not self.schedule_manager.add_scheduled_task(
                     task_name=task_data["task_name"],
                     schedule_time=task_data["schedule_time"],
                     sender_email=task_data["sender_email"],
                     recipients=task_data["recipients"],
                     subject=task_data["subject"],
-                    content=task_data["content"]
-                )
+                    content=task_data["content"],
+                    deadline=task_data["deadline"],
+                    depends_on=task_data["depends_on"]
+                ):
+                    self.config_manager.remove_scheduled_task(task_data["task_name"])
+                    QMessageBox.warning(self, "失败", "添加任务失败(前置任务可能形成了循环依赖)")
+                    return
 
                 QMessageBox.information(self, "成功", f"定时任务 '{task_data['task_name']}' 添加成功")
-                self.load_tasks()
                 self.main_window.update_status(f"定时任务 '{task_data['task_name']}' 已添加")
             else:
-                QMessageBox.warning(self, "失败", "添加任务失败")
+                QMessageBox.warning(self, "失败", "添加任务失败(任务名称可能已存在)")
+
+    def load_initial_tasks(self):
+        """从配置恢复定时任务并显示"""
+        self.schedule_manager.load_tasks_from_config(self.config_manager)
+        self.load_tasks()
+
+    def reload_from_config(self, sections):
+        """配置被外部修改后同步调度器和任务列表"""
+        if "scheduler" in sections:
+            spread_window = self.config_manager.get_scheduler_settings().get("spread_window", 0)
+            self.spread_spinbox.setValue(spread_window)
+            if not self.daemon_status:
+                self.schedule_manager.set_spread_window(spread_window)
+        if not self.daemon_status:
+            self.schedule_manager.sync_tasks_from_config(self.config_manager)
+        self.load_tasks()
 
     def load_tasks(self):
-        """加载任务列表"""
+        """加载任务列表(全部重建,用于首次加载和手动刷新)"""
         tasks = self.config_manager.get_scheduled_tasks()
-        self.task_table.setRowCount(len(tasks))
-
-        for i, task in enumerate(tasks):
-            # 任务名称
-            self.task_table.setItem(i, 0, QTableWidgetItem(task["task_name"]))
-
-            # 发件人
-            self.task_table.setItem(i, 1, QTableWidgetItem(task["sender_email"]))
-
-            # 收件人数
-            self.task_table.setItem(i, 2, QTableWidgetItem(str(len(task["recipients"]))))
-
-            # 执行时间
-            self.task_table.setItem(i, 3, QTableWidgetItem(task["schedule_time"]))
-
-            # 下次执行时间
-            task_info = self.schedule_manager.get_task_status(task["task_name"])
-            next_run = task_info["next_run"] if task_info else "未知"
-            self.task_table.setItem(i, 4, QTableWidgetItem(next_run))
-
-            # 删除按钮
-            delete_btn = QPushButton("删除")
-            delete_btn.setStyleSheet("""
-                QPushButton {
-                    background-color: #e74c3c;
-                    color: white;
-                    padding: 5px 10px;
-                    border-radius: 3px;
-                }
-                QPushButton:hover {
-                    background-color: #c0392b;
-                }
-            """)
-            delete_btn.clicked.connect(
-                lambda checked, name=task["task_name"]: self.delete_task(name)
-            )
-            self.task_table.setCellWidget(i, 5, delete_btn)
+        self.task_model.set_tasks(tasks, self.schedule_manager.get_task_status)
+        self.update_run_stats()
+
+    def refresh_task_row(self, task_name):
+        """任务状态变化时只更新该任务所在的行"""
+        task = self.config_manager.get_scheduled_task(task_name)
+        if task is None:
+            self.task_model.remove_task(task_name)
+            return
+
+        task_info = self.schedule_manager.get_task_status(task_name)
+        if task_name in self.task_model.row_index:
+            self.task_model.update_task(task, task_info)
+        else:
+            self.task_model.add_task(task, task_info)
+
+    def update_run_stats(self):
+        """更新执行统计(延迟百分位数)"""
+        if self.daemon_status:
+            # 执行历史由后台服务写入,重新读取
+            self.schedule_manager.history.reload()
+
+        summary = self.schedule_manager.get_run_summary()
+        if summary["runs"] == 0:
+            self.stats_label.setText("执行统计: 暂无记录")
+            return
+
+        lateness = summary["lateness"]
+        self.stats_label.setText(
+            f"执行统计: 共 {summary['runs']} 次, 失败 {summary['failed_runs']} 次 | "
+            f"延迟 P50 {lateness[50]:.1f}s, P90 {lateness[90]:.1f}s, "
+            f"P99 {lateness[99]:.1f}s, 最大 {summary['max_lateness']:.1f}s | "
+            f"平均耗时 {summary['avg_duration']:.1f}s"
+        )
+
+    def show_run_history(self):
+        """显示执行历史"""
+        dialog = RunHistoryDialog(self.schedule_manager, self)
+        dialog.exec_()
 
     def delete_task(self, task_name):
         """删除任务"""
+        message = f"确定要删除任务 '{task_name}' 吗？"
+        dependents = self.schedule_manager.scheduler.get_dependents(task_name)
+        if dependents:
+            message += f"\n\n以下任务依赖该任务,删除后将不会再执行:\n{', '.join(dependents)}"
+
         reply = QMessageBox.question(
             self,
             "确认删除",
-            f"确定要删除任务 '{task_name}' 吗？",
+            message,
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No
         )
@@ -371,8 +689,8 @@ class ScheduleTab(QWidget):
 
             # 从配置中删除
             if self.config_manager.remove_scheduled_task(task_name):
+                self.task_model.remove_task(task_name)
                 QMessageBox.information(self, "成功", f"任务 '{task_name}' 已删除")
-                self.load_tasks()
                 self.main_window.update_status(f"任务 '{task_name}' 已删除")
             else:
                 QMessageBox.warning(self, "失败", "删除任务失败")
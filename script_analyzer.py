@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+脚本预检模块
+执行前分析脚本的语法树: 导入的模块、读取/写入的文件、禁止的调用(input、subprocess等),
+以及结果是否只取决于输入(可以缓存)、能否与其他脚本并行执行。
+同一脚本只分析一次(按脚本内容的哈希缓存)
+"""
+
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+
+
+# 禁止调用的函数: 完整名称 -> 原因
+FORBIDDEN_CALLS = {
+    "input": "会等待键盘输入,使程序卡住",
+    "breakpoint": "会进入调试器,使程序卡住",
+    "exit": "会结束整个程序",
+    "quit": "会结束整个程序",
+    "sys.exit": "会结束整个程序",
+    "os._exit": "会结束整个程序",
+    "os.system": "会启动外部程序",
+    "os.popen": "会启动外部程序",
+    "os.fork": "会复制整个程序进程",
+    "os.kill": "会结束其他进程",
+}
+
+# 禁止调用的函数名前缀(os.execv、os.spawnl等)
+FORBIDDEN_PREFIXES = {
+    "os.exec": "会替换整个程序进程",
+    "os.spawn": "会启动外部程序",
+}
+
+# 禁止导入的模块: 模块名 -> 原因
+FORBIDDEN_MODULES = {
+    "subprocess": "会启动外部程序",
+    "multiprocessing": "会启动子进程(需要并行时请勾选\"独立进程执行脚本\")",
+    "pty": "会启动外部程序",
+}
+
+# 读取文件的函数(完整名称)
+READ_FUNCTIONS = {
+    "open", "io.open",
+    "pandas.read_excel", "pandas.read_csv", "pandas.read_table", "pandas.read_json",
+    "pandas.read_parquet", "pandas.read_pickle", "pandas.ExcelFile",
+    "numpy.load", "numpy.loadtxt", "numpy.genfromtxt",
+    "openpyxl.load_workbook", "xlrd.open_workbook",
+}
+
+# 写入文件的方法名(DataFrame.to_excel等)
+WRITE_METHODS = {"to_excel", "to_csv", "to_json", "to_parquet", "to_pickle", "save", "savefig"}
+
+# 访问文件系统、环境变量或动态查找函数的调用: 预检无法确定读取了什么,使用后结果不能缓存
+UNTRACKED_CALLS = {
+    "getattr", "__import__", "eval", "exec", "compile", "globals", "vars",
+    "os.listdir", "os.scandir", "os.walk", "os.stat", "os.getenv",
+    "os.path.exists", "os.path.isfile", "os.path.isdir",
+    "os.path.getsize", "os.path.getmtime", "os.path.getctime",
+    "numpy.fromfile", "numpy.memmap",
+}
+
+# 同上,按名称前缀匹配(pandas.read_sql、glob.glob、importlib.import_module等)
+UNTRACKED_PREFIXES = ("pandas.read_", "glob.", "importlib.", "shutil.", "fileinput.",
+                      "os.environ", "builtins.", "__builtins__")
+
+# 同上,按方法名匹配(pathlib.Path(...).read_text()等,对象类型无法确定)
+UNTRACKED_METHODS = {"read_text", "read_bytes", "open", "iterdir", "glob", "rglob",
+                     "exists", "is_file", "is_dir", "stat"}
+
+# 结果随时间或随机变化的函数,使用后结果不能缓存
+VOLATILE_CALLS = {
+    "datetime.now", "datetime.today", "datetime.utcnow", "date.today",
+    "datetime.datetime.now", "datetime.datetime.today", "datetime.date.today",
+    "time.time", "time.localtime", "time.strftime", "pandas.Timestamp.now", "pandas.Timestamp.today",
+}
+
+# 结果取决于外部数据(网络、数据库、随机数)的模块,导入后结果不能缓存
+VOLATILE_MODULES = {"random", "uuid", "requests", "urllib", "http", "socket", "smtplib",
+                    "imaplib", "pymysql", "sqlite3", "psycopg2", "pymongo"}
+
+# ScriptExecutor 预先放入执行环境的名称
+PRELOADED_NAMES = {"pd": "pandas", "np": "numpy", "os": "os", "pandas": "pandas", "numpy": "numpy",
+                   "datetime": "datetime.datetime", "timedelta": "datetime.timedelta"}
+
+# 保留的分析结果数
+MAX_CACHED_REPORTS = 256
+
+
+def _dotted_name(node) -> Optional[str]:
+    """a.b.c 形式的表达式转为字符串,其他表达式返回None"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return ".".join(reversed(parts))
+    return None
+
+
+def _context_key(node) -> Optional[str]:
+    """context['file'] 或 context.get('file') 返回 'file',其他表达式返回None"""
+    if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name)
+            and node.value.id == "context" and isinstance(node.slice, ast.Constant)):
+        return str(node.slice.value)
+    if (isinstance(node, ast.Call) and _dotted_name(node.func) == "context.get"
+            and node.args and isinstance(node.args[0], ast.Constant)):
+        return str(node.args[0].value)
+    return None
+
+
+class _Visitor(ast.NodeVisitor):
+    """收集导入、调用和文件访问"""
+
+    def __init__(self, analyzer: "ScriptAnalyzer"):
+        self.analyzer = analyzer
+        self.aliases = dict(PRELOADED_NAMES)
+        self.imports = []
+        self.errors = []
+        self.file_reads = []
+        self.file_writes = []
+        self.volatile = []
+        self.untracked = []
+        self._called = set()  # 作为调用的函数出现的表达式,不再按引用检查
+        self.paths = {}  # 变量名 -> 赋值的路径(字符串常量或context变量)
+
+    def _module(self, name: str, line: int):
+        top = name.split(".")[0]
+        if top not in self.imports:
+            self.imports.append(top)
+        allowed = self.analyzer.allowed_modules
+        if top in FORBIDDEN_MODULES and (allowed is None or top not in allowed):
+            self.errors.append({"line": line, "name": top,
+                                "message": f"第{line}行: 不允许导入 {top}({FORBIDDEN_MODULES[top]})"})
+        elif allowed is not None and top not in allowed:
+            self.errors.append({"line": line, "name": top,
+                                "message": f"第{line}行: 模块 {top} 不在允许导入的列表中"})
+        if top in VOLATILE_MODULES:
+            self.volatile.append(f"第{line}行: 导入 {top}")
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._module(alias.name, node.lineno)
+            if alias.asname:
+                self.aliases[alias.asname] = alias.name
+            else:
+                top = alias.name.split(".")[0]
+                self.aliases[top] = top
+
+    def visit_ImportFrom(self, node):
+        if node.module and not node.level:
+            self._module(node.module, node.lineno)
+            for alias in node.names:
+                self.aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+
+    def _resolve(self, node) -> Optional[str]:
+        """调用的函数的完整名称(按导入的别名展开)"""
+        name = _dotted_name(node)
+        if name is None:
+            return None
+        first, _, rest = name.partition(".")
+        if first in self.aliases:
+            return f"{self.aliases[first]}.{rest}" if rest else self.aliases[first]
+        return name
+
+    def _path(self, node) -> Dict[str, Any]:
+        """文件路径参数: 字符串常量、context中的变量或其他表达式"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return {"path": node.value}
+        key = _context_key(node)
+        if key is not None:
+            return {"context_key": key}
+        if isinstance(node, ast.Name) and node.id in self.paths:
+            return dict(self.paths[node.id])
+        return {"expression": ast.unparse(node)}
+
+    def visit_Assign(self, node):
+        # 记录 path = "固定路径" / path = context['file'],之后 read_excel(path) 可以确定读取的文件
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            path = self._path(node.value)
+            if "expression" in path:
+                self.paths.pop(node.targets[0].id, None)
+            else:
+                self.paths[node.targets[0].id] = path
+        self.generic_visit(node)
+
+    def _untracked(self, name: Optional[str]) -> bool:
+        """是否为预检无法确定读取内容的函数(读取文件的函数已单独记录)"""
+        if name is None or name in READ_FUNCTIONS:
+            return False
+        return name in UNTRACKED_CALLS or name.startswith(UNTRACKED_PREFIXES)
+
+    def _check_reference(self, node):
+        # reader = pd.read_sql 或 map(open, files) 之类不经调用的引用,同样无法确定读取的文件
+        if id(node) in self._called or not isinstance(node.ctx, ast.Load):
+            return
+        name = self._resolve(node)
+        if name in READ_FUNCTIONS or self._untracked(name):
+            self.untracked.append(f"第{node.lineno}行: 引用 {name}")
+
+    def visit_Name(self, node):
+        self._check_reference(node)
+
+    def visit_Attribute(self, node):
+        self._check_reference(node)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        self._called.add(id(node.func))
+        name = self._resolve(node.func)
+        line = node.lineno
+        if name is not None:
+            reason = FORBIDDEN_CALLS.get(name) or next(
+                (reason for prefix, reason in FORBIDDEN_PREFIXES.items() if name.startswith(prefix)), None)
+            module = name.split(".")[0]
+            if (reason is None and module in FORBIDDEN_MODULES
+                    and module not in (self.analyzer.allowed_modules or ())):
+                reason = FORBIDDEN_MODULES[module]
+            if reason is not None and name not in self.analyzer.allowed_calls:
+                self.errors.append({"line": line, "name": name,
+                                    "message": f"第{line}行: 不允许调用 {name}({reason})"})
+
+            if name in VOLATILE_CALLS:
+                self.volatile.append(f"第{line}行: 调用 {name}")
+            if self._untracked(name):
+                self.untracked.append(f"第{line}行: 调用 {name}")
+
+            if name in READ_FUNCTIONS and node.args:
+                access = dict(self._path(node.args[0]), function=name, line=line)
+                mode = node.args[1] if len(node.args) > 1 else next(
+                    (kw.value for kw in node.keywords if kw.arg == "mode"), None)
+                writes = (name in ("open", "io.open") and isinstance(mode, ast.Constant)
+                          and any(flag in str(mode.value) for flag in "wax+"))
+                (self.file_writes if writes else self.file_reads).append(access)
+
+        if isinstance(node.func, ast.Attribute) and node.func.attr in WRITE_METHODS and node.args:
+            self.file_writes.append(dict(self._path(node.args[0]), function=node.func.attr, line=line))
+        elif (isinstance(node.func, ast.Attribute) and node.func.attr in UNTRACKED_METHODS
+              and name not in READ_FUNCTIONS and not self._untracked(name)):
+            self.untracked.append(f"第{line}行: 调用 .{node.func.attr}()")
+
+        self.generic_visit(node)
+
+
+def dependency_files(report: Dict[str, Any], context: Dict[str, Any] = None) -> List[str]:
+    """
+    脚本读取的文件: 固定路径加上作为路径读取的context变量的值
+
+    Args:
+        report: ScriptAnalyzer.analyze 的结果
+        context: 本次执行的上下文变量
+    """
+    files = list(report["dependencies"])
+    context = context or {}
+    for key in report["context_files"]:
+        value = context.get(key)
+        if isinstance(value, str):
+            files.append(value)
+    return files
+
+
+class ScriptAnalyzer:
+    """脚本预检"""
+
+    def __init__(self, allowed_modules: Iterable[str] = None, allowed_calls: Iterable[str] = ()):
+        """
+        初始化预检(允许列表只能在创建执行器或进程池时传入,配置文件和界面中没有此设置)
+
+        Args:
+            allowed_modules: 允许导入的模块(顶层模块名), None表示除 FORBIDDEN_MODULES 外都允许;
+                             列出 FORBIDDEN_MODULES 中的模块时也允许导入
+            allowed_calls: 虽在禁止列表中但仍允许调用的函数(完整名称,如 "os.system")
+        """
+        self.allowed_modules = set(allowed_modules) if allowed_modules is not None else None
+        self.allowed_calls = set(allowed_calls)
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, script_code: str) -> Dict[str, Any]:
+        """
+        分析脚本(同一脚本只分析一次,返回的字典不要修改)
+
+        Returns:
+            {
+                "ok": 是否可以执行(没有禁止的导入和调用),
+                "errors": [{"line", "name", "message"}] 禁止的导入和调用,
+                "syntax_error": 语法错误信息(有语法错误时不做其他分析),
+                "imports": 导入的顶层模块名,
+                "file_reads": [{"path" 或 "context_key" 或 "expression", "function", "line"}],
+                "file_writes": 同上,
+                "dependencies": 脚本读取的固定路径的文件,
+                "context_files": 作为文件路径读取的context变量(如 "file"),
+                "volatile": 使结果随时间变化的调用和导入(如 datetime.now、random),
+                "untracked": 无法确定读取内容的调用(如 os.listdir、Path.read_text、getattr),
+                "cacheable": 结果是否只取决于context和读取的文件(所有读取都能识别),
+                "parallel_safe": 是否可以与其他脚本并行执行(不写入文件),
+                "batch": 是否定义了 generate_contents(contexts)
+            }
+        """
+        key = hashlib.sha256(script_code.encode("utf-8")).hexdigest()
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+                return report
+
+        report = self._analyze(script_code)
+        with self._lock:
+            self._reports[key] = report
+            while len(self._reports) > MAX_CACHED_REPORTS:
+                self._reports.popitem(last=False)
+        return report
+
+    def _analyze(self, script_code: str) -> Dict[str, Any]:
+        try:
+            tree = ast.parse(script_code)
+        except (SyntaxError, ValueError) as e:
+            # 语法错误由执行时报告
+            return {"ok": True, "errors": [], "syntax_error": str(e), "imports": [],
+                    "file_reads": [], "file_writes": [], "dependencies": [], "context_files": [],
+                    "volatile": [], "untracked": [], "cacheable": False, "parallel_safe": False, "batch": False}
+
+        visitor = _Visitor(self)
+        visitor.visit(tree)
+
+        reads = visitor.file_reads
+        # 读取的文件都能确定(固定路径或context变量)时,缓存键可以包含这些文件的修改时间
+        known_files = all("expression" not in access for access in reads)
+        return {
+            "ok": not visitor.errors,
+            "errors": visitor.errors,
+            "syntax_error": None,
+            "imports": visitor.imports,
+            "file_reads": reads,
+            "file_writes": visitor.file_writes,
+            "dependencies": list(dict.fromkeys(access["path"] for access in reads if "path" in access)),
+            "context_files": list(dict.fromkeys(access["context_key"] for access in reads
+                                                if "context_key" in access)),
+            "volatile": visitor.volatile,
+            "untracked": visitor.untracked,
+            "cacheable": (known_files and not visitor.volatile and not visitor.untracked
+                          and not visitor.file_writes),
+            "parallel_safe": not visitor.file_writes,
+            "batch": any(isinstance(node, ast.FunctionDef) and node.name == "generate_contents"
+                         for node in tree.body),
+        }
+
+    def check(self, script_code: str) -> tuple:
+        """
+        检查脚本是否可以执行
+
+        Returns:
+            (是否可以执行, 错误信息)
+        """
+        report = self.analyze(script_code)
+        if report["ok"]:
+            return (True, "")
+        return (False, "脚本预检未通过:\n" + "\n".join(error["message"] for error in report["errors"]))
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("脚本预检模块加载成功")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+脚本结果缓存模块
+按 脚本内容 + 上下文变量 + 脚本读取的文件的修改时间 缓存脚本输出(SQLite),
+同一脚本对未变化的数据再次执行(重发、预览、定时任务)时直接返回上次的结果。
+缓存总大小超过上限时删除最久未使用的结果
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional
+
+
+# 默认缓存文件
+DEFAULT_CACHE_FILE = "script_cache.db"
+
+# 默认缓存大小上限(MB)
+DEFAULT_MAX_SIZE_MB = 50
+
+# 上下文中表示脚本要读取的文件的键(值为路径或路径列表)
+FILE_KEYS = ("file", "files")
+
+# 每次执行都会变化的上下文变量,只有脚本中用到时才计入缓存键
+VOLATILE_KEYS = ("date", "time", "datetime")
+
+
+def _file_signature(path: str) -> List:
+    """文件的 [路径, 修改时间, 大小],文件不存在时修改时间和大小为None"""
+    try:
+        stat = os.stat(path)
+        return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+    except (OSError, TypeError, ValueError):
+        return [str(path), None, None]
+
+
+class ScriptResultCache:
+    """脚本输出的磁盘缓存"""
+
+    def __init__(self, cache_file: str = DEFAULT_CACHE_FILE, max_size_mb: float = DEFAULT_MAX_SIZE_MB):
+        """
+        初始化缓存
+
+        Args:
+            cache_file: 缓存文件路径, ":memory:" 表示只保存在内存
+            max_size_mb: 缓存的结果总大小上限(MB)
+        """
+        self.cache_file = cache_file
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(cache_file, timeout=10, check_same_thread=False)
+        if cache_file != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, output TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON results (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(script_code: str, context: Dict[str, Any] = None, files: List[str] = None) -> str:
+        """
+        计算缓存键
+
+        Args:
+            script_code: 脚本代码
+            context: 上下文变量。date/time/datetime 只有脚本中用到时才计入;
+                     file/files 指向的文件的修改时间和大小也计入
+            files: 脚本还会读取的其他文件
+
+        Returns:
+            缓存键(SHA-256)
+        """
+        context = context or {}
+        values = {
+            key: value for key, value in context.items()
+            if key not in VOLATILE_KEYS or key in script_code
+        }
+
+        paths = list(files or [])
+        for key in FILE_KEYS:
+            value = context.get(key)
+            if isinstance(value, str):
+                paths.append(value)
+            elif isinstance(value, (list, tuple)):
+                paths.extend(value)
+
+        payload = json.dumps({
+            "script": script_code,
+            "context": values,
+            "files": sorted(_file_signature(path) for path in set(map(str, paths)))
+        }, sort_keys=True, ensure_ascii=False, default=repr)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """获取缓存的输出,没有时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT output FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, output: str):
+        """保存输出,超出大小上限时删除最久未使用的结果"""
+        size = len(output.encode("utf-8"))
+        if size > self.max_size:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, output, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, output, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """删除最久未使用的结果,直到总大小不超过上限"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM results ORDER BY last_used").fetchall():
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def get_stats(self) -> Dict:
+        """缓存统计 {"entries", "size", "max_size", "hits", "misses"}"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": entries, "size": size, "max_size": self.max_size,
+                "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def close(self):
+        """关闭缓存"""
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> ScriptResultCache:
+    """获取共用的默认缓存(首次使用时打开)"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ScriptResultCache()
+        return _default_cache
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("脚本结果缓存模块加载成功")
@@ -8,26 +8,286 @@ Python脚本执行器模块
 import sys
 import os
 import io
+import time
+import ctypes
+import pstats
+import cProfile
+import functools
+import threading
 import traceback
 import importlib
-from typing import Dict, Any
+import tracemalloc
+import contextvars
+from typing import Dict, Any, List
 
+from script_analyzer import ScriptAnalyzer, dependency_files
 
-class ScriptExecutor:
-    """Python脚本执行器"""
 
-    def __init__(self):
-        """初始化执行器"""
-        self.last_error = None
-        self._modules_cache = {}
-        # 预先导入常用模块，避免 numpy 2.x 的 CPU dispatcher 重复初始化问题
-        self._preload_modules()
+# 当前执行的脚本的输出缓冲区(每个线程/上下文独立)
+_captured_output = contextvars.ContextVar("script_output", default=None)
+_proxy_lock = threading.Lock()
 
-    def _preload_modules(self):
+# 本进程中正在执行的脚本数(内存限制按整个进程统计,有多个脚本同时执行时无法区分)
+_active_executions = 0
+_active_lock = threading.Lock()
+
+
+def _enter_execution():
+    global _active_executions
+    with _active_lock:
+        _active_executions += 1
+
+
+def _exit_execution():
+    global _active_executions
+    with _active_lock:
+        _active_executions -= 1
+
+
+class _StdoutProxy:
+    """
+    sys.stdout 代理
+
+    正在执行脚本的线程写入该次执行自己的缓冲区,其他线程(日志、调度器等)照常写入原来的stdout,
+    因此多个脚本可以在不同线程中同时执行,输出不会互相混入。
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def _target(self):
+        buffer = _captured_output.get()
+        return buffer if buffer is not None else self._stream
+
+    def write(self, text):
+        target = self._target()
+        if target is None:
+            # 打包的窗口程序没有控制台, sys.stdout 为 None
+            return len(text)
+        return target.write(text)
+
+    def flush(self):
+        target = self._target()
+        if target is not None:
+            target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install_stdout_proxy():
+    """安装 sys.stdout 代理(只安装一次)"""
+    with _proxy_lock:
+        if not isinstance(sys.stdout, _StdoutProxy):
+            sys.stdout = _StdoutProxy(sys.stdout)
+
+
+class ScriptLimitError(BaseException):
+    """
+    脚本超出执行限制
+
+    继承BaseException,脚本中的 except Exception 无法拦截
+    """
+
+
+class ScriptTimeoutError(ScriptLimitError):
+    """超出运行时间限制"""
+
+
+class ScriptCPUTimeError(ScriptLimitError):
+    """超出CPU时间限制"""
+
+
+class ScriptMemoryError(ScriptLimitError):
+    """超出内存限制"""
+
+
+def _memory_usage():
+    """当前进程占用的物理内存(字节),无法获取时返回None"""
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if sys.platform == "win32":
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+    except Exception:
+        pass
+    return None
+
+
+# 清除待处理异常时最多等待的循环次数(正常情况下异常在几次循环内抛出)
+_CLEAR_SPIN_LIMIT = 1_000_000
+
+
+class _ClearPending(BaseException):
+    """用于清除已注入但尚未抛出的超限异常(Python 3.11)"""
+
+
+def _clear_pending_exception(thread_id: int):
+    """清除当前线程中已注入但尚未抛出的异常(必须在该线程中调用)"""
+    if sys.version_info[:2] != (3, 11):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+        return
+    # 3.11 用NULL清除后解释器的待处理标志不会复位,之后在cProfile下执行会卡住。
+    # 改为用私有异常替换待抛出的异常: 它在下一条字节码处必然抛出,在这里捕获
+    try:
+        if ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id),
+                                                      ctypes.py_object(_ClearPending)) != 1:
+            return
+        for _ in range(_CLEAR_SPIN_LIMIT):
+            pass
+    except _ClearPending:
+        return
+    # 异常未在预期时间内抛出: 退回NULL清除,不再等待
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+    print("警告: 清除脚本执行线程的待处理异常超时")
+
+
+class _ScriptWatchdog(threading.Thread):
+    """
+    脚本执行监视线程
+
+    超出限制时向执行脚本的线程注入 ScriptLimitError。异常在脚本执行下一条Python语句时抛出,
+    长时间的C扩展调用(如读取超大文件)要等调用返回后才会中断。
+
+    内存按整个进程的增长统计: 执行期间有其他脚本同时执行时无法确定是哪个脚本占用的内存,
+    该次执行不再检查内存(独立进程执行时由子进程的 RLIMIT_AS 限制)。
+    """
+
+    INTERVAL = 0.05  # 检查间隔(秒)
+    REINJECT_INTERVAL = 1.0  # 异常被脚本的裸except吞掉时再次注入的间隔(秒)
+
+    def __init__(self, timeout=None, cpu_time_limit=None, memory_limit_mb=None):
+        super().__init__(daemon=True)
+        self.target_id = threading.get_ident()
+        self.timeout = timeout
+        self.cpu_time_limit = cpu_time_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.violation = None
+        self._lock = threading.Lock()
+        self._done = False
+        self._stop = threading.Event()
+        self._started_at = time.monotonic()
+        self._cpu_clock = None
+        if hasattr(time, "pthread_getcpuclockid"):
+            try:
+                self._cpu_clock = time.pthread_getcpuclockid(self.target_id)
+            except OSError:
+                pass
+        self._cpu_start = self._cpu_time()
+        self._memory_start = _memory_usage() if memory_limit_mb else None
+
+    def _cpu_time(self) -> float:
+        """执行脚本的线程已使用的CPU时间(不支持按线程统计时为整个进程)"""
+        if self._cpu_clock is not None:
+            return time.clock_gettime(self._cpu_clock)
+        return time.process_time()
+
+    def _check(self):
+        """检查是否超出限制,返回 (异常类型, 违规信息) 或 None"""
+        elapsed = time.monotonic() - self._started_at
+        if self.timeout and elapsed > self.timeout:
+            return ScriptTimeoutError, {
+                "type": "timeout", "limit": self.timeout, "value": round(elapsed, 3),
+                "message": f"脚本执行超时(超过 {self.timeout} 秒),已终止"
+            }
+
+        if self.cpu_time_limit:
+            cpu_time = self._cpu_time() - self._cpu_start
+            if cpu_time > self.cpu_time_limit:
+                return ScriptCPUTimeError, {
+                    "type": "cpu_time", "limit": self.cpu_time_limit, "value": round(cpu_time, 3),
+                    "message": f"脚本CPU时间超出限制({self.cpu_time_limit} 秒),已终止"
+                }
+
+        if self.memory_limit_mb and self._memory_start is not None:
+            if _active_executions > 1:
+                # 其他脚本同时在执行,进程内存的增长不一定来自本脚本
+                self._memory_start = None
+                return None
+            memory = _memory_usage()
+            used_mb = (memory - self._memory_start) / (1024 * 1024) if memory else 0
+            if used_mb > self.memory_limit_mb:
+                return ScriptMemoryError, {
+                    "type": "memory", "limit": self.memory_limit_mb, "value": round(used_mb, 1),
+                    "message": f"脚本内存超出限制(已使用约 {used_mb:.0f}MB,限制 {self.memory_limit_mb}MB),已终止"
+                }
+        return None
+
+    def run(self):
+        last_injected = None
+        while not self._stop.wait(self.INTERVAL):
+            if self.violation is None:
+                found = self._check()
+                if found is None:
+                    continue
+                error_type, violation = found
+            elif time.monotonic() - last_injected < self.REINJECT_INTERVAL:
+                continue
+
+            with self._lock:
+                if self._done:
+                    return
+                if self.violation is None:
+                    self.violation = violation
+                    self._error_type = error_type
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self.target_id), ctypes.py_object(self._error_type)
+                )
+                last_injected = time.monotonic()
+
+    def finish(self):
         """
-        预先加载常用模块到缓存
-        这样可以避免在 exec() 中重复导入导致的 numpy CPU dispatcher 错误
+        脚本结束: 停止监视并清除已注入但尚未抛出的异常,返回违规信息(未超限时为None)
+
+        在执行脚本的线程中调用。与注入在同一个锁下进行,返回后不会再有超限异常抛出;
+        清除之前异常就已抛出时由调用方捕获后再次调用。
         """
+        with self._lock:
+            self._done = True
+            self._stop.set()
+            if self.violation is not None:
+                _clear_pending_exception(self.target_id)
+        return self.violation
+
+
+# 导入较慢的常用模块: 脚本中的变量名 -> 模块名
+HEAVY_MODULES = {
+    'numpy': 'numpy',
+    'np': 'numpy',
+    'pandas': 'pandas',
+    'pd': 'pandas',
+}
+
+_import_lock = threading.Lock()
+
+
+def _import_heavy_modules():
+    """
+    导入numpy/pandas(只导入一次,多个线程同时调用时只有一个线程执行导入)
+
+    Returns:
+        {模块名: 模块},导入失败时为空字典
+    """
+    with _import_lock:
+        names = set(HEAVY_MODULES.values())
+        if all(name in sys.modules for name in names):
+            return {name: sys.modules[name] for name in names}
+
         # 在 PyInstaller 环境中，切换工作目录以避免导入冲突
         original_dir = None
         if hasattr(sys, '_MEIPASS'):
@@ -36,50 +296,242 @@ class ScriptExecutor:
             os.chdir(sys._MEIPASS)
 
         try:
-            # 预先导入常用模块
-            import numpy
-            import pandas
-            import os as os_module
-            from datetime import datetime, timedelta
-
-            # 缓存常用模块
-            self._modules_cache = {
-                'numpy': numpy,
-                'np': numpy,
-                'pandas': pandas,
-                'pd': pandas,
-                'os': os_module,
-                'datetime': datetime,
-                'timedelta': timedelta,
-            }
+            return {name: importlib.import_module(name) for name in ('numpy', 'pandas')}
         except Exception as e:
             # 如果导入失败，记录但不中断
             print(f"Warning: Failed to preload modules: {e}")
-            import traceback
             traceback.print_exc()
+            return {}
         finally:
             # 恢复原始工作目录
             if original_dir:
                 os.chdir(original_dir)
 
-    def execute_script(self, script_code: str, context: Dict[str, Any] = None) -> tuple:
+
+class _LazyModule:
+    """模块代理: 第一次访问属性时才导入模块"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def _load(self):
+        module = _import_heavy_modules().get(self._name)
+        if module is None:
+            raise ImportError(f"无法导入模块 {self._name}")
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def _collect_hotspots(profiler: cProfile.Profile, limit: int = 20) -> List[Dict]:
+    """从cProfile结果中取出累计耗时最多的函数"""
+    hotspots = []
+    for (filename, line, function), (_, calls, total, cumulative, _) in pstats.Stats(profiler).stats.items():
+        # 跳过执行器自身的调用
+        if filename == __file__ or function in ("<built-in method builtins.exec>",
+                                                "<method 'disable' of '_lsprof.Profiler' objects>",
+                                                "<method 'getvalue' of '_io.StringIO' objects>"):
+            continue
+        location = "脚本" if filename == "<string>" else os.path.basename(filename)
+        hotspots.append({
+            "function": function,
+            "location": f"{location}:{line}" if line else location,
+            "calls": calls,
+            "total_time": round(total, 6),  # 函数自身耗时(秒)
+            "cumulative_time": round(cumulative, 6)  # 包含调用的函数的耗时(秒)
+        })
+    hotspots.sort(key=lambda item: item["cumulative_time"], reverse=True)
+    return hotspots[:limit]
+
+
+def format_profile_report(report: Dict, limit: int = 15) -> str:
+    """把性能分析结果格式化为文本"""
+    lines = [
+        f"总耗时: {report['wall_time']:.3f} 秒",
+        f"内存峰值: {report['peak_memory'] / (1024 * 1024):.1f} MB",
+        "",
+        f"{'累计(秒)':>10} {'自身(秒)':>10} {'调用次数':>8}  函数",
+    ]
+    for item in report["hotspots"][:limit]:
+        lines.append(f"{item['cumulative_time']:>10.4f} {item['total_time']:>10.4f} "
+                     f"{item['calls']:>8}  {item['function']} ({item['location']})")
+    return "\n".join(lines)
+
+
+class ScriptExecutor:
+    """Python脚本执行器"""
+
+    # 默认执行限制
+    DEFAULT_TIMEOUT = 120  # 运行时间(秒)
+    DEFAULT_MEMORY_LIMIT_MB = 1024  # 内存增长(MB)
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, cpu_time_limit: float = None,
+                 memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB, cache=None,
+                 analyzer: ScriptAnalyzer = None):
+        """
+        初始化执行器
+
+        Args:
+            timeout: 单次执行的最长运行时间(秒), None表示不限制
+            cpu_time_limit: 单次执行的最长CPU时间(秒), None表示不限制
+            memory_limit_mb: 单次执行期间进程内存的最大增长(MB), None表示不限制。
+                             按整个进程统计,只在没有其他脚本同时执行时检查;
+                             需要可靠的内存限制时使用 ScriptProcessPool
+            cache: 脚本结果缓存(ScriptResultCache), None表示不缓存。
+                   预检发现结果随时间变化(datetime.now、random等)或读取的文件无法确定时不缓存
+            analyzer: 执行前的脚本预检(禁止的调用、允许导入的模块), None表示使用默认设置
+        """
+        self.last_error = None
+        self.last_error_info = None  # 最近一次失败的结构化信息 {"type", "message", ...}
+        self.timeout = timeout
+        self.cpu_time_limit = cpu_time_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.cache = cache
+        self.analyzer = analyzer or ScriptAnalyzer()
+        # numpy/pandas 导入需要约1秒,先放入代理,第一次使用或 warm_up() 时才导入
+        from datetime import datetime, timedelta
+        self._modules_cache = {
+            'os': os,
+            'datetime': datetime,
+            'timedelta': timedelta,
+        }
+        self._modules_cache.update({alias: _LazyModule(name) for alias, name in HEAVY_MODULES.items()})
+        self._heavy_loaded = False
+
+    def _preload_modules(self):
+        """
+        加载常用模块到缓存(替换代理)
+        这样可以避免在 exec() 中重复导入导致的 numpy CPU dispatcher 错误
+        """
+        if self._heavy_loaded:
+            return
+        modules = _import_heavy_modules()
+        if modules:
+            self._modules_cache.update({alias: modules[name] for alias, name in HEAVY_MODULES.items()})
+            self._heavy_loaded = True
+
+    def warm_up(self, background: bool = True):
+        """
+        预先导入numpy/pandas,使第一次执行脚本不必等待导入
+
+        Args:
+            background: 是否在后台线程导入。打包环境导入时需要切换工作目录,
+                        会影响其他线程的相对路径,因此总是在当前线程导入
+        """
+        if background and not hasattr(sys, '_MEIPASS'):
+            threading.Thread(target=self._preload_modules, daemon=True).start()
+        else:
+            self._preload_modules()
+
+    def execute_script(self, script_code: str, context: Dict[str, Any] = None,
+                       profile: bool = False) -> tuple:
         """
         执行Python脚本并返回结果
 
         Args:
             script_code: 要执行的Python脚本代码
             context: 传递给脚本的上下文变量字典
+            profile: 是否进行性能分析(cProfile + tracemalloc,执行会变慢),不使用缓存
 
         Returns:
-            (是否成功, 结果内容或错误信息)
+            (是否成功, 结果内容或错误信息)。超出执行限制时返回 (False, 错误信息),
+            详细信息见 last_error_info。
+            profile为True时返回 (是否成功, 结果, 性能报告),性能报告包含
+            wall_time(秒)、peak_memory(字节)、hotspots(耗时最多的函数)
         """
         if not script_code or not script_code.strip():
-            return (False, "脚本内容为空")
+            return (False, "脚本内容为空", None) if profile else (False, "脚本内容为空")
 
         # 准备执行环境
         if context is None:
             context = {}
 
+        # 执行前预检: 禁止的调用(input、subprocess等)和不允许导入的模块
+        analysis = self.analyze_script(script_code)
+        passed, message = self.analyzer.check(script_code)
+        if not passed:
+            self.last_error = message
+            self.last_error_info = {"type": "forbidden", "message": message, "errors": analysis["errors"]}
+            return (False, message, None) if profile else (False, message)
+
+        # 脚本和输入都没有变化时直接返回缓存的结果
+        cache_key = None
+        if self.cache is not None and not profile and analysis["cacheable"]:
+            cache_key = self.cache.make_key(script_code, context, dependency_files(analysis, context))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return (True, cached)
+
+        run = self._run_script
+        report = {}
+        if profile:
+            run = functools.partial(self._run_profiled, report=report)
+
+        result = self._execute(script_code, context, run)
+        if cache_key is not None and result[0]:
+            self.cache.put(cache_key, result[1])
+        return result + (report,) if profile else result
+
+    def analyze_script(self, script_code: str) -> Dict[str, Any]:
+        """预检脚本(同一脚本只分析一次),结果见 ScriptAnalyzer.analyze"""
+        return self.analyzer.analyze(script_code)
+
+    def is_batch_script(self, script_code: str) -> bool:
+        """脚本是否定义了 generate_contents(contexts),即一次处理所有文件(使用预检结果)"""
+        return self.analyze_script(script_code)["batch"]
+
+    def execute_batch(self, script_code: str, contexts: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        执行定义了 generate_contents(contexts) 的脚本,一次生成所有文件的内容
+
+        脚本只执行一次,可以一次读取所有Excel、合并后用pandas/numpy统一计算,
+        generate_contents 按contexts的顺序返回每个文件的内容列表。
+        运行时间和CPU时间限制按文件数放大,内存限制不变。
+
+        Args:
+            script_code: 要执行的Python脚本代码
+            contexts: 每个文件的上下文变量字典列表(与 execute_script 的context相同)
+
+        Returns:
+            与contexts对应的 [(是否成功, 内容或错误信息)],脚本出错时每项都是相同的错误
+        """
+        if not contexts:
+            return []
+        if not script_code or not script_code.strip():
+            return [(False, "脚本内容为空")] * len(contexts)
+        passed, message = self.analyzer.check(script_code)
+        if not passed:
+            self.last_error = message
+            self.last_error_info = {"type": "forbidden", "message": message,
+                                    "errors": self.analyze_script(script_code)["errors"]}
+            return [(False, message)] * len(contexts)
+
+        # 脚本中的 context 为第一个文件的上下文(date/time等所有文件相同的变量)
+        run = functools.partial(self._run_batch, contexts=contexts)
+        success, contents = self._execute(script_code, contexts[0], run, time_scale=len(contexts))
+        if not success:
+            return [(False, contents)] * len(contexts)
+        return [(True, content) if content else (False, "脚本未生成该文件的内容")
+                for content in contents]
+
+    def _execute(self, script_code: str, context: Dict[str, Any], run, time_scale: int = 1) -> tuple:
+        """
+        准备执行环境,在执行限制下调用 run(script_code, exec_globals, captured_output)
+
+        Args:
+            time_scale: 运行时间和CPU时间限制的倍数(一次处理多个文件时使用)
+        """
+        # 脚本会用到numpy/pandas时先在这里导入,避免在 exec() 中首次导入
+        if not self._heavy_loaded and any(name in script_code for name in HEAVY_MODULES):
+            self._preload_modules()
+
         # 添加常用模块到执行环境（使用预加载的模块，避免重复导入）
         exec_globals = {
             '__builtins__': __builtins__,
@@ -89,10 +541,67 @@ class ScriptExecutor:
         # 将预加载的模块添加到执行环境
         exec_globals.update(self._modules_cache)
 
-        # 捕获标准输出
-        old_stdout = sys.stdout
-        sys.stdout = captured_output = io.StringIO()
+        # 捕获标准输出(只捕获当前线程中脚本的输出)
+        _install_stdout_proxy()
+        captured_output = io.StringIO()
+        token = _captured_output.set(captured_output)
 
+        _enter_execution()
+        watchdog = None
+        if self.timeout or self.cpu_time_limit or self.memory_limit_mb:
+            watchdog = _ScriptWatchdog(self.timeout and self.timeout * time_scale,
+                                       self.cpu_time_limit and self.cpu_time_limit * time_scale,
+                                       self.memory_limit_mb)
+            watchdog.start()
+
+        # 超限异常可能在任意位置抛出(包括下面的错误处理中),统一在最外层处理
+        try:
+            try:
+                result = run(script_code, exec_globals, captured_output)
+            finally:
+                violation = self._stop_watchdog(watchdog) if watchdog is not None else None
+        except ScriptLimitError:
+            violation = self._stop_watchdog(watchdog) if watchdog is not None else None
+            result = None
+        finally:
+            # 恢复标准输出
+            _captured_output.reset(token)
+            _exit_execution()
+
+        if result is None and violation is None:
+            violation = {"type": "limit", "message": "脚本超出执行限制,已终止"}
+
+        if violation is not None:
+            # 脚本已结束,但超出了限制(超限异常可能还未抛出)
+            self.last_error = violation["message"]
+            self.last_error_info = violation
+            result = (False, violation["message"])
+        return result
+
+    def _run_profiled(self, script_code: str, exec_globals: Dict[str, Any],
+                      captured_output: io.StringIO, report: Dict) -> tuple:
+        """在cProfile和tracemalloc下执行脚本,结果写入report"""
+        profiler = cProfile.Profile()
+        was_tracing = tracemalloc.is_tracing()
+        if was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            return self._run_script(script_code, exec_globals, captured_output)
+        finally:
+            profiler.disable()
+            report["wall_time"] = time.perf_counter() - started
+            report["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            if not was_tracing:
+                tracemalloc.stop()
+            report["hotspots"] = _collect_hotspots(profiler)
+
+    def _run_script(self, script_code: str, exec_globals: Dict[str, Any],
+                    captured_output: io.StringIO) -> tuple:
+        """执行脚本并收集输出"""
         try:
             # 执行脚本
             exec(script_code, exec_globals)
@@ -112,25 +621,55 @@ class ScriptExecutor:
                 if result is not None:
                     output = str(result)
 
-            # 恢复标准输出
-            sys.stdout = old_stdout
-
             if not output:
                 return (False, "脚本未产生任何输出")
 
             return (True, output)
 
         except Exception as e:
-            # 恢复标准输出
-            sys.stdout = old_stdout
+            return self._exception_result(e)
 
-            # 获取详细错误信息
-            error_msg = traceback.format_exc()
-            self.last_error = error_msg
+    def _run_batch(self, script_code: str, exec_globals: Dict[str, Any],
+                   captured_output: io.StringIO, contexts: List[Dict[str, Any]]) -> tuple:
+        """执行脚本并调用 generate_contents(contexts),返回 (是否成功, 内容列表或错误信息)"""
+        try:
+            exec(script_code, exec_globals)
 
-            return (False, f"脚本执行错误:\n{error_msg}")
+            generate_contents = exec_globals.get('generate_contents')
+            if not callable(generate_contents):
+                return (False, "脚本未定义 generate_contents(contexts) 函数")
 
-    def validate_script(self, script_code: str) -> tuple:
+            contents = generate_contents(contexts)
+            contents = list(contents) if contents is not None else []
+            if len(contents) != len(contexts):
+                return (False, f"generate_contents 返回了 {len(contents)} 个结果,应为 {len(contexts)} 个")
+
+            return (True, [str(content) if content is not None else "" for content in contents])
+
+        except Exception as e:
+            return self._exception_result(e)
+
+    def _exception_result(self, e: Exception) -> tuple:
+        """记录脚本抛出的异常,返回 (False, 错误信息)"""
+        # 获取详细错误信息
+        error_msg = traceback.format_exc()
+        self.last_error = error_msg
+        self.last_error_info = {"type": "exception", "exception": type(e).__name__,
+                                "message": str(e), "traceback": error_msg}
+
+        return (False, f"脚本执行错误:\n{error_msg}")
+
+    @staticmethod
+    def _stop_watchdog(watchdog: _ScriptWatchdog):
+        """停止监视线程(停止前注入的异常可能在此期间抛出,需要重试)"""
+        while True:
+            try:
+                return watchdog.finish()
+            except ScriptLimitError:
+                continue
+
+    @staticmethod
+    def validate_script(script_code: str) -> tuple:
         """
         验证脚本语法
 
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+脚本进程池模块
+在预先启动的子进程中执行用户脚本(子进程启动时已导入pandas/numpy),
+每次执行有超时和内存限制,脚本卡死或内存耗尽只影响子进程,多个脚本可在多核上并行执行
+"""
+
+import os
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Optional, Tuple
+
+from script_executor import ScriptExecutor
+from script_analyzer import ScriptAnalyzer, dependency_files
+
+
+# 等待子进程启动(导入pandas/numpy)的最长时间(秒)
+STARTUP_TIMEOUT = 60
+
+
+def _apply_memory_limit(memory_limit_mb: Optional[int]) -> bool:
+    """
+    限制子进程的内存(仅支持Linux等提供resource模块的系统)
+
+    限制值为当前已使用的虚拟内存(已导入的模块)加上 memory_limit_mb
+
+    Returns:
+        是否已设置限制
+    """
+    if not memory_limit_mb:
+        return False
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            used = int(f.read().split()[0]) * resource.getpagesize()
+        limit = used + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        return True
+    except Exception as e:
+        print(f"无法限制脚本进程内存: {e}")
+        return False
+
+
+def _worker_main(conn, timeout: int, memory_limit_mb: Optional[int], analyzer_settings: Tuple):
+    """子进程主循环: 接收 (执行器方法名, 参数),返回方法的结果"""
+    allowed_modules, allowed_calls = analyzer_settings
+    executor = ScriptExecutor(timeout=timeout, memory_limit_mb=None,
+                              analyzer=ScriptAnalyzer(allowed_modules, allowed_calls))
+    executor.warm_up(background=False)
+    if not _apply_memory_limit(memory_limit_mb):
+        # 不支持 RLIMIT_AS(Windows)时由执行器检查内存,子进程每次只执行一个脚本,进程内存即该脚本的内存
+        executor.memory_limit_mb = memory_limit_mb
+    conn.send("ready")
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        method, args = job
+        try:
+            result = getattr(executor, method)(*args)
+        except MemoryError:
+            result = (False, "脚本执行错误: 超出内存限制")
+            if method == "execute_batch":
+                result = [result] * len(args[1])
+        conn.send(result)
+
+
+class _WorkerProcess:
+    """一个脚本子进程"""
+
+    def __init__(self, mp_context, timeout: int, memory_limit_mb: Optional[int], analyzer_settings: Tuple):
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=_worker_main, args=(child_conn, timeout, memory_limit_mb, analyzer_settings), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self) -> bool:
+        """等待子进程完成启动"""
+        if not self.ready and self.conn.poll(STARTUP_TIMEOUT):
+            self.ready = self.conn.recv() == "ready"
+        return self.ready
+
+    def kill(self):
+        """强制结束子进程"""
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.conn.close()
+
+
+class ScriptProcessPool:
+    """
+    脚本进程池
+
+    提供与 ScriptExecutor 相同的 execute_script / validate_script 接口,
+    可以直接传给 BatchDataEmailSender 使用。
+    """
+
+    def __init__(self, workers: int = None, timeout: int = 60, memory_limit_mb: Optional[int] = 512,
+                 cache=None, analyzer: ScriptAnalyzer = None):
+        """
+        初始化进程池(立即在后台启动子进程)
+
+        Args:
+            workers: 子进程数,默认为CPU核数(最多4个)
+            timeout: 单次执行的超时时间(秒),超时的子进程会被结束并重新启动
+            memory_limit_mb: 单次执行可额外使用的内存(MB), None表示不限制(Linux上用 RLIMIT_AS 限制子进程,不支持时按子进程的内存检查)
+            cache: 脚本结果缓存(ScriptResultCache),命中时不发送给子进程, None表示不缓存
+            analyzer: 脚本预检,未通过的脚本不发送给子进程, None表示使用默认设置
+                      (子进程中的执行器按相同的允许导入和调用列表再检查一次)
+        """
+        self.size = workers or max(1, min(4, os.cpu_count() or 1))
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.cache = cache
+        self.analyzer = analyzer or ScriptAnalyzer()
+        self.last_error = None
+        # 使用spawn: 界面进程中有多个线程,fork出的子进程可能死锁
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()  # 空闲的子进程,关闭后放入None通知等待的线程
+        self._workers = set()  # 所有子进程(包括正在执行的)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._dispatcher = ThreadPoolExecutor(max_workers=self.size)
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _WorkerProcess:
+        # 子进程中的执行器使用与进程池相同的限制和预检设置
+        allowed_modules = self.analyzer.allowed_modules
+        analyzer_settings = (sorted(allowed_modules) if allowed_modules is not None else None,
+                             sorted(self.analyzer.allowed_calls))
+        worker = _WorkerProcess(self._mp_context, self.timeout, self.memory_limit_mb, analyzer_settings)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _kill(self, worker: _WorkerProcess):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+
+    def _replace(self, worker: _WorkerProcess):
+        """结束出问题的子进程,并启动一个新的补充到池中"""
+        self._kill(worker)
+        if not self._closed:
+            self._idle.put(self._spawn())
+
+    def execute_script(self, script_code: str, context: Dict[str, Any] = None,
+                       timeout: int = None) -> Tuple[bool, str]:
+        """
+        在子进程中执行脚本(所有子进程都在忙时等待)
+
+        Returns:
+            (是否成功, 结果内容或错误信息)
+        """
+        if not script_code or not script_code.strip():
+            return (False, "脚本内容为空")
+        if self._closed:
+            return (False, "脚本进程池已关闭")
+
+        passed, message = self.analyzer.check(script_code)
+        if not passed:
+            return self._fail(message)
+
+        cache_key = None
+        analysis = self.analyze_script(script_code)
+        if self.cache is not None and analysis["cacheable"]:
+            cache_key = self.cache.make_key(script_code, context, dependency_files(analysis, context))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return (True, cached)
+
+        result = self._call("execute_script", (script_code, context or {}), timeout or self.timeout)
+        if not result[0]:
+            self.last_error = result[1]
+        elif cache_key is not None:
+            self.cache.put(cache_key, result[1])
+        return result
+
+    def execute_batch(self, script_code: str, contexts: List[Dict[str, Any]]) -> List[Tuple[bool, str]]:
+        """
+        在一个子进程中执行定义了 generate_contents(contexts) 的脚本,一次生成所有文件的内容
+
+        Returns:
+            与contexts对应的 [(是否成功, 内容或错误信息)]
+        """
+        if not contexts:
+            return []
+        if not script_code or not script_code.strip():
+            return [(False, "脚本内容为空")] * len(contexts)
+        if self._closed:
+            return [(False, "脚本进程池已关闭")] * len(contexts)
+        passed, message = self.analyzer.check(script_code)
+        if not passed:
+            return [self._fail(message)] * len(contexts)
+
+        # 运行时间限制按文件数放大(与 ScriptExecutor.execute_batch 相同)
+        result = self._call("execute_batch", (script_code, contexts), self.timeout * len(contexts))
+        if isinstance(result, tuple):
+            return [result] * len(contexts)
+        return result
+
+    def _call(self, method: str, args: tuple, timeout: int):
+        """
+        取一个空闲子进程执行 ScriptExecutor 的方法(所有子进程都在忙时等待)
+
+        Returns:
+            方法的结果;子进程出错时为 (False, 错误信息)
+        """
+        worker = self._idle.get()
+        if worker is None:
+            self._idle.put(None)
+            return self._fail("脚本进程池已关闭")
+        try:
+            if not worker.wait_ready():
+                self._replace(worker)
+                return self._fail("脚本进程启动失败")
+            worker.conn.send((method, args))
+            if not worker.conn.poll(timeout):
+                self._replace(worker)
+                return self._fail(f"脚本执行超时(超过 {timeout} 秒),已终止")
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            self._replace(worker)
+            if self._closed:
+                return self._fail("脚本进程池已关闭,执行被终止")
+            return self._fail("脚本进程异常退出(可能超出内存限制)")
+        except Exception as e:
+            # 上下文无法传给子进程等错误,子进程本身正常
+            self._idle.put(worker)
+            return self._fail(f"脚本执行错误: {e}")
+
+        self._idle.put(worker)
+        return result
+
+    def _fail(self, message: str) -> Tuple[bool, str]:
+        self.last_error = message
+        return (False, message)
+
+    def submit(self, script_code: str, context: Dict[str, Any] = None) -> Future:
+        """提交脚本在后台执行,返回Future(结果为 (是否成功, 结果内容或错误信息))"""
+        return self._dispatcher.submit(self.execute_script, script_code, context)
+
+    def execute_many(self, jobs: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[bool, str]]:
+        """并行执行多个 (脚本, 上下文),结果与jobs顺序一致"""
+        futures = [self.submit(script_code, context) for script_code, context in jobs]
+        return [future.result() for future in futures]
+
+    def validate_script(self, script_code: str) -> tuple:
+        """验证脚本语法"""
+        return ScriptExecutor.validate_script(script_code)
+
+    def analyze_script(self, script_code: str) -> Dict[str, Any]:
+        """预检脚本,结果见 ScriptAnalyzer.analyze"""
+        return self.analyzer.analyze(script_code)
+
+    def is_batch_script(self, script_code: str) -> bool:
+        """脚本是否定义了 generate_contents(contexts)"""
+        return self.analyze_script(script_code)["batch"]
+
+    def close(self):
+        """关闭进程池,结束所有子进程(正在执行脚本的子进程直接终止)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        # 空闲的子进程正常退出
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is None:
+                continue
+            try:
+                worker.conn.send(None)
+                worker.process.join(timeout=2)
+            except Exception:
+                pass
+            self._kill(worker)
+
+        # 正在执行的子进程直接终止,等待空闲子进程的线程收到None后返回
+        with self._lock:
+            busy = list(self._workers)
+        for worker in busy:
+            self._kill(worker)
+        self._idle.put(None)
+        self._dispatcher.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("脚本进程池模块加载成功")
@@ -10,13 +10,20 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                             QMessageBox, QGroupBox, QFormLayout, QCheckBox,
                             QFileDialog, QListWidget, QProgressDialog, QTabWidget,
                             QRadioButton, QButtonGroup, QSpinBox, QPlainTextEdit,
-                            QSplitter)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+                            QSplitter, QListWidgetItem, QDialog, QDialogButtonBox)
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QSyntaxHighlighter, QTextCharFormat, QColor
 from email_sender import EmailSender, BulkEmailSender
-from script_executor import ScriptExecutor, ScriptTemplate
+from sender_pool import SenderPool
+from script_executor import ScriptExecutor, ScriptTemplate, format_profile_report
+from script_pool import ScriptProcessPool
+from script_cache import get_default_cache
 from batch_data_sender import BatchDataEmailSender
+from mail_merge import MailMerge, read_columns, find_email_column
+from template_engine import TemplateError
+import os
 import re
+import threading
 
 
 class PythonHighlighter(QSyntaxHighlighter):
@@ -192,6 +199,32 @@ class SendEmailWorker(QThread):
             self.finished.emit({"error": str(e)})
 
 
+class MailMergeWorker(QThread):
+    """邮件合并发送工作线程"""
+    finished = pyqtSignal(dict)
+    progress = pyqtSignal(str)
+
+    def __init__(self, mail_merge, source):
+        super().__init__()
+        self.mail_merge = mail_merge
+        self.source = source
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """停止发送(当前批次发送完后停止)"""
+        self.cancel_event.set()
+
+    def run(self):
+        """执行邮件合并发送"""
+        try:
+            self.progress.emit("正在读取收件人表并发送...")
+            result = self.mail_merge.send(self.source, progress_callback=self.progress.emit,
+                                          cancel_event=self.cancel_event)
+            self.finished.emit(result)
+        except Exception as e:
+            self.finished.emit({"error": str(e)})
+
+
 class BatchDataEmailWorker(QThread):
     """批量数据邮件发送工作线程"""
     finished = pyqtSignal(dict)
@@ -235,8 +268,10 @@ class SendEmailTab(QWidget):
         self.attachments = []
         self.worker = None
         self.script_executor = ScriptExecutor()
+        self.script_pool = None  # 独立进程执行脚本时按需创建
         self.batch_worker = None
         self.excel_files = []
+        self.state_loaded = False
         self.init_ui()
 
     def init_ui(self):
@@ -263,7 +298,20 @@ class SendEmailTab(QWidget):
         sender_layout.addWidget(QLabel("选择发件账号:"))
         sender_layout.addWidget(self.sender_combo, 1)
 
-        sender_group.setLayout(sender_layout)
+        # 多账号轮换: 把收件人分散到多个账号并行发送
+        self.pool_checkbox = QCheckBox("多账号轮换")
+        self.pool_checkbox.setToolTip("按剩余额度和错误率在勾选的账号间轮换发送,账号被限流时自动切换")
+        self.pool_checkbox.toggled.connect(self.on_pool_toggled)
+        sender_layout.addWidget(self.pool_checkbox)
+
+        sender_outer_layout = QVBoxLayout()
+        sender_outer_layout.addLayout(sender_layout)
+        self.pool_list = QListWidget()
+        self.pool_list.setMaximumHeight(80)
+        self.pool_list.setVisible(False)
+        sender_outer_layout.addWidget(self.pool_list)
+
+        sender_group.setLayout(sender_outer_layout)
         layout.addWidget(sender_group)
 
         # 收件人 - 紧凑布局
@@ -366,6 +414,34 @@ class SendEmailTab(QWidget):
         # 不设置固定高度,让其自适应
         text_layout.addWidget(self.content_input)
 
+        # 邮件合并 - 紧凑布局
+        merge_layout = QHBoxLayout()
+        self.merge_checkbox = QCheckBox("邮件合并")
+        self.merge_checkbox.setToolTip(
+            "从CSV/Excel收件人表逐行发送,主题和正文中的 {列名} 替换为该行的值\n"
+            "(勾选后不使用上方的收件人列表)"
+        )
+        merge_layout.addWidget(self.merge_checkbox)
+        self.merge_file_input = QLineEdit()
+        self.merge_file_input.setPlaceholderText("收件人表(CSV/Excel,第一行为列名)")
+        self.merge_file_input.setMinimumHeight(26)
+        self.merge_file_input.editingFinished.connect(self.load_merge_columns)
+        merge_layout.addWidget(self.merge_file_input)
+
+        browse_merge_btn = QPushButton("浏览")
+        browse_merge_btn.clicked.connect(self.browse_merge_file)
+        merge_layout.addWidget(browse_merge_btn)
+
+        merge_layout.addWidget(QLabel("邮箱列:"))
+        self.merge_column_combo = QComboBox()
+        self.merge_column_combo.setMinimumWidth(100)
+        merge_layout.addWidget(self.merge_column_combo)
+
+        preview_merge_btn = QPushButton("预览")
+        preview_merge_btn.clicked.connect(self.preview_mail_merge)
+        merge_layout.addWidget(preview_merge_btn)
+        text_layout.addLayout(merge_layout)
+
         # Python脚本标签页
         script_widget = QWidget()
         script_layout = QVBoxLayout(script_widget)
@@ -398,6 +474,10 @@ class SendEmailTab(QWidget):
         test_script_btn.clicked.connect(self.test_script)
         template_layout.addWidget(test_script_btn)
 
+        self.profile_checkbox = QCheckBox("性能分析")
+        self.profile_checkbox.setToolTip("测试时统计总耗时、内存峰值和耗时最多的函数(执行会变慢)")
+        template_layout.addWidget(self.profile_checkbox)
+
         script_layout.addLayout(template_layout)
 
         # 脚本编辑器 - 使用CodeEditor支持语法高亮和Tab缩进
@@ -522,6 +602,10 @@ class SendEmailTab(QWidget):
         test_batch_script_btn.clicked.connect(self.test_batch_script)
         batch_template_layout.addWidget(test_batch_script_btn)
 
+        self.batch_profile_checkbox = QCheckBox("性能分析")
+        self.batch_profile_checkbox.setToolTip("测试时统计总耗时、内存峰值和耗时最多的函数(执行会变慢)")
+        batch_template_layout.addWidget(self.batch_profile_checkbox)
+
         # 预览邮件按钮
         preview_batch_btn = QPushButton("预览第1封")
         preview_batch_btn.setStyleSheet("""
@@ -571,6 +655,21 @@ class SendEmailTab(QWidget):
         self.batch_interval_spin.setMinimumHeight(26)
         batch_options_layout.addWidget(self.batch_interval_spin)
 
+        self.batch_isolated_checkbox = QCheckBox("独立进程执行脚本")
+        self.batch_isolated_checkbox.setToolTip(
+            "在预先启动的子进程中并行执行脚本,每个文件最多执行60秒、额外使用512MB内存,\n"
+            "脚本卡死或出错不会影响发送"
+        )
+        batch_options_layout.addWidget(self.batch_isolated_checkbox)
+
+        self.script_cache_checkbox = QCheckBox("缓存脚本结果")
+        self.script_cache_checkbox.setToolTip(
+            "脚本、上下文变量和Excel文件都没有变化时直接使用上次的结果,不再执行脚本\n"
+            "(使用了 datetime.now()、random、网络或数据库的脚本自动不缓存)"
+        )
+        self.script_cache_checkbox.toggled.connect(self.on_script_cache_toggled)
+        batch_options_layout.addWidget(self.script_cache_checkbox)
+
         batch_options_layout.addStretch()
         batch_data_layout.addLayout(batch_options_layout)
 
@@ -684,11 +783,12 @@ class SendEmailTab(QWidget):
         # 加载账号
         self.refresh_accounts()
         
-        # 恢复上次保存的状态
-        self.load_state()
+        # 恢复上次保存的状态(窗口显示后再读取,保存的脚本可能很大)
+        QTimer.singleShot(0, self.load_state)
 
     def load_state(self):
         """从配置中恢复上次保存的状态"""
+        self.state_loaded = True
         try:
             state = self.config_manager.get_send_email_state()
             
@@ -719,6 +819,19 @@ class SendEmailTab(QWidget):
             
             if state.get("batch_script_content"):
                 self.batch_script_input.setPlainText(state["batch_script_content"])
+
+            if state.get("batch_isolated"):
+                self.batch_isolated_checkbox.setChecked(True)
+
+            # 恢复邮件合并设置
+            if state.get("merge_file"):
+                self.merge_file_input.setText(state["merge_file"])
+                self.load_merge_columns(state.get("merge_column"))
+            if state.get("merge_enabled"):
+                self.merge_checkbox.setChecked(True)
+
+            if state.get("script_cache"):
+                self.script_cache_checkbox.setChecked(True)
             
             # 恢复模式选择
             mode = state.get("mode", "text")
@@ -732,11 +845,19 @@ class SendEmailTab(QWidget):
             # 恢复HTML格式设置
             if state.get("html_enabled"):
                 self.html_checkbox.setChecked(True)
+
+            # 恢复多账号轮换设置
+            self.set_pool_accounts(state.get("pool_accounts", []))
+            if state.get("pool_enabled"):
+                self.pool_checkbox.setChecked(True)
         except Exception as e:
             print(f"恢复发送邮件状态失败: {e}")
 
     def save_state(self):
         """保存当前的发送邮件页面状态"""
+        if not self.state_loaded:
+            # 状态还没有恢复,不能用空白页面覆盖保存的状态
+            return
         try:
             state = {
                 "recipients": self.recipient_input.toPlainText(),
@@ -746,8 +867,15 @@ class SendEmailTab(QWidget):
                 "batch_subject_template": self.batch_subject_template.text(),
                 "batch_folder_path": self.batch_folder_input.text(),
                 "batch_script_content": self.batch_script_input.toPlainText(),
+                "batch_isolated": self.batch_isolated_checkbox.isChecked(),
+                "script_cache": self.script_cache_checkbox.isChecked(),
+                "merge_enabled": self.merge_checkbox.isChecked(),
+                "merge_file": self.merge_file_input.text(),
+                "merge_column": self.merge_column_combo.currentText(),
                 "mode": self._get_current_mode(),
-                "html_enabled": self.html_checkbox.isChecked()
+                "html_enabled": self.html_checkbox.isChecked(),
+                "pool_enabled": self.pool_checkbox.isChecked(),
+                "pool_accounts": self.get_pool_accounts()
             }
             self.config_manager.save_send_email_state(state)
         except Exception as e:
@@ -785,10 +913,76 @@ class SendEmailTab(QWidget):
 
     def refresh_accounts(self):
         """刷新账号列表"""
+        checked = set(self.get_pool_accounts())
         self.sender_combo.clear()
+        self.pool_list.clear()
         accounts = self.config_manager.get_email_accounts()
         for account in accounts:
             self.sender_combo.addItem(account["email"])
+            item = QListWidgetItem(account["email"])
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if account["email"] in checked else Qt.Unchecked)
+            self.pool_list.addItem(item)
+
+    def on_pool_toggled(self, enabled):
+        """切换多账号轮换模式"""
+        self.sender_combo.setEnabled(not enabled)
+        self.pool_list.setVisible(enabled)
+
+    def on_script_cache_toggled(self, enabled):
+        """切换脚本结果缓存"""
+        cache = get_default_cache() if enabled else None
+        self.script_executor.cache = cache
+        if self.script_pool is not None:
+            self.script_pool.cache = cache
+
+    def get_pool_accounts(self):
+        """勾选的轮换账号"""
+        return [
+            self.pool_list.item(i).text() for i in range(self.pool_list.count())
+            if self.pool_list.item(i).checkState() == Qt.Checked
+        ]
+
+    def set_pool_accounts(self, emails):
+        """恢复勾选的轮换账号"""
+        for i in range(self.pool_list.count()):
+            item = self.pool_list.item(i)
+            item.setCheckState(Qt.Checked if item.text() in emails else Qt.Unchecked)
+
+    def _create_sender(self):
+        """
+        按当前选择创建发送器: 单个账号返回EmailSender,多账号轮换返回SenderPool
+
+        Returns:
+            发送器,账号未选择或凭证获取失败时返回None(已提示用户)
+        """
+        if self.pool_checkbox.isChecked():
+            emails = self.get_pool_accounts()
+            if len(emails) < 2:
+                QMessageBox.warning(self, "警告", "多账号轮换至少需要勾选两个账号")
+                return None
+        else:
+            emails = [self.sender_combo.currentText()]
+            if not emails[0]:
+                QMessageBox.warning(self, "警告", "请先添加邮箱账号")
+                return None
+
+        senders = []
+        for email in emails:
+            credentials = self.config_manager.get_account_credentials(email)
+            if not credentials:
+                QMessageBox.critical(self, "错误", f"获取邮箱凭证失败: {email}")
+                return None
+            senders.append(EmailSender(
+                email=credentials["email"],
+                password=credentials["password"],
+                smtp_server=credentials["smtp_server"],
+                smtp_port=credentials["smtp_port"]
+            ))
+
+        if self.pool_checkbox.isChecked():
+            return SenderPool(senders)
+        return senders[0]
 
     def load_template(self):
         """加载脚本模板"""
@@ -813,6 +1007,11 @@ class SendEmailTab(QWidget):
 
         # 执行脚本
         self.main_window.update_status("正在测试脚本...")
+        if self.profile_checkbox.isChecked():
+            success, output, report = self.script_executor.execute_script(script_code, profile=True)
+            self.show_profile_report(success, output, report)
+            self.main_window.update_status("脚本性能分析完成")
+            return
         success, output = self.script_executor.execute_script(script_code)
 
         if success:
@@ -832,6 +1031,28 @@ class SendEmailTab(QWidget):
             )
             self.main_window.update_status("脚本测试失败")
 
+    def show_profile_report(self, success, output, report):
+        """显示脚本性能分析结果"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("脚本性能分析")
+        dialog.resize(760, 520)
+        layout = QVBoxLayout(dialog)
+
+        status = "脚本执行成功" if success else "脚本执行失败"
+        text = f"{status}\n\n{format_profile_report(report)}\n\n"
+        text += f"{'生成的内容' if success else '错误信息'}:\n{'-'*40}\n{output[:1000]}"
+
+        report_view = QPlainTextEdit()
+        report_view.setReadOnly(True)
+        report_view.setFont(QFont("Consolas", 9))
+        report_view.setPlainText(text)
+        layout.addWidget(report_view)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        dialog.exec_()
+
     def import_recipients(self):
         """从文件导入收件人"""
         file_path, _ = QFileDialog.getOpenFileName(
@@ -896,9 +1117,20 @@ class SendEmailTab(QWidget):
             self.send_batch_data_email()
             return
 
+        # 邮件合并发送中再次点击: 停止发送
+        if isinstance(self.worker, MailMergeWorker) and self.worker.isRunning():
+            self.worker.cancel()
+            self.send_btn.setEnabled(False)
+            self.main_window.update_status("正在停止邮件合并(当前批次发送完后停止)...")
+            return
+
+        # 邮件合并: 收件人、主题和正文来自收件人表
+        if self.text_mode_radio.isChecked() and self.merge_checkbox.isChecked():
+            self.send_mail_merge()
+            return
+
         # 获取发件人
-        sender_email = self.sender_combo.currentText()
-        if not sender_email:
+        if not self.pool_checkbox.isChecked() and not self.sender_combo.currentText():
             QMessageBox.warning(self, "警告", "请先添加邮箱账号")
             return
 
@@ -969,20 +1201,11 @@ class SendEmailTab(QWidget):
         if reply != QMessageBox.Yes:
             return
 
-        # 获取发件人凭证
-        credentials = self.config_manager.get_account_credentials(sender_email)
-        if not credentials:
-            QMessageBox.critical(self, "错误", "获取邮箱凭证失败")
+        # 创建发送器(单个账号或多账号发送池)
+        sender = self._create_sender()
+        if sender is None:
             return
 
-        # 创建发送器
-        sender = EmailSender(
-            email=credentials["email"],
-            password=credentials["password"],
-            smtp_server=credentials["smtp_server"],
-            smtp_port=credentials["smtp_port"]
-        )
-
         # 创建工作线程
         self.worker = SendEmailWorker(
             sender=sender,
@@ -1011,6 +1234,7 @@ class SendEmailTab(QWidget):
     def send_finished(self, result):
         """发送完成"""
         self.send_btn.setEnabled(True)
+        self.send_btn.setText("立即发送")
 
         if "error" in result:
             QMessageBox.critical(self, "错误", f"发送失败:\n{result['error']}")
@@ -1021,6 +1245,8 @@ class SendEmailTab(QWidget):
             total = result["total"]
 
             message = f"发送完成！\n\n总计: {total}\n成功: {success_count}\n失败: {failed_count}"
+            if result.get("cancelled"):
+                message = f"已停止发送\n\n已处理: {total}\n成功: {success_count}\n失败: {failed_count}"
 
             if failed_count > 0:
                 failed_list = "\n".join([f"{item['recipient']}: {item['error']}" for item in result["failed"][:5]])
@@ -1031,6 +1257,110 @@ class SendEmailTab(QWidget):
             QMessageBox.information(self, "发送结果", message)
             self.main_window.update_status(f"发送完成: {success_count}/{total}")
 
+    def browse_merge_file(self):
+        """浏览选择邮件合并的收件人表"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "选择收件人表",
+            "",
+            "收件人表 (*.csv *.xlsx *.xlsm *.xls);;所有文件 (*)"
+        )
+        if file_path:
+            self.merge_file_input.setText(file_path)
+            self.load_merge_columns()
+
+    def load_merge_columns(self, selected=None):
+        """读取收件人表的列名,自动选中邮箱列"""
+        self.merge_column_combo.clear()
+        file_path = self.merge_file_input.text().strip()
+        if not file_path or not os.path.exists(file_path):
+            return
+        try:
+            columns = read_columns(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"读取收件人表失败:\n{str(e)}")
+            return
+        self.merge_column_combo.addItems(columns)
+        column = selected if selected in columns else find_email_column(columns)
+        if column:
+            self.merge_column_combo.setCurrentText(column)
+
+    def _create_mail_merge(self, sender):
+        """根据界面设置创建邮件合并,设置不完整时提示并返回None"""
+        file_path = self.merge_file_input.text().strip()
+        if not file_path or not os.path.exists(file_path):
+            QMessageBox.warning(self, "警告", "请选择收件人表")
+            return None
+        if not self.merge_column_combo.currentText():
+            QMessageBox.warning(self, "警告", "收件人表中没有数据,或未选择邮箱列")
+            return None
+
+        subject = self.subject_input.text().strip()
+        content = self.content_input.toPlainText().strip()
+        if not subject or not content:
+            QMessageBox.warning(self, "警告", "请填写邮件主题和正文模板(可使用 {列名})")
+            return None
+
+        try:
+            return MailMerge(
+                sender, subject, content,
+                email_column=self.merge_column_combo.currentText(),
+                is_html=self.html_checkbox.isChecked(),
+                attachments=self.attachments if self.attachments else None
+            )
+        except TemplateError as e:
+            QMessageBox.critical(self, "模板错误", f"主题或正文模板有误:\n{str(e)}")
+            return None
+
+    def preview_mail_merge(self):
+        """预览前3个收件人的邮件"""
+        mail_merge = self._create_mail_merge(sender=None)
+        if mail_merge is None:
+            return
+        try:
+            previews = mail_merge.preview(self.merge_file_input.text().strip())
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"预览失败:\n{str(e)}")
+            return
+
+        text = "\n\n".join(
+            f"收件人: {recipient}\n主题: {subject}\n{'-' * 40}\n{body[:300]}"
+            for recipient, subject, body in previews
+        )
+        QMessageBox.information(self, "邮件合并预览", text or "收件人表中没有数据")
+
+    def send_mail_merge(self):
+        """按收件人表逐行发送个性化邮件"""
+        if not self.pool_checkbox.isChecked() and not self.sender_combo.currentText():
+            QMessageBox.warning(self, "警告", "请先添加邮箱账号")
+            return
+
+        if self._create_mail_merge(sender=None) is None:
+            return
+
+        reply = QMessageBox.question(
+            self,
+            "确认发送",
+            f"确定要按收件人表 {os.path.basename(self.merge_file_input.text().strip())} 逐行发送邮件吗？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        sender = self._create_sender()
+        if sender is None:
+            return
+
+        self.worker = MailMergeWorker(self._create_mail_merge(sender), self.merge_file_input.text().strip())
+        self.worker.progress.connect(self.update_progress)
+        self.worker.finished.connect(self.send_finished)
+
+        # 发送中按钮用于停止发送
+        self.send_btn.setText("停止发送")
+        self.main_window.update_status("正在发送邮件合并...")
+        self.worker.start()
+
     def browse_batch_folder(self):
         """浏览选择Excel文件夹"""
         folder_path = QFileDialog.getExistingDirectory(
@@ -1105,7 +1435,20 @@ class SendEmailTab(QWidget):
 
         # 执行脚本
         self.main_window.update_status("正在测试脚本...")
-        success, output = self.script_executor.execute_script(script_code, context)
+        if self.script_executor.is_batch_script(script_code):
+            # generate_contents(contexts): 用所有文件测试,显示第一个文件的内容
+            contexts = [dict(context, file=path, index=index,
+                             filename=os.path.splitext(os.path.basename(path))[0],
+                             filename_full=os.path.basename(path))
+                        for index, path in enumerate(self.excel_files, 1)]
+            success, output = self.script_executor.execute_batch(script_code, contexts)[0]
+        elif self.batch_profile_checkbox.isChecked():
+            success, output, report = self.script_executor.execute_script(script_code, context, profile=True)
+            self.show_profile_report(success, output, report)
+            self.main_window.update_status("脚本性能分析完成")
+            return
+        else:
+            success, output = self.script_executor.execute_script(script_code, context)
 
         if success:
             # 显示测试结果
@@ -1152,7 +1495,8 @@ class SendEmailTab(QWidget):
             subject_template,
             script_code,
             1,
-            len(self.excel_files)
+            len(self.excel_files),
+            excel_files=self.excel_files
         )
 
         if success:
@@ -1171,8 +1515,7 @@ class SendEmailTab(QWidget):
     def send_batch_data_email(self):
         """发送批量数据邮件"""
         # 获取发件人
-        sender_email = self.sender_combo.currentText()
-        if not sender_email:
+        if not self.pool_checkbox.isChecked() and not self.sender_combo.currentText():
             QMessageBox.warning(self, "警告", "请先添加邮箱账号")
             return
 
@@ -1229,21 +1572,12 @@ class SendEmailTab(QWidget):
         if reply != QMessageBox.Yes:
             return
 
-        # 获取发件人凭证
-        credentials = self.config_manager.get_account_credentials(sender_email)
-        if not credentials:
-            QMessageBox.critical(self, "错误", "获取邮箱凭证失败")
+        # 创建发送器(单个账号或多账号发送池)
+        sender = self._create_sender()
+        if sender is None:
             return
 
-        # 创建发送器
-        sender = EmailSender(
-            email=credentials["email"],
-            password=credentials["password"],
-            smtp_server=credentials["smtp_server"],
-            smtp_port=credentials["smtp_port"]
-        )
-
-        batch_sender = BatchDataEmailSender(sender, self.script_executor)
+        batch_sender = BatchDataEmailSender(sender, self._get_batch_executor())
 
         # 创建工作线程
         self.batch_worker = BatchDataEmailWorker(
@@ -1267,6 +1601,21 @@ class SendEmailTab(QWidget):
         # 启动线程
         self.batch_worker.start()
 
+    def _get_batch_executor(self):
+        """批量数据发送使用的脚本执行器(勾选独立进程时使用进程池)"""
+        if not self.batch_isolated_checkbox.isChecked():
+            return self.script_executor
+        if self.script_pool is None:
+            self.script_pool = ScriptProcessPool(cache=self.script_executor.cache,
+                                                 analyzer=self.script_executor.analyzer)
+        return self.script_pool
+
+    def shutdown(self):
+        """退出程序前结束脚本进程池的子进程"""
+        if self.script_pool is not None:
+            self.script_pool.close()
+            self.script_pool = None
+
     def batch_send_finished(self, result):
         """批量发送完成"""
         self.send_btn.setEnabled(True)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发送额度账本模块
+按账号、按小时记录已发送的邮件数(SQLite,多个进程共用),
+用于计算每小时/每天的剩余额度,在达到邮箱服务商限制之前暂停发送
+"""
+
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+
+# 默认账本文件
+DEFAULT_LEDGER_FILE = "send_ledger.db"
+
+# 各邮箱服务商的默认发送限制(按发件邮箱域名),账号配置中设置了限制时以账号配置为准
+PROVIDER_LIMITS = {
+    "163.com": {"hourly": 100, "daily": 500},
+    "126.com": {"hourly": 100, "daily": 500},
+    "yeah.net": {"hourly": 100, "daily": 500},
+    "qq.com": {"hourly": 100, "daily": 500},
+    "sina.com": {"hourly": 50, "daily": 300},
+}
+
+# 未知服务商: 只记录发送数,不限制
+NO_LIMITS = {"hourly": None, "daily": None}
+
+# 超出额度时写入发送结果的错误信息前缀
+QUOTA_ERROR = "已达到发送额度上限"
+
+# 账本保留的天数
+RETENTION_DAYS = 7
+
+
+def format_usage(sent: int, limit: Optional[int]) -> str:
+    """已发送数/上限, 如 "12/100" 或 "12/不限" """
+    return f"{sent}/{limit if limit is not None else '不限'}"
+
+
+def _hour_bucket(moment: datetime) -> str:
+    """小时桶的键, 如 "2024-01-01 09" """
+    return moment.strftime('%Y-%m-%d %H')
+
+
+class SendLedger:
+    """按账号统计每小时/每天发送数的账本"""
+
+    def __init__(self, ledger_file: str = DEFAULT_LEDGER_FILE, limits: Dict[str, Dict] = None):
+        """
+        初始化账本
+
+        Args:
+            ledger_file: 账本文件路径, ":memory:" 表示只保存在内存
+            limits: 按账号设置的发送限制 {邮箱: {"hourly": 数量, "daily": 数量}},
+                    数量为None时使用服务商默认值,为0时不限制
+        """
+        self.ledger_file = ledger_file
+        self.limits = {}
+        for email, value in (limits or {}).items():
+            self.set_limits(email, value.get("hourly"), value.get("daily"))
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(ledger_file, timeout=10, check_same_thread=False)
+        if ledger_file != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sends ("
+            "email TEXT NOT NULL, hour TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (email, hour))"
+        )
+        self._conn.commit()
+        self._prune()
+
+    def _prune(self):
+        """删除超过保留天数的记录"""
+        cutoff = _hour_bucket(datetime.now() - timedelta(days=RETENTION_DAYS))
+        with self._lock:
+            self._conn.execute("DELETE FROM sends WHERE hour < ?", (cutoff,))
+            self._conn.commit()
+
+    def set_limits(self, email: str, hourly: int = None, daily: int = None):
+        """
+        设置账号的发送限制
+
+        Args:
+            hourly: 每小时上限, None表示使用服务商默认值, 0表示不限制
+            daily: 每天上限, 同上
+        """
+        self.limits[email] = {"hourly": hourly, "daily": daily}
+
+    @staticmethod
+    def provider_limits(email: str) -> Dict:
+        """服务商的默认发送限制,未知服务商不限制"""
+        domain = email.rsplit("@", 1)[-1].lower()
+        return PROVIDER_LIMITS.get(domain, NO_LIMITS)
+
+    def get_limits(self, email: str) -> Dict:
+        """获取账号的发送限制 {"hourly", "daily"},None表示不限制"""
+        defaults = self.provider_limits(email)
+        configured = self.limits.get(email, {})
+        limits = {}
+        for period in ("hourly", "daily"):
+            value = configured.get(period)
+            if value is None:
+                value = defaults[period]
+            limits[period] = value or None
+        return limits
+
+    def record(self, email: str, count: int = 1, moment: datetime = None):
+        """记录发送成功的邮件数"""
+        if count <= 0:
+            return
+        bucket = _hour_bucket(moment or datetime.now())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sends (email, hour, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(email, hour) DO UPDATE SET count = count + excluded.count",
+                (email, bucket, count)
+            )
+            self._conn.commit()
+
+    def get_usage(self, email: str) -> Dict:
+        """
+        获取账号当前的发送情况
+
+        Returns:
+            {"hourly_sent", "hourly_limit", "daily_sent", "daily_limit", "remaining"},
+            不限制时对应的 limit 为None, 两项都不限制时 remaining 为None
+        """
+        now = datetime.now()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hour, count FROM sends WHERE email = ? AND hour >= ?",
+                (email, now.strftime('%Y-%m-%d'))
+            ).fetchall()
+
+        current_hour = _hour_bucket(now)
+        hourly_sent = sum(count for hour, count in rows if hour == current_hour)
+        daily_sent = sum(count for _, count in rows)
+        limits = self.get_limits(email)
+        left = [limit - sent for limit, sent in ((limits["hourly"], hourly_sent), (limits["daily"], daily_sent))
+                if limit is not None]
+        return {
+            "hourly_sent": hourly_sent,
+            "hourly_limit": limits["hourly"],
+            "daily_sent": daily_sent,
+            "daily_limit": limits["daily"],
+            "remaining": max(0, min(left)) if left else None
+        }
+
+    def remaining(self, email: str) -> Optional[int]:
+        """现在还能发送的邮件数(本小时和今天剩余额度的较小值),None表示不限制"""
+        return self.get_usage(email)["remaining"]
+
+    def wait_time(self, email: str) -> int:
+        """
+        距离可以继续发送还需等待的秒数
+
+        Returns:
+            0表示现在可以发送;本小时额度用完时为到下一小时的秒数;
+            今日额度用完时为到明天0点的秒数
+        """
+        usage = self.get_usage(email)
+        if usage["remaining"] is None or usage["remaining"] > 0:
+            return 0
+        now = datetime.now()
+        if usage["daily_limit"] is not None and usage["daily_sent"] >= usage["daily_limit"]:
+            reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            reset = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        return int((reset - now).total_seconds()) + 1
+
+    def quota_message(self, email: str) -> str:
+        """额度用完时的提示信息"""
+        usage = self.get_usage(email)
+        return (f"{QUOTA_ERROR}(本小时 {format_usage(usage['hourly_sent'], usage['hourly_limit'])}, "
+                f"今日 {format_usage(usage['daily_sent'], usage['daily_limit'])})")
+
+    def close(self):
+        """关闭账本"""
+        with self._lock:
+            self._conn.close()
+
+
+_default_ledger = None
+_default_limits = {}
+_default_lock = threading.Lock()
+
+
+def get_default_ledger() -> SendLedger:
+    """获取所有发送器共用的默认账本(首次使用时打开)"""
+    global _default_ledger
+    with _default_lock:
+        if _default_ledger is None:
+            _default_ledger = SendLedger(limits=_default_limits)
+        return _default_ledger
+
+
+def configure_limits(limits: Dict[str, Dict]):
+    """
+    设置默认账本中各账号的发送限制(来自账号配置,账本尚未打开时在打开后生效)
+
+    Args:
+        limits: {邮箱: {"hourly": 数量, "daily": 数量}}, 含义同 SendLedger.set_limits
+    """
+    global _default_limits
+    with _default_lock:
+        _default_limits = dict(limits)
+        if _default_ledger is not None:
+            _default_ledger.limits = {email: {"hourly": value.get("hourly"), "daily": value.get("daily")}
+                                      for email, value in _default_limits.items()}
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("发送额度账本模块加载成功")
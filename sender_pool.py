@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多账号发送池模块
+把大批量发送分散到多个发件账号: 按剩余额度和近期错误率加权轮询,
+账号被限流时自动切换到其他账号,不同账号并行发送
+"""
+
+import re
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional, Callable, Tuple
+
+from email_sender import EmailSender
+from send_ledger import QUOTA_ERROR
+
+
+# 表示账号被限流或暂时不可用的SMTP回复码,剩余收件人转给其他账号发送
+THROTTLE_CODES = {421, 450, 451, 452}
+
+# 5xx回复只有包含这些文字时才认为是限流(其他5xx是永久性拒绝,换账号也无法发送)
+RATE_LIMIT_WORDS = ("rate", "limit", "too many", "频率", "超限")
+
+# 错误信息开头的SMTP回复码: "(554, b'...')" 或 "SMTP连接错误: (421, b'...')"
+_REPLY_CODE = re.compile(r"^(?:SMTP连接错误: )?\(?(\d{3})\b")
+
+
+def _reply_code(item: Dict) -> Optional[int]:
+    """失败明细中的SMTP回复码(发送器记录的 smtp_code,或错误信息开头的回复码)"""
+    code = item.get("smtp_code")
+    if code is None:
+        match = _REPLY_CODE.match(str(item.get("error", "")))
+        code = int(match.group(1)) if match else None
+    return code
+
+
+def _is_throttle_error(item: Dict) -> bool:
+    error = str(item.get("error", ""))
+    if error.startswith(QUOTA_ERROR):
+        return True
+    code = _reply_code(item)
+    if code is None:
+        # 没有回复码的连接错误(无法连接、连接被断开等)
+        return error.startswith("SMTP连接错误") or "too many" in error.lower()
+    if code in THROTTLE_CODES:
+        return True
+    return 500 <= code < 600 and any(word in error.lower() for word in RATE_LIMIT_WORDS)
+
+
+def is_throttled(result: Dict) -> bool:
+    """发送结果是否表示账号被限流(整批失败且包含限流类错误)"""
+    if result.get("success_count", 0) > 0 or not result.get("failed"):
+        return False
+    return any(_is_throttle_error(item) for item in result["failed"])
+
+
+class PoolMember:
+    """发送池中的一个账号"""
+
+    def __init__(self, sender: EmailSender, weight: float = 1.0, error_window: int = 20):
+        self.sender = sender
+        self.email = sender.email
+        self.base_weight = weight
+        self.current_weight = 0.0  # 平滑加权轮询的当前权重
+        self.recent = deque(maxlen=error_window)  # 最近发送是否成功
+        self.throttled_until = 0.0
+        self.in_flight = 0
+
+    def error_rate(self) -> float:
+        """最近的发送失败率"""
+        if not self.recent:
+            return 0.0
+        return 1 - sum(self.recent) / len(self.recent)
+
+    def record(self, success_count: int, failed_count: int):
+        """记录一次发送结果"""
+        self.recent.extend([True] * success_count + [False] * failed_count)
+
+    def is_throttled(self) -> bool:
+        return time.time() < self.throttled_until
+
+
+class SenderPool:
+    """
+    多账号发送池
+
+    提供与 EmailSender 相同的 send_email 接口,可以直接替代单个发送器
+    (BulkEmailSender、BatchDataEmailSender、定时任务均可使用)。
+    """
+
+    def __init__(self, senders: List[EmailSender], weights: Dict[str, float] = None,
+                 quota_provider: Callable[[str], Optional[int]] = None,
+                 cooldown: int = 300, max_in_flight: int = 1):
+        """
+        初始化发送池
+
+        Args:
+            senders: 发件账号的发送器列表
+            weights: 账号基础权重 {邮箱: 权重},默认都为1
+            quota_provider: 返回账号剩余额度的函数(None表示不限), 额度为0的账号不再分配。
+                            默认使用发送器的额度账本
+            cooldown: 账号被限流后暂停使用的时间(秒)
+            max_in_flight: 每个账号同时发送的批次数
+        """
+        if not senders:
+            raise ValueError("发送池至少需要一个账号")
+        weights = weights or {}
+        self.members = [PoolMember(s, weights.get(s.email, 1.0)) for s in senders]
+        if quota_provider is None and all(hasattr(s, "remaining_quota") for s in senders):
+            quota_provider = lambda email: self._member(email).sender.remaining_quota()
+        self.quota_provider = quota_provider
+        self.cooldown = cooldown
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        # 第一个账号的邮箱,便于当作普通发送器显示
+        self.email = self.members[0].email
+
+    def _member(self, email: str) -> PoolMember:
+        return next(m for m in self.members if m.email == email)
+
+    @property
+    def account_count(self) -> int:
+        """当前可用(未被限流)的账号数"""
+        return sum(1 for m in self.members if not m.is_throttled()) or 1
+
+    def _read_quotas(self, exclude=()) -> Dict[str, Optional[int]]:
+        """读取各账号的剩余额度(查询账本,在获取锁之前调用)"""
+        if not self.quota_provider:
+            return {}
+        return {m.email: self.quota_provider(m.email) for m in self.members
+                if m.email not in exclude and not m.is_throttled()}
+
+    def _effective_weight(self, member: PoolMember, quotas: Dict[str, Optional[int]]) -> float:
+        """综合剩余额度和错误率的权重, 0表示不可用"""
+        if member.is_throttled():
+            return 0.0
+        weight = member.base_weight * (1.0 - 0.9 * member.error_rate())
+        if self.quota_provider:
+            remaining = quotas.get(member.email)
+            if remaining is not None:
+                if remaining <= 0:
+                    return 0.0
+                # 剩余额度较少的账号分到的批次相应减少
+                weight *= min(1.0, remaining / 100.0)
+        return weight
+
+    def _pick(self, exclude=(), respect_in_flight: bool = False) -> Optional[PoolMember]:
+        """平滑加权轮询选择账号(与nginx相同的算法)"""
+        quotas = self._read_quotas(exclude)
+        with self._lock:
+            candidates = []
+            for member in self.members:
+                if member.email in exclude:
+                    continue
+                if respect_in_flight and member.in_flight >= self.max_in_flight:
+                    continue
+                weight = self._effective_weight(member, quotas)
+                if weight > 0:
+                    candidates.append((member, weight))
+            if not candidates:
+                return None
+
+            total = sum(weight for _, weight in candidates)
+            for member, weight in candidates:
+                member.current_weight += weight
+            chosen = max(candidates, key=lambda item: item[0].current_weight)[0]
+            chosen.current_weight -= total
+            chosen.in_flight += 1
+            return chosen
+
+    def _has_candidate(self, exclude=()) -> bool:
+        """是否还有可用的账号(不考虑正在发送的批次数)"""
+        quotas = self._read_quotas(exclude)
+        with self._lock:
+            return any(m.email not in exclude and self._effective_weight(m, quotas) > 0
+                       for m in self.members)
+
+    def _finish(self, member: PoolMember, result: Dict):
+        """记录批次结果,限流时暂停该账号"""
+        with self._lock:
+            member.in_flight -= 1
+            member.record(result.get("success_count", 0), result.get("failed_count", 0))
+            if is_throttled(result):
+                member.throttled_until = time.time() + self.cooldown
+                print(f"发件账号 {member.email} 可能被限流,暂停使用 {self.cooldown} 秒")
+
+    def _send_with(self, member: PoolMember, recipients, subject, content, attachments, is_html) -> Dict:
+        try:
+            return member.sender.send_email(recipients, subject, content, attachments, is_html)
+        except Exception as e:
+            return {"success": [], "failed": [{"recipient": r, "error": f"SMTP连接错误: {e}"} for r in recipients],
+                    "total": len(recipients), "success_count": 0, "failed_count": len(recipients)}
+
+    def _send_personalized_with(self, member: PoolMember, messages, attachments, is_html, cancel_event) -> Dict:
+        try:
+            return member.sender.send_personalized(messages, attachments, is_html, cancel_event=cancel_event)
+        except Exception as e:
+            return {"success": [], "failed": [{"recipient": r, "error": f"SMTP连接错误: {e}"} for r, _, _ in messages],
+                    "total": len(messages), "success_count": 0, "failed_count": len(messages)}
+
+    def send_email(self, recipients: List[str], subject: str, content: str,
+                   attachments: Optional[List[str]] = None, is_html: bool = False) -> dict:
+        """
+        用轮询选出的账号发送一批邮件,账号被限流时换下一个账号重试
+
+        Returns:
+            与 EmailSender.send_email 相同的结果字典(额外包含 sender 字段)
+        """
+        tried = set()
+        result = None
+        while True:
+            member = self._pick(exclude=tried)
+            if member is None:
+                break
+            tried.add(member.email)
+            result = self._send_with(member, recipients, subject, content, attachments, is_html)
+            self._finish(member, result)
+            result["sender"] = member.email
+            if not is_throttled(result):
+                return result
+
+        if result is None:
+            result = {"success": [], "failed": [{"recipient": r, "error": "没有可用的发件账号"} for r in recipients],
+                      "total": len(recipients), "success_count": 0, "failed_count": len(recipients)}
+        return result
+
+    def send_personalized(self, messages: List[Tuple[str, str, str]],
+                          attachments: Optional[List[str]] = None, is_html: bool = False,
+                          cancel_event=None) -> dict:
+        """
+        用轮询选出的账号在一次SMTP连接中发送一批内容不同的邮件(邮件合并)
+
+        账号被限流时整批换下一个账号重试;超出该账号额度而未发送的邮件转给其他账号。
+
+        Args:
+            messages: [(收件人, 主题, 内容)]
+            cancel_event: 设置后不再发送剩余的邮件(threading.Event),每封邮件发送前检查
+
+        Returns:
+            与 EmailSender.send_personalized 相同的结果字典(额外包含 per_sender: {邮箱: 成功数})
+        """
+        success, failed = [], []
+        per_sender = {}
+        pending = list(messages)
+        unsent = []  # 最后一次尝试中未发送的收件人的错误
+        tried = set()
+        cancelled = False
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            member = self._pick(exclude=tried)
+            if member is None:
+                errors = {item["recipient"]: item["error"] for item in unsent}
+                failed.extend({"recipient": r, "error": errors.get(r, "没有可用的发件账号")}
+                              for r, _, _ in pending)
+                break
+            tried.add(member.email)
+            result = self._send_personalized_with(member, pending, attachments, is_html, cancel_event)
+            self._finish(member, result)
+            if is_throttled(result) and not result.get("cancelled"):
+                unsent = result["failed"]
+                continue
+
+            success.extend(result["success"])
+            per_sender[member.email] = per_sender.get(member.email, 0) + result["success_count"]
+            if result.get("cancelled"):
+                failed.extend(result["failed"])
+                cancelled = True
+                break
+            unsent = [item for item in result["failed"] if str(item.get("error", "")).startswith(QUOTA_ERROR)]
+            failed.extend(item for item in result["failed"]
+                          if not str(item.get("error", "")).startswith(QUOTA_ERROR))
+            over_quota = {item["recipient"] for item in unsent}
+            pending = [message for message in pending if message[0] in over_quota]
+
+        result = {
+            "success": success,
+            "failed": failed,
+            "total": len(messages),
+            "success_count": len(success),
+            "failed_count": len(failed),
+            "per_sender": per_sender
+        }
+        if cancelled:
+            result["cancelled"] = True
+        return result
+
+    def send_bulk_email(self, recipients: List[str], subject: str, content: str,
+                        attachments: Optional[List[str]] = None, is_html: bool = False,
+                        batch_size: int = 10) -> dict:
+        """
+        把收件人分批后分配给多个账号并行发送
+
+        每个账号同时只发送 max_in_flight 个批次;被限流账号的批次转给其他账号重试。
+
+        Returns:
+            发送结果统计(额外包含 per_sender: {邮箱: 成功数})
+        """
+        pending = deque(
+            (recipients[i:i + batch_size], frozenset())
+            for i in range(0, len(recipients), batch_size)
+        )
+        success, failed = [], []
+        per_sender = {}
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=len(self.members) * self.max_in_flight) as executor:
+            while pending or futures:
+                # 为等待中的批次分配空闲账号
+                deferred = deque()
+                while pending:
+                    batch, tried = pending.popleft()
+                    member = self._pick(exclude=tried, respect_in_flight=True)
+                    if member is not None:
+                        future = executor.submit(self._send_with, member, batch, subject,
+                                                 content, attachments, is_html)
+                        futures[future] = (member, batch, tried)
+                    elif self._has_candidate(exclude=tried):
+                        deferred.append((batch, tried))  # 账号都在发送中,稍后再分配
+                    else:
+                        failed.extend({"recipient": r, "error": "没有可用的发件账号"} for r in batch)
+                pending = deferred
+
+                if not futures:
+                    if pending:
+                        # 有可用账号但暂时分配不到(其他发送占用账号、冷却刚好结束等),稍后重新分配
+                        time.sleep(0.1)
+                        continue
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    member, batch, tried = futures.pop(future)
+                    result = future.result()
+                    self._finish(member, result)
+                    if is_throttled(result):
+                        pending.append((batch, tried | {member.email}))
+                        continue
+                    # 超出该账号额度而未发送的收件人转给其他账号
+                    over_quota = [item["recipient"] for item in result["failed"]
+                                  if str(item.get("error", "")).startswith(QUOTA_ERROR)]
+                    if over_quota:
+                        pending.append((over_quota, tried | {member.email}))
+                    success.extend(result["success"])
+                    failed.extend(item for item in result["failed"]
+                                  if not str(item.get("error", "")).startswith(QUOTA_ERROR))
+                    per_sender[member.email] = per_sender.get(member.email, 0) + result["success_count"]
+
+        return {
+            "success": success,
+            "failed": failed,
+            "total": len(recipients),
+            "success_count": len(success),
+            "failed_count": len(failed),
+            "per_sender": per_sender
+        }
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("多账号发送池模块加载成功")
@@ -5,28 +5,91 @@
 使用schedule库实现邮件定时发送功能
 """
 
+import copy
 import schedule
 import time
 import threading
+import zlib
 from datetime import datetime
-from typing import List, Dict, Callable
+from typing import List, Dict, Callable, Optional
 from email_sender import EmailSender
+from run_history import RunHistory
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# 本小时发送额度用完时任务最多推迟的秒数(今日额度用完时不推迟)
+MAX_QUOTA_DEFER = 3600
+
+
+def parse_time_of_day(time_str: str) -> int:
+    """将 "HH:MM" 或 "HH:MM:SS" 转换为当天的秒数"""
+    parts = [int(p) for p in time_str.strip().split(":")]
+    if len(parts) == 2:
+        parts.append(0)
+    hour, minute, second = parts
+    return hour * 3600 + minute * 60 + second
+
+
+def format_time_of_day(seconds: int) -> str:
+    """将当天的秒数转换为 "HH:MM:SS" """
+    seconds %= SECONDS_PER_DAY
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def spread_offset(task_name: str, window: int, deadline_gap: Optional[int] = None) -> int:
+    """
+    计算任务的错峰偏移量(秒)
+
+    偏移量由任务名称的哈希值决定,同一任务每次计算结果相同,
+    不同任务在窗口内近似均匀分布,从而把同一时刻的SMTP登录分散开。
+
+    Args:
+        task_name: 任务名称
+        window: 错峰窗口(秒), 0表示不错峰
+        deadline_gap: 距离最晚执行时间的秒数, 偏移量不会超过该值
+
+    Returns:
+        偏移秒数
+    """
+    if deadline_gap is not None:
+        window = min(window, deadline_gap)
+    if window <= 0:
+        return 0
+    return zlib.crc32(task_name.encode("utf-8")) % (window + 1)
 
 
 class TaskScheduler:
     """定时任务调度器"""
 
-    def __init__(self):
-        """初始化调度器"""
+    def __init__(self, spread_window: int = 0, history: RunHistory = None):
+        """
+        初始化调度器
+
+        Args:
+            spread_window: 错峰窗口(秒)。同一时刻的任务会按任务名确定性地
+                           分散到 [schedule_time, schedule_time + spread_window] 内,
+                           0 表示严格按设定时间执行
+            history: 执行历史记录器, None表示不记录
+        """
         self.is_running = False
         self.thread = None
+        self.spread_window = spread_window
+        self.history = history
         self.tasks = {}  # task_name -> schedule.Job
         self.task_callbacks = {}  # 任务执行回调
+        self.task_specs = {}  # task_name -> 调度参数(设定时间、最晚时间、执行函数)
+        self.listeners = []  # 任务状态变化监听器, 参数为任务名称
+        self.dependencies = {}  # task_name -> 前置任务列表(依赖任务不按时间执行)
+        self.completed_upstreams = {}  # task_name -> 本轮已成功完成的前置任务
+        self.chain_last_runs = {}  # task_name -> 依赖任务上次执行时间
+        self.deferred_jobs = {}  # task_name -> 因发送额度不足而推迟的一次性schedule.Job
 
     def add_task(self, task_name: str, schedule_time: str, sender: EmailSender,
                  recipients: List[str], subject: str, content: str,
                  attachments: List[str] = None, is_html: bool = False,
-                 callback: Callable = None):
+                 callback: Callable = None, deadline: str = None,
+                 depends_on: List[str] = None):
         """
         添加定时任务
 
@@ -40,10 +103,25 @@ class TaskScheduler:
             attachments: 附件列表
             is_html: 是否HTML格式
             callback: 任务执行后的回调函数
+            deadline: 最晚执行时间,格式同schedule_time。错峰偏移不会超过该时间
+            depends_on: 前置任务名称列表。指定后任务不再按时间执行,而是在所有
+                        前置任务都成功完成后立即执行(schedule_time被忽略)
         """
-        def task_function():
-            """任务执行函数"""
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 执行定时任务: {task_name}")
+        if depends_on and self._creates_cycle(task_name, depends_on):
+            raise ValueError(f"任务 {task_name} 的前置任务形成了循环依赖")
+
+        def task_function(scheduled_time=None):
+            """任务执行函数(推迟执行时传入原计划时间)"""
+            if scheduled_time is None:
+                # schedule在调用任务函数之后才会计算下次执行时间,此时next_run仍是本次的计划时间
+                job = self.tasks.get(task_name)
+                scheduled_time = job.next_run if job else None
+
+            if self._defer_for_quota(task_name, sender, scheduled_time):
+                return
+
+            start_time = datetime.now()
+            print(f"[{start_time.strftime('%Y-%m-%d %H:%M:%S')}] 执行定时任务: {task_name}")
 
             try:
                 result = sender.send_email(
@@ -56,51 +134,239 @@ class TaskScheduler:
 
                 print(f"任务 {task_name} 执行完成: 成功 {result['success_count']}, 失败 {result['failed_count']}")
 
-                # 执行回调
-                if callback:
-                    callback(task_name, result)
-
             except Exception as e:
                 print(f"任务 {task_name} 执行失败: {e}")
-                if callback:
-                    callback(task_name, {"error": str(e)})
+                result = {"error": str(e)}
+
+            # 记录执行历史
+            if self.history is not None:
+                self.history.record(task_name, scheduled_time, start_time, datetime.now(), result)
+
+            # 执行回调
+            if callback:
+                try:
+                    callback(task_name, result)
+                except Exception as e:
+                    print(f"任务 {task_name} 回调执行失败: {e}")
 
-        # 创建定时任务
-        job = schedule.every().day.at(schedule_time).do(task_function)
-        self.tasks[task_name] = job
+            # 本次执行后下次执行时间会变化,通知监听器
+            self._notify(task_name)
+
+            # 触发下游任务
+            success = "error" not in result and result.get("failed_count", 0) == 0
+            self._on_task_finished(task_name, success)
+
+        self.task_specs[task_name] = {
+            "schedule_time": schedule_time,
+            "deadline": deadline,
+            "function": task_function
+        }
 
         if callback:
             self.task_callbacks[task_name] = callback
 
-        print(f"已添加定时任务: {task_name}, 执行时间: 每天 {schedule_time}")
+        if depends_on:
+            # 依赖任务: 等待前置任务完成后触发
+            self.dependencies[task_name] = list(depends_on)
+            self.completed_upstreams[task_name] = set()
+            print(f"已添加依赖任务: {task_name}, 前置任务: {', '.join(depends_on)}")
+        else:
+            # 创建定时任务
+            run_time = self._schedule_job(task_name)
+            print(f"已添加定时任务: {task_name}, 执行时间: 每天 {run_time}")
+
+        self._notify(task_name)
+
+    def _defer_for_quota(self, task_name: str, sender: EmailSender,
+                         scheduled_time: Optional[datetime]) -> bool:
+        """
+        发件账号本小时的额度已用完时,把本次执行推迟到额度恢复后
+
+        Returns:
+            是否已推迟
+        """
+        ledger = getattr(sender, "ledger", None)
+        if ledger is None:
+            return False
+        try:
+            wait = ledger.wait_time(sender.email)
+        except Exception as e:
+            print(f"任务 {task_name}: 读取发送额度失败,不推迟执行: {e}")
+            return False
+        if wait <= 0 or wait > MAX_QUOTA_DEFER:
+            return False
+
+        def run_deferred():
+            self.deferred_jobs.pop(task_name, None)
+            spec = self.task_specs.get(task_name)
+            if spec:
+                spec["function"](scheduled_time)
+            return schedule.CancelJob
+
+        self._cancel_deferred(task_name)
+        self.deferred_jobs[task_name] = schedule.every(wait).seconds.do(run_deferred)
+        print(f"任务 {task_name}: {ledger.quota_message(sender.email)},推迟 {wait} 秒后执行")
+        self._notify(task_name)
+        return True
+
+    def _cancel_deferred(self, task_name: str):
+        """取消任务被推迟的执行"""
+        job = self.deferred_jobs.pop(task_name, None)
+        if job is not None:
+            schedule.cancel_job(job)
+
+    def _creates_cycle(self, task_name: str, depends_on: List[str]) -> bool:
+        """检查为task_name添加前置任务后是否形成循环依赖"""
+        stack = list(depends_on)
+        visited = set()
+        while stack:
+            upstream = stack.pop()
+            if upstream == task_name:
+                return True
+            if upstream in visited:
+                continue
+            visited.add(upstream)
+            stack.extend(self.dependencies.get(upstream, []))
+        return False
+
+    def get_dependents(self, task_name: str) -> List[str]:
+        """获取直接依赖于指定任务的下游任务"""
+        return [name for name, upstreams in self.dependencies.items() if task_name in upstreams]
+
+    def _on_task_finished(self, task_name: str, success: bool):
+        """
+        任务执行结束后推进依赖链
+
+        下游任务在本轮所有前置任务都成功后立即执行(在当前线程中依次执行,
+        因此整条链的耗时等于各任务实际耗时之和)。任一前置任务失败时,
+        下游任务本轮不再执行,等待前置任务下次运行。
+        """
+        for downstream in self.get_dependents(task_name):
+            completed = self.completed_upstreams[downstream]
+            if not success:
+                completed.clear()
+                print(f"前置任务 {task_name} 未成功,依赖任务 {downstream} 本轮不执行")
+                continue
+
+            completed.add(task_name)
+            if completed.issuperset(self.dependencies[downstream]):
+                completed.clear()
+                self.chain_last_runs[downstream] = datetime.now()
+                self.task_specs[downstream]["function"]()
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        添加任务状态监听器
+
+        任务添加、执行、删除或重新安排时间后,会以任务名称调用监听器。
+        监听器可能在调度线程中被调用。
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]):
+        """移除任务状态监听器"""
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, task_name: str):
+        """通知监听器任务状态已变化"""
+        for listener in list(self.listeners):
+            try:
+                listener(task_name)
+            except Exception as e:
+                print(f"任务状态监听器执行失败: {e}")
+
+    def get_run_time(self, task_name: str) -> Optional[str]:
+        """获取任务错峰后的实际执行时间("HH:MM:SS")"""
+        spec = self.task_specs.get(task_name)
+        if not spec or task_name in self.dependencies:
+            return None
+
+        base = parse_time_of_day(spec["schedule_time"])
+        deadline_gap = None
+        if spec["deadline"]:
+            deadline_gap = (parse_time_of_day(spec["deadline"]) - base) % SECONDS_PER_DAY
+
+        return format_time_of_day(base + spread_offset(task_name, self.spread_window, deadline_gap))
+
+    def _schedule_job(self, task_name: str) -> str:
+        """按错峰后的执行时间创建schedule任务,返回实际执行时间"""
+        run_time = self.get_run_time(task_name)
+        self.tasks[task_name] = schedule.every().day.at(run_time).do(
+            self.task_specs[task_name]["function"]
+        )
+        return run_time
+
+    def set_spread_window(self, seconds: int):
+        """修改错峰窗口,并重新安排已有任务的执行时间"""
+        self.spread_window = max(0, int(seconds))
+        for task_name, job in list(self.tasks.items()):
+            schedule.cancel_job(job)
+            self._schedule_job(task_name)
+            self._notify(task_name)
+        print(f"错峰窗口已设置为 {self.spread_window} 秒")
+
+    def has_task(self, task_name: str) -> bool:
+        """检查任务是否已添加(定时任务或依赖任务)"""
+        return task_name in self.task_specs
+
+    def get_task_names(self) -> List[str]:
+        """获取所有任务名称"""
+        return list(self.task_specs.keys())
 
     def remove_task(self, task_name: str) -> bool:
         """删除定时任务"""
-        if task_name in self.tasks:
-            schedule.cancel_job(self.tasks[task_name])
-            del self.tasks[task_name]
+        if task_name in self.task_specs:
+            if task_name in self.tasks:
+                schedule.cancel_job(self.tasks[task_name])
+                del self.tasks[task_name]
+            self.task_specs.pop(task_name, None)
+            self.dependencies.pop(task_name, None)
+            self.completed_upstreams.pop(task_name, None)
+            self.chain_last_runs.pop(task_name, None)
+            self._cancel_deferred(task_name)
+
+            dependents = self.get_dependents(task_name)
+            if dependents:
+                print(f"警告: 任务 {', '.join(dependents)} 依赖已删除的任务 {task_name},将不会再执行")
 
             if task_name in self.task_callbacks:
                 del self.task_callbacks[task_name]
 
             print(f"已删除定时任务: {task_name}")
+            self._notify(task_name)
             return True
         return False
 
     def get_task_info(self, task_name: str) -> Dict:
         """获取任务信息"""
+        deferred = self.deferred_jobs.get(task_name)
         if task_name in self.tasks:
             job = self.tasks[task_name]
+            if deferred is not None:
+                next_run = f"{deferred.next_run.strftime('%Y-%m-%d %H:%M:%S')}(额度不足,已推迟)"
+            else:
+                next_run = str(job.next_run) if job.next_run else "未知"
             return {
                 "task_name": task_name,
-                "next_run": str(job.next_run) if job.next_run else "未知",
+                "run_time": self.get_run_time(task_name),
+                "next_run": next_run,
                 "last_run": str(job.last_run) if job.last_run else "从未执行"
             }
+        if task_name in self.dependencies:
+            last_run = self.chain_last_runs.get(task_name)
+            return {
+                "task_name": task_name,
+                "run_time": None,
+                "depends_on": self.dependencies[task_name],
+                "next_run": f"等待前置任务: {', '.join(self.dependencies[task_name])}",
+                "last_run": str(last_run) if last_run else "从未执行"
+            }
         return None
 
     def get_all_tasks(self) -> List[Dict]:
         """获取所有任务信息"""
-        return [self.get_task_info(name) for name in self.tasks.keys()]
+        return [self.get_task_info(name) for name in self.task_specs.keys()]
 
     def _run_pending(self):
         """运行待执行的任务循环"""
@@ -139,6 +405,11 @@ class TaskScheduler:
         schedule.clear()
         self.tasks.clear()
         self.task_callbacks.clear()
+        self.task_specs.clear()
+        self.dependencies.clear()
+        self.completed_upstreams.clear()
+        self.chain_last_runs.clear()
+        self.deferred_jobs.clear()
         print("已清除所有定时任务")
 
     def is_active(self) -> bool:
@@ -149,9 +420,13 @@ class TaskScheduler:
 class ScheduleManager:
     """定时任务管理器"""
 
-    def __init__(self):
-        self.scheduler = TaskScheduler()
+    def __init__(self, spread_window: int = 0, history: RunHistory = None):
+        if history is None:
+            history = RunHistory()
+        self.history = history
+        self.scheduler = TaskScheduler(spread_window=spread_window, history=history)
         self.email_senders = {}  # email -> EmailSender
+        self.task_configs = {}  # 任务名称 -> 从配置添加时的任务定义(用于判断配置是否修改)
 
     def add_email_sender(self, email: str, sender: EmailSender):
         """添加邮件发送器"""
@@ -160,32 +435,121 @@ class ScheduleManager:
     def add_scheduled_task(self, task_name: str, schedule_time: str,
                           sender_email: str, recipients: List[str],
                           subject: str, content: str, attachments: List[str] = None,
-                          is_html: bool = False, callback: Callable = None) -> bool:
-        """添加定时任务"""
+                          is_html: bool = False, callback: Callable = None,
+                          deadline: str = None, depends_on: List[str] = None) -> bool:
+        """添加定时任务(指定depends_on时在前置任务成功完成后执行)"""
         if sender_email not in self.email_senders:
             print(f"发件人邮箱 {sender_email} 未配置")
             return False
 
         sender = self.email_senders[sender_email]
 
-        self.scheduler.add_task(
-            task_name=task_name,
-            schedule_time=schedule_time,
-            sender=sender,
-            recipients=recipients,
-            subject=subject,
-            content=content,
-            attachments=attachments,
-            is_html=is_html,
-            callback=callback
-        )
+        try:
+            self.scheduler.add_task(
+                task_name=task_name,
+                schedule_time=schedule_time,
+                sender=sender,
+                recipients=recipients,
+                subject=subject,
+                content=content,
+                attachments=attachments,
+                is_html=is_html,
+                callback=callback,
+                deadline=deadline,
+                depends_on=depends_on
+            )
+        except ValueError as e:
+            print(f"添加定时任务失败: {e}")
+            return False
 
         return True
 
     def remove_scheduled_task(self, task_name: str) -> bool:
         """删除定时任务"""
+        self.task_configs.pop(task_name, None)
         return self.scheduler.remove_task(task_name)
 
+    def add_task_from_config(self, config_manager, task: Dict, callback: Callable = None) -> bool:
+        """
+        按配置中的任务定义添加定时任务(自动创建发件人的EmailSender)
+
+        Args:
+            config_manager: 配置管理器
+            task: 配置中的任务字典
+            callback: 任务执行后的回调函数
+
+        Returns:
+            是否添加成功
+        """
+        sender_email = task["sender_email"]
+        if sender_email not in self.email_senders:
+            credentials = config_manager.get_account_credentials(sender_email)
+            if not credentials:
+                print(f"发件人邮箱 {sender_email} 未配置,跳过任务 {task['task_name']}")
+                return False
+            self.add_email_sender(sender_email, EmailSender(
+                email=credentials["email"],
+                password=credentials["password"],
+                smtp_server=credentials["smtp_server"],
+                smtp_port=credentials["smtp_port"]
+            ))
+
+        added = self.add_scheduled_task(
+            task_name=task["task_name"],
+            schedule_time=task["schedule_time"],
+            sender_email=sender_email,
+            recipients=task["recipients"],
+            subject=task["subject"],
+            content=task["content"],
+            is_html=task.get("is_html", False),
+            callback=callback,
+            deadline=task.get("deadline"),
+            depends_on=task.get("depends_on")
+        )
+        if added:
+            self.task_configs[task["task_name"]] = copy.deepcopy(task)
+        return added
+
+    def load_tasks_from_config(self, config_manager, callback: Callable = None) -> int:
+        """
+        从配置加载所有已启用的定时任务(已加载的任务会被跳过)
+
+        Returns:
+            新加载的任务数
+        """
+        loaded = 0
+        for task in config_manager.get_scheduled_tasks():
+            if not task.get("enabled", True) or self.scheduler.has_task(task["task_name"]):
+                continue
+            if self.add_task_from_config(config_manager, task, callback):
+                loaded += 1
+        return loaded
+
+    def sync_tasks_from_config(self, config_manager, callback: Callable = None):
+        """与配置同步: 删除配置中已不存在或已禁用的任务,重新加载修改过的任务,加载新增的任务"""
+        configured = {
+            task["task_name"]: task for task in config_manager.get_scheduled_tasks()
+            if task.get("enabled", True)
+        }
+        for task_name in self.scheduler.get_task_names():
+            task = configured.get(task_name)
+            previous = self.task_configs.get(task_name)
+            if task is None or (previous is not None and previous != task):
+                self.remove_scheduled_task(task_name)
+        return self.load_tasks_from_config(config_manager, callback)
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """添加任务状态监听器(任务添加、执行、删除、重新安排后以任务名称调用)"""
+        self.scheduler.add_listener(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]):
+        """移除任务状态监听器"""
+        self.scheduler.remove_listener(listener)
+
+    def set_spread_window(self, seconds: int):
+        """设置同一时刻任务的错峰窗口(秒)"""
+        self.scheduler.set_spread_window(seconds)
+
     def start_scheduler(self):
         """启动调度器"""
         self.scheduler.start()
@@ -202,6 +566,14 @@ class ScheduleManager:
         """获取所有任务状态"""
         return self.scheduler.get_all_tasks()
 
+    def get_run_history(self, task_name: str = None, limit: int = None) -> List[Dict]:
+        """获取任务执行历史(按时间从新到旧)"""
+        return self.history.get_records(task_name, limit)
+
+    def get_run_summary(self, task_name: str = None) -> Dict:
+        """获取执行统计摘要(包含延迟百分位数)"""
+        return self.history.get_summary(task_name)
+
     def is_running(self) -> bool:
         """检查调度器是否运行"""
         return self.scheduler.is_active()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板引擎模块
+把主题/正文模板预先编译为片段列表(文本、变量、条件、循环),渲染时按顺序一次拼接完成,
+同一模板渲染大量数据行(邮件合并、批量数据)时不必每次重新查找和替换
+
+模板语法:
+    {name}                          变量,没有提供的变量保留原样
+    {user.name} {items.0}           属性/键/下标
+    {amount|format:,.2f}            过滤器,可以串联: {name|strip|upper}
+    {% if vip %}...{% elif score >= 60 %}...{% else %}...{% endif %}
+    {% for row in rows %}{loop.index}. {row.name}{% endfor %}
+"""
+
+import re
+import html
+import operator
+import functools
+from collections import ChainMap
+from typing import Dict, Any, List, Callable
+
+
+class TemplateError(ValueError):
+    """模板语法错误"""
+
+
+# 标签 {% ... %} 或变量 {name|过滤器:参数}
+_TOKEN = re.compile(r"\{%\s*(.*?)\s*%\}|\{([\w.]+)((?:\|[^{}|\n]+)*)\}")
+
+# 条件表达式: [not] 值 [运算符 值]
+_CONDITION = re.compile(r"^(not\s+)?(.+?)(?:\s*(==|!=|>=|<=|>|<|\s+not\s+in\s+|\s+in\s+)\s*(.+))?$")
+
+_FOR = re.compile(r"^for\s+(\w+)\s+in\s+([\w.]+)$")
+
+_MISSING = object()
+
+_OPERATORS = {
+    "==": operator.eq, "!=": operator.ne,
+    ">": operator.gt, "<": operator.lt, ">=": operator.ge, "<=": operator.le,
+}
+
+
+class _SafeString(str):
+    """已经是HTML、不再转义的字符串(safe过滤器的结果)"""
+
+
+def _format(value, spec: str = "") -> str:
+    try:
+        return format(value, spec)
+    except (TypeError, ValueError):
+        # 从表格读出的数字可能是字符串
+        try:
+            return format(float(value), spec)
+        except (TypeError, ValueError):
+            return str(value)
+
+
+def _truncate(value, length: str = "50") -> str:
+    text = str(value)
+    length = int(length)
+    return text if len(text) <= length else text[:length] + "..."
+
+
+def _round(value, digits: str = "0") -> Any:
+    try:
+        return round(float(value), int(digits)) if int(digits) else round(float(value))
+    except (TypeError, ValueError):
+        return value
+
+
+# 过滤器: 名称 -> 函数(值, *参数)
+FILTERS: Dict[str, Callable] = {
+    "upper": lambda value: str(value).upper(),
+    "lower": lambda value: str(value).lower(),
+    "title": lambda value: str(value).title(),
+    "strip": lambda value: str(value).strip(),
+    "default": lambda value, default="": default if value is None or value == "" else value,
+    "format": _format,
+    "round": _round,
+    "int": lambda value: int(float(value)),
+    "truncate": _truncate,
+    "join": lambda value, sep=", ": sep.join(str(item) for item in value),
+    "length": len,
+    "escape": lambda value: _SafeString(html.escape(str(value))),
+    "safe": lambda value: _SafeString(value),
+    "nl2br": lambda value: _SafeString(html.escape(str(value)).replace("\n", "<br>\n")),
+}
+
+
+def register_filter(name: str, func: Callable):
+    """注册自定义过滤器 func(值, *参数)"""
+    FILTERS[name] = func
+
+
+def _lookup(scope, path: List[str]) -> Any:
+    """
+    按 a.b.c 取值: 键、下标或公开属性,找不到时返回 _MISSING
+
+    以下划线开头的属性和方法不可访问,避免模板通过 {a.__class__} 之类的字段访问Python内部对象
+    """
+    value = scope.get(path[0], _MISSING)
+    for part in path[1:]:
+        if value is _MISSING:
+            break
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif part.isdigit() and isinstance(value, (list, tuple)):
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        elif part.startswith("_"):
+            value = _MISSING
+        else:
+            value = getattr(value, part, _MISSING)
+            if callable(value):
+                value = _MISSING
+    return value
+
+
+class _Field:
+    """变量片段"""
+
+    def __init__(self, source: str, name: str, filters: str):
+        self.source = source
+        self.path = name.split(".")
+        self.filters = []
+        for spec in filters.split("|")[1:]:
+            filter_name, _, arg = spec.partition(":")
+            filter_name = filter_name.strip()
+            if filter_name not in FILTERS:
+                raise TemplateError(f"未知的过滤器: {filter_name}")
+            self.filters.append((filter_name, (arg,) if arg else ()))
+        self.has_default = any(filter_name == "default" for filter_name, _ in self.filters)
+        # 纯数字的变量名在格式字符串中会被当作位置参数
+        self.is_simple = not self.filters and len(self.path) == 1 and not name.isdigit()
+
+    def render(self, scope, parts: List[str], autoescape: bool):
+        value = _lookup(scope, self.path)
+        if value is _MISSING:
+            if not self.has_default:
+                # 没有提供的变量保留原样
+                parts.append(self.source)
+                return
+            value = None
+        for filter_name, args in self.filters:
+            try:
+                value = FILTERS[filter_name](value, *args)
+            except (TypeError, ValueError):
+                # 值不适用该过滤器(如对文字使用int)时保持原值
+                pass
+        if value is None:
+            return
+        text = str(value)
+        if autoescape and not isinstance(value, _SafeString):
+            text = html.escape(text)
+        parts.append(text)
+
+
+class _KeepMissing(dict):
+    """str.format_map 使用的变量表: 没有提供的变量保留原样"""
+
+    def __missing__(self, name: str) -> str:
+        return "{" + name + "}"
+
+
+class _Condition:
+    """if/elif 的条件"""
+
+    def __init__(self, expression: str):
+        match = _CONDITION.match(expression.strip())
+        if not match:
+            raise TemplateError(f"无法解析条件: {expression}")
+        negate, left, op, right = match.groups()
+        self.negate = bool(negate)
+        self.left = self._operand(left)
+        self.operator = op.strip() if op else None
+        self.right = self._operand(right) if right is not None else None
+
+    @staticmethod
+    def _operand(text: str):
+        """常量返回 ("const", 值),变量返回 ("var", 路径)"""
+        text = text.strip()
+        if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+            return ("const", text[1:-1])
+        if text in ("True", "False", "None"):
+            return ("const", {"True": True, "False": False, "None": None}[text])
+        try:
+            return ("const", int(text))
+        except ValueError:
+            pass
+        try:
+            return ("const", float(text))
+        except ValueError:
+            pass
+        if not re.match(r"^[\w.]+$", text):
+            raise TemplateError(f"无法解析条件中的值: {text}")
+        return ("var", text.split("."))
+
+    @staticmethod
+    def _value(operand, scope):
+        kind, value = operand
+        if kind == "const":
+            return value
+        value = _lookup(scope, value)
+        return None if value is _MISSING else value
+
+    def evaluate(self, scope) -> bool:
+        left = self._value(self.left, scope)
+        if self.operator is None:
+            result = bool(left)
+        else:
+            right = self._value(self.right, scope)
+            result = _compare(left, self.operator, right)
+        return not result if self.negate else result
+
+
+def _compare(left, op: str, right) -> bool:
+    if op == "in":
+        return right is not None and left in right
+    if op == "not in":
+        return right is None or left not in right
+    # 表格中的数字可能是字符串,两边都能转为数字时按数字比较
+    try:
+        left, right = float(left), float(right)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return _OPERATORS[op](left, right)
+    except TypeError:
+        return False
+
+
+class _If:
+    """条件片段"""
+
+    def __init__(self, condition: str):
+        self.branches = [(_Condition(condition), [])]
+        self.else_nodes = None
+
+    def render(self, scope, parts: List[str], autoescape: bool):
+        for condition, nodes in self.branches:
+            if condition.evaluate(scope):
+                _render_nodes(nodes, scope, parts, autoescape)
+                return
+        if self.else_nodes is not None:
+            _render_nodes(self.else_nodes, scope, parts, autoescape)
+
+
+class _For:
+    """循环片段, 循环中可用 loop.index(从1开始)、loop.first、loop.last"""
+
+    def __init__(self, var: str, path: str):
+        self.var = var
+        self.path = path.split(".")
+        self.nodes = []
+        self.else_nodes = None
+
+    def render(self, scope, parts: List[str], autoescape: bool):
+        items = _lookup(scope, self.path)
+        items = [] if items is _MISSING or items is None else list(items)
+        if not items:
+            if self.else_nodes is not None:
+                _render_nodes(self.else_nodes, scope, parts, autoescape)
+            return
+        last = len(items)
+        for index, item in enumerate(items, 1):
+            loop = {"index": index, "first": index == 1, "last": index == last}
+            _render_nodes(self.nodes, ChainMap({self.var: item, "loop": loop}, scope), parts, autoescape)
+
+
+def _render_nodes(nodes: list, scope, parts: List[str], autoescape: bool):
+    for node in nodes:
+        if type(node) is str:
+            parts.append(node)
+        else:
+            node.render(scope, parts, autoescape)
+
+
+def _parse(source: str) -> list:
+    """把模板解析为片段列表"""
+    root = []
+    stack = []  # [(片段, 当前写入的列表)]
+    current = root
+    position = 0
+
+    for match in _TOKEN.finditer(source):
+        if match.start() > position:
+            current.append(source[position:match.start()])
+        position = match.end()
+
+        tag = match.group(1)
+        if tag is None:
+            current.append(_Field(match.group(0), match.group(2), match.group(3)))
+            continue
+
+        keyword = tag.split(None, 1)[0] if tag else ""
+        rest = tag[len(keyword):].strip()
+        if keyword == "if":
+            node = _If(rest)
+            current.append(node)
+            stack.append(node)
+            current = node.branches[0][1]
+        elif keyword == "elif":
+            if not stack or not isinstance(stack[-1], _If) or stack[-1].else_nodes is not None:
+                raise TemplateError("elif 没有对应的 if")
+            stack[-1].branches.append((_Condition(rest), []))
+            current = stack[-1].branches[-1][1]
+        elif keyword == "else":
+            if not stack or stack[-1].else_nodes is not None:
+                raise TemplateError("else 没有对应的 if/for")
+            stack[-1].else_nodes = []
+            current = stack[-1].else_nodes
+        elif keyword == "for":
+            loop = _FOR.match(tag)
+            if not loop:
+                raise TemplateError(f"无法解析循环: {tag}(格式: for 变量 in 列表)")
+            node = _For(loop.group(1), loop.group(2))
+            current.append(node)
+            stack.append(node)
+            current = node.nodes
+        elif keyword in ("endif", "endfor"):
+            expected = _If if keyword == "endif" else _For
+            if not stack or not isinstance(stack[-1], expected):
+                raise TemplateError(f"{keyword} 没有对应的 {keyword[3:]}")
+            stack.pop()
+            current = _current_list(stack[-1]) if stack else root
+        else:
+            raise TemplateError(f"未知的标签: {{% {tag} %}}")
+
+    if stack:
+        name = "if" if isinstance(stack[-1], _If) else "for"
+        raise TemplateError(f"{name} 缺少对应的 end{name}")
+    if position < len(source):
+        current.append(source[position:])
+    return root
+
+
+def _current_list(node) -> list:
+    """块结束后继续写入外层块的当前分支"""
+    if node.else_nodes is not None:
+        return node.else_nodes
+    if isinstance(node, _If):
+        return node.branches[-1][1]
+    return node.nodes
+
+
+class CompiledTemplate:
+    """编译后的模板"""
+
+    def __init__(self, source: str, autoescape: bool = False):
+        """
+        编译模板
+
+        Args:
+            source: 模板字符串
+            autoescape: 是否对变量值进行HTML转义(HTML邮件正文使用, safe过滤器可跳过转义)
+
+        Raises:
+            TemplateError: 模板语法错误
+        """
+        self.source = source
+        self.autoescape = autoescape
+        self._nodes = _parse(source)
+        # 只有文本和简单变量(没有过滤器、条件、循环)的模板转为格式字符串,由 str.format_map 一次完成
+        self._format = None
+        if all(type(node) is str or (isinstance(node, _Field) and node.is_simple) for node in self._nodes):
+            self._names = [node.path[0] for node in self._nodes if type(node) is not str]
+            self._names = list(dict.fromkeys(self._names))
+            self._format = "".join(
+                node.replace("{", "{{").replace("}", "}}") if type(node) is str else node.source
+                for node in self._nodes
+            )
+
+    @property
+    def fields(self) -> List[str]:
+        """模板中直接用到的变量名(不含条件和循环内的变量)"""
+        return list(dict.fromkeys(".".join(node.path) for node in self._nodes if isinstance(node, _Field)))
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """
+        渲染模板
+
+        Args:
+            values: 变量字典。没有提供的变量保留原样(如 {unknown}),值为None时为空字符串
+
+        Returns:
+            渲染后的字符串
+        """
+        if self._format is not None:
+            # 每个变量只转换一次(同一变量出现多次时不重复转义)
+            scope = _KeepMissing()
+            for name in self._names:
+                value = values.get(name, _MISSING)
+                if value is _MISSING:
+                    continue
+                if value is None:
+                    value = ""
+                elif self.autoescape and not isinstance(value, _SafeString):
+                    value = html.escape(str(value))
+                scope[name] = value
+            return self._format.format_map(scope)
+        parts = []
+        _render_nodes(self._nodes, values, parts, self.autoescape)
+        return "".join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(source: str, autoescape: bool = False) -> CompiledTemplate:
+    """编译模板(相同的模板只编译一次)"""
+    return CompiledTemplate(source, autoescape)
+
+
+def render_template(source: str, values: Dict[str, Any], autoescape: bool = False) -> str:
+    """编译(有缓存)并渲染模板"""
+    return compile_template(source, autoescape).render(values)
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("模板引擎模块加载成功")
@@ -174,6 +174,442 @@ def generate_content():
     print()
 
 
+def test_process_pool():
+    """测试脚本进程池"""
+    print("=" * 50)
+    print("测试9: 脚本进程池(超时与并行)")
+    print("=" * 50)
+
+    from script_pool import ScriptProcessPool
+
+    pool = ScriptProcessPool(workers=2, timeout=5)
+    try:
+        success, output = pool.execute_script("result = context['name']", {"name": "进程池"})
+        print(f"成功: {success}, 输出: {output}")
+        assert success and output == "进程池"
+
+        # 死循环的脚本超时后被终止,进程池仍然可用
+        pool.timeout = 1
+        success, output = pool.execute_script("while True:\n    pass")
+        print(f"死循环: {success} - {output}")
+        assert not success and "超时" in output
+
+        pool.timeout = 30
+        results = pool.execute_many([(f"result = {i} * 2", {}) for i in range(4)])
+        print(f"并行执行: {results}")
+        assert [output for _, output in results] == ["0", "2", "4", "6"]
+    finally:
+        pool.close()
+
+    # 子进程使用与进程池相同的预检设置
+    from script_analyzer import ScriptAnalyzer
+    pool = ScriptProcessPool(workers=1, timeout=30, analyzer=ScriptAnalyzer(allowed_modules={"subprocess"}))
+    try:
+        success, output = pool.execute_script("import subprocess\nresult = 'ok'")
+        print(f"允许导入subprocess: {success} - {output}")
+        assert success and output == "ok"
+    finally:
+        pool.close()
+    print()
+
+
+def test_concurrent_output():
+    """测试多线程同时执行脚本时输出互不干扰"""
+    print("=" * 50)
+    print("测试10: 多线程并发执行")
+    print("=" * 50)
+
+    import threading
+
+    executor = ScriptExecutor()
+    outputs = {}
+
+    script = """
+import time
+for i in range(5):
+    print(f"{context['name']}-{i}")
+    time.sleep(0.01)
+"""
+
+    def run(name):
+        outputs[name] = executor.execute_script(script, {"name": name})
+
+    threads = [threading.Thread(target=run, args=(f"线程{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        # 其他线程的print不能混入脚本输出
+        print("主线程输出")
+        thread.join()
+
+    for name, (success, output) in sorted(outputs.items()):
+        print(f"{name}: {success} {output.split()}")
+        assert success and output.split() == [f"{name}-{i}" for i in range(5)]
+    print()
+
+
+def test_execution_limits():
+    """测试执行超时限制"""
+    print("=" * 50)
+    print("测试11: 执行超时限制")
+    print("=" * 50)
+
+    executor = ScriptExecutor(timeout=1)
+
+    # 脚本中的 except Exception 不能拦截超时
+    script = """
+while True:
+    try:
+        while True:
+            pass
+    except Exception:
+        pass
+"""
+
+    success, output = executor.execute_script(script)
+    print(f"成功: {success}")
+    print(f"错误信息: {output}")
+    print(f"详细信息: {executor.last_error_info}")
+    assert not success and executor.last_error_info["type"] == "timeout"
+
+    # 超时后执行器仍然可用
+    success, output = executor.execute_script("result = 'ok'")
+    assert success and output == "ok"
+    print()
+
+
+def test_lazy_modules():
+    """测试numpy/pandas延迟导入"""
+    print("=" * 50)
+    print("测试12: 常用模块延迟导入")
+    print("=" * 50)
+
+    executor = ScriptExecutor()
+    print(f"创建后: {executor._modules_cache['pd']!r}")
+
+    # 直接使用预置的pd变量,第一次使用时导入
+    success, output = executor.execute_script("result = pd.Series([1, 2, 3]).sum()")
+    print(f"成功: {success}, 输出: {output}")
+    print(f"执行后: {executor._modules_cache['pd'].__name__}")
+    assert success and output == "6"
+    print()
+
+
+def test_profile_mode():
+    """测试性能分析模式"""
+    print("=" * 50)
+    print("测试13: 性能分析模式")
+    print("=" * 50)
+
+    from script_executor import format_profile_report
+
+    executor = ScriptExecutor()
+
+    script = """
+def slow_part():
+    return sum(i * i for i in range(200000))
+
+def generate_content():
+    return f"结果: {slow_part()}"
+"""
+
+    success, output, report = executor.execute_script(script, profile=True)
+    print(f"成功: {success}, 输出: {output}")
+    print(format_profile_report(report, limit=5))
+    assert success
+    assert any(item["function"] == "slow_part" for item in report["hotspots"])
+    print()
+
+
+def test_result_cache():
+    """测试脚本结果缓存"""
+    print("=" * 50)
+    print("测试14: 脚本结果缓存")
+    print("=" * 50)
+
+    import os
+    import tempfile
+    from script_cache import ScriptResultCache
+
+    cache = ScriptResultCache(":memory:")
+    executor = ScriptExecutor(cache=cache)
+    script = """
+with open(context['file']) as f:
+    result = f"{context['name']}: {f.read()} (执行)"
+print("脚本执行了")
+"""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.txt")
+        with open(path, "w") as f:
+            f.write("v1")
+        context = {'file': path, 'name': '日报', 'date': '2024-01-01'}
+
+        first = executor.execute_script(script, context)
+        # date未在脚本中使用,变化时仍然命中缓存
+        second = executor.execute_script(script, dict(context, date='2024-01-02'))
+        print(f"第一次: {first}, 第二次: {second}, 统计: {cache.get_stats()}")
+        assert first == second == (True, "日报: v1 (执行)")
+        assert cache.hits == 1
+
+        # 文件修改后重新执行
+        with open(path, "w") as f:
+            f.write("v2")
+        os.utime(path, ns=(0, 10 ** 9))
+        third = executor.execute_script(script, context)
+        print(f"文件修改后: {third}")
+        assert third == (True, "日报: v2 (执行)")
+
+    # 超出大小上限时删除最久未使用的结果
+    small = ScriptResultCache(":memory:", max_size_mb=0.001)
+    for i in range(5):
+        small.put(f"key{i}", "x" * 400)
+    stats = small.get_stats()
+    print(f"小缓存统计: {stats}")
+    assert stats["size"] <= stats["max_size"]
+    assert small.get("key4") is not None and small.get("key0") is None
+    print()
+
+
+def test_batch_contents():
+    """测试 generate_contents(contexts) 一次生成所有文件的内容"""
+    print("=" * 50)
+    print("测试15: 批量生成内容")
+    print("=" * 50)
+
+    executor = ScriptExecutor()
+    script = """
+def generate_contents(contexts):
+    df = pd.DataFrame({'name': [c['filename'] for c in contexts],
+                       'sales': [c['sales'] for c in contexts]})
+    df['share'] = df['sales'] / df['sales'].sum() * 100
+    return [f"{row.name}: {row.sales} ({row.share:.0f}%)" for row in df.itertuples()]
+"""
+    contexts = [{'filename': '北京', 'sales': 300}, {'filename': '上海', 'sales': 100}]
+
+    assert executor.is_batch_script(script)
+    assert not executor.is_batch_script("result = 1")
+
+    results = executor.execute_batch(script, contexts)
+    print(f"结果: {results}")
+    assert results == [(True, "北京: 300 (75%)"), (True, "上海: 100 (25%)")]
+
+    # 返回的结果数不对时所有文件都失败
+    results = executor.execute_batch("def generate_contents(contexts):\n    return ['x']", contexts)
+    print(f"结果数不匹配: {results[0][1]}")
+    assert all(not success for success, _ in results)
+
+    # 预检未通过时与 execute_script 一样记录错误信息
+    results = executor.execute_batch("def generate_contents(contexts):\n    return [input()]", contexts)
+    assert not results[0][0] and executor.last_error_info["type"] == "forbidden"
+
+    # 预览与发送时一样处理所有文件,取预览文件的内容
+    import os
+    import tempfile
+    from batch_data_sender import BatchDataEmailSender
+    with tempfile.TemporaryDirectory() as folder:
+        files = [os.path.join(folder, name) for name in ("a.xlsx", "b.xlsx")]
+        for path in files:
+            open(path, "wb").close()
+        sender = BatchDataEmailSender(None, executor)
+        script = "def generate_contents(contexts):\n    return [f\"{c['filename']} {c['index']}/{len(contexts)}\" for c in contexts]"
+        success, subject, content = sender.preview_email(files[1], "{filename}", script, 2, 2)
+        print(f"预览: {subject} {content}")
+        assert success and subject == "b" and content == "b 2/2"
+    print()
+
+
+def test_mail_merge():
+    """测试邮件合并"""
+    print("=" * 50)
+    print("测试16: 邮件合并")
+    print("=" * 50)
+
+    import os
+    import tempfile
+    import openpyxl
+    from mail_merge import MailMerge, iter_rows
+
+    class FakeSender:
+        """记录发送内容的发送器, stop 不为空时模拟发送第一封后点击停止"""
+        def __init__(self, stop=None):
+            self.sent = []
+            self.stop = stop
+
+        def send_personalized(self, messages, attachments=None, is_html=False, cancel_event=None):
+            recipients = []
+            for message in messages:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                self.sent.append(message)
+                recipients.append(message[0])
+                if self.stop is not None:
+                    self.stop.set()
+            result = {"success": recipients, "failed": [], "total": len(messages),
+                      "success_count": len(recipients), "failed_count": 0}
+            if len(recipients) < len(messages):
+                result["cancelled"] = True
+            return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "list.csv")
+        with open(csv_path, "w", encoding="gbk") as f:
+            f.write("姓名,邮箱,金额\n张三,zhang@example.com,100\n李四,无效邮箱,50\n,,\n王五,wang@example.com,80\n")
+
+        xlsx_path = os.path.join(tmp, "list.xlsx")
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["姓名", "Email", "编号"])
+        workbook.active.append(["赵六", "zhao@example.com", 7.0])
+        workbook.save(xlsx_path)
+
+        sender = FakeSender()
+        merge = MailMerge(sender, "{姓名}的账单", "您好 {姓名}, 本月金额 {金额} 元 {未知}")
+        result = merge.send(csv_path, batch_size=1)
+        print(f"CSV结果: {result}")
+        assert result["total"] == 3 and result["success_count"] == 2 and result["failed_count"] == 1
+        assert sender.sent[0] == ("zhang@example.com", "张三的账单", "您好 张三, 本月金额 100 元 {未知}")
+
+        rows = list(iter_rows(xlsx_path))
+        print(f"Excel行: {rows}")
+        assert rows == [{"姓名": "赵六", "Email": "zhao@example.com", "编号": 7}]
+        assert MailMerge(sender, "{编号}", "x").preview(xlsx_path)[0][:2] == ("zhao@example.com", "7")
+
+        # 点击停止后同一批次中剩余的邮件不再发送
+        import threading
+        stop = threading.Event()
+        result = MailMerge(FakeSender(stop), "{姓名}", "x").send(csv_path, cancel_event=stop)
+        print(f"停止发送: {result}")
+        assert result["cancelled"] and result["success_count"] == 1 and result["total"] == 2
+
+    # 多账号发送池: 每批一次连接,超出额度的邮件转给其他账号
+    from sender_pool import SenderPool
+    from send_ledger import QUOTA_ERROR
+
+    class LimitedSender(FakeSender):
+        def __init__(self, email, quota):
+            super().__init__()
+            self.email = email
+            self.quota = quota
+            self.calls = 0
+
+        def send_personalized(self, messages, attachments=None, is_html=False, cancel_event=None):
+            self.calls += 1
+            result = super().send_personalized(messages[:self.quota])
+            result["failed"] = [{"recipient": r, "error": QUOTA_ERROR} for r, _, _ in messages[self.quota:]]
+            result["failed_count"] = len(result["failed"])
+            return result
+
+    first, second = LimitedSender("a@example.com", 1), LimitedSender("b@example.com", 10)
+    pool = SenderPool([first, second], quota_provider=lambda email: None)
+    messages = [(f"user{i}@example.com", "主题", "正文") for i in range(3)]
+    result = pool.send_personalized(messages)
+    print(f"发送池结果: {result['per_sender']}")
+    assert result["success_count"] == 3 and result["failed_count"] == 0
+    assert first.calls + second.calls == 2
+
+    # 按SMTP回复码判断限流: 错误信息中碰巧出现的数字和内容被拒绝的5xx不切换账号
+    from sender_pool import is_throttled
+    def failure(error):
+        return {"success_count": 0, "failed": [{"recipient": "a@example.com", "error": error}]}
+    assert is_throttled(failure("(421, b'Service not available')"))
+    assert is_throttled(failure("(554, b'Rate limit exceeded')"))
+    assert not is_throttled(failure("(554, b'Message content rejected')"))
+    assert not is_throttled(failure("(550, b'User user4210@example.com unknown')"))
+    print()
+
+
+def test_template_engine():
+    """测试模板引擎"""
+    print("=" * 50)
+    print("测试17: 模板引擎")
+    print("=" * 50)
+
+    from template_engine import compile_template, TemplateError
+
+    # 与原来的替换方式相同: 未提供的变量和CSS的大括号保留原样
+    subject = compile_template("数据报告 - {filename} ({index}/{total}) {unknown} body { color: red }")
+    rendered = subject.render({'filename': 'report1', 'index': 1, 'total': 3})
+    print(f"主题: {rendered}")
+    assert rendered == "数据报告 - report1 (1/3) {unknown} body { color: red }"
+
+    body = compile_template(
+        "{name|strip|title}: {amount|format:,.2f} 元{% if vip %} (VIP){% elif amount >= 1000 %} (大客户){% endif %}\n"
+        "{% for item in items %}{loop.index}. {item.name}{% if not loop.last %}; {% endif %}{% else %}无明细{% endfor %}\n"
+        "{note|default:无备注}",
+        autoescape=True
+    )
+    rendered = body.render({'name': ' alice ', 'amount': '1234.5',
+                            'items': [{'name': '<b>键盘</b>'}, {'name': '鼠标'}]})
+    print(f"正文:\n{rendered}")
+    assert rendered == "Alice: 1,234.50 元 (大客户)\n1. &lt;b&gt;键盘&lt;/b&gt;; 2. 鼠标\n无备注"
+
+    # 私有属性和方法不可访问,字段保留原样
+    internals = compile_template("{a.__class__.__mro__} {name.upper} {name.real}").render({'a': 1, 'name': 'x'})
+    print(f"内部属性: {internals}")
+    assert internals == "{a.__class__.__mro__} {name.upper} {name.real}"
+
+    for source in ("{% if a %}没有结束", "{name|unknown_filter}", "{% endfor %}"):
+        try:
+            compile_template(source)
+            assert False, f"应该报错: {source}"
+        except TemplateError as e:
+            print(f"语法错误: {e}")
+    print()
+
+
+def test_script_analyzer():
+    """测试脚本预检"""
+    print("=" * 50)
+    print("测试18: 脚本预检")
+    print("=" * 50)
+
+    from script_analyzer import ScriptAnalyzer
+
+    analyzer = ScriptAnalyzer()
+    script = """
+import pandas
+from datetime import datetime
+path = context['file']
+df = pandas.read_excel(path)
+lookup = pd.read_csv("prices.csv")
+df.to_excel("out.xlsx")
+result = f"{len(df)} 行, {datetime.now():%H:%M}"
+"""
+    report = analyzer.analyze(script)
+    print(f"导入: {report['imports']}, 读取: {report['dependencies']} + context{report['context_files']}")
+    print(f"写入: {report['file_writes']}, 随时间变化: {report['volatile']}")
+    assert report["ok"] and report["imports"] == ["pandas", "datetime"]
+    assert report["dependencies"] == ["prices.csv"] and report["context_files"] == ["file"]
+    assert not report["cacheable"] and not report["parallel_safe"]
+    assert analyzer.analyze(script) is report  # 同一脚本只分析一次
+
+    # 预检无法识别的读取方式不缓存
+    assert analyzer.analyze("df = pd.read_excel(context['file'])\nresult = len(df)")["cacheable"]
+    for source in ("result = len(os.listdir('data'))",
+                   "from pathlib import Path\nresult = Path('a.txt').read_text()",
+                   "import glob\nresult = len(glob.glob('*.xlsx'))",
+                   "df = pd.read_sql('select 1', None)",
+                   "reader = pd.read_csv\nresult = len(reader(name))",
+                   "result = getattr(pd, 'read_csv')('a.csv')"):
+        untracked = analyzer.analyze(source)
+        assert untracked["untracked"] and not untracked["cacheable"], source
+
+    # 禁止的调用不执行
+    executor = ScriptExecutor()
+    success, output = executor.execute_script("name = input('请输入: ')\nresult = name")
+    print(f"input(): {output}")
+    assert not success and "input" in output and executor.last_error_info["type"] == "forbidden"
+    success, output = executor.execute_script("import subprocess as sp\nsp.run(['ls'])")
+    print(f"subprocess: {output}")
+    assert not success
+
+    # 允许导入的模块列表
+    strict = ScriptExecutor(analyzer=ScriptAnalyzer(allowed_modules={"math"}))
+    assert strict.execute_script("import math\nresult = math.pi")[0]
+    assert not strict.execute_script("import json\nresult = json.dumps(1)")[0]
+    print()
+
+
 if __name__ == "__main__":
     print("\n" + "=" * 50)
     print("Python脚本功能测试")
@@ -187,6 +623,16 @@ if __name__ == "__main__":
     test_error_handling()
     test_templates()
     test_complex_script()
+    test_process_pool()
+    test_concurrent_output()
+    test_execution_limits()
+    test_lazy_modules()
+    test_profile_mode()
+    test_result_cache()
+    test_batch_contents()
+    test_mail_merge()
+    test_template_engine()
+    test_script_analyzer()
 
     print("=" * 50)
     print("所有测试完成!")
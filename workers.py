@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务模块
+在线程池中执行耗时操作(连接测试、验证等),通过信号把结果送回界面线程
+"""
+
+import threading
+import traceback
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+# 正在执行的任务,保持引用直到任务结束(调用方不需要自己保存Worker对象)
+_active_workers = set()
+_active_lock = threading.Lock()
+
+
+class WorkerSignals(QObject):
+    """后台任务信号(在界面线程中接收)"""
+    result = pyqtSignal(object)    # 任务返回值
+    error = pyqtSignal(str)        # 任务抛出的异常信息
+    progress = pyqtSignal(object)  # 任务报告的进度(多个值时为元组)
+    finished = pyqtSignal()        # 任务结束(未取消时,在result/error之后发出)
+    released = pyqtSignal()        # 任务结束(取消时也发出),用于在界面线程释放Worker
+
+
+class Worker(QRunnable):
+    """
+    后台任务
+
+    取消后不再发出 result/error/finished 信号。已经开始的网络操作无法中断,
+    需要支持中途停止的任务可以使用 with_cancel 接收 cancel_event 自行检查。
+    """
+
+    def __init__(self, fn, *args, with_progress: bool = False, with_cancel: bool = False, **kwargs):
+        """
+        初始化后台任务
+
+        Args:
+            fn: 要执行的函数
+            with_progress: 为True时以 progress_callback 参数传入进度回调
+            with_cancel: 为True时以 cancel_event 参数传入取消事件
+        """
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.cancel_event = threading.Event()
+        if with_progress:
+            self.kwargs["progress_callback"] = self._report_progress
+        if with_cancel:
+            self.kwargs["cancel_event"] = self.cancel_event
+
+    def run(self):
+        """在线程池中执行"""
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            if not self.cancel_event.is_set():
+                self.signals.error.emit(str(e))
+        else:
+            if not self.cancel_event.is_set():
+                self.signals.result.emit(result)
+        finally:
+            if not self.cancel_event.is_set():
+                self.signals.finished.emit()
+            self.signals.released.emit()
+
+    def _report_progress(self, *values):
+        """进度回调(在线程池中调用)"""
+        if not self.cancel_event.is_set():
+            self.signals.progress.emit(values[0] if len(values) == 1 else values)
+
+    def cancel(self):
+        """取消任务(尚未开始的任务直接从线程池移除)"""
+        self.cancel_event.set()
+        if QThreadPool.globalInstance().tryTake(self):
+            _release(self)
+
+    def is_cancelled(self) -> bool:
+        """是否已取消"""
+        return self.cancel_event.is_set()
+
+
+def _release(worker: Worker):
+    """任务结束后释放引用"""
+    with _active_lock:
+        _active_workers.discard(worker)
+
+
+def run_in_background(fn, *args, on_result=None, on_error=None, on_progress=None,
+                      on_finished=None, with_progress: bool = False,
+                      with_cancel: bool = False, **kwargs) -> Worker:
+    """
+    在全局线程池中执行函数
+
+    Args:
+        fn: 要执行的函数
+        on_result: 成功时以返回值调用
+        on_error: 出错时以异常信息调用
+        on_progress: 收到进度时调用(需要 with_progress)
+        on_finished: 任务结束时调用
+
+    Returns:
+        Worker对象,可调用 cancel() 取消
+    """
+    worker = Worker(fn, *args, with_progress=with_progress, with_cancel=with_cancel, **kwargs)
+    # 由 _active_workers 保持引用,线程池不负责删除
+    worker.setAutoDelete(False)
+    with _active_lock:
+        _active_workers.add(worker)
+    worker.signals.released.connect(lambda: _release(worker))
+    if on_result:
+        worker.signals.result.connect(on_result)
+    if on_error:
+        worker.signals.error.connect(on_error)
+    if on_progress:
+        worker.signals.progress.connect(on_progress)
+    if on_finished:
+        worker.signals.finished.connect(on_finished)
+    QThreadPool.globalInstance().start(worker)
+    return worker
+
+
+if __name__ == "__main__":
+    # 测试代码
+    print("后台任务模块加载成功")